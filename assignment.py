@@ -0,0 +1,372 @@
+import time
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components, min_weight_full_bipartite_matching
+from scipy.spatial import cKDTree
+
+logger = logging.getLogger(__name__)
+
+
+def _unit_vectors(coords):
+    lat = np.radians(coords[:, 0])
+    lon = np.radians(coords[:, 1])
+    return np.column_stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)])
+
+
+def nearest_candidates(driver_coords, pickup_coords, k, is_feasible=None, oversample=4):
+    # Candidate edges for the sparse solver: each driver's k nearest feasible
+    # pickups by great-circle distance, plus its own pickup (rank 0) so the
+    # identity assignment always keeps the graph solvable. Returns
+    # (rows, cols, rank) sorted by row then column.
+    driver_coords = np.asarray(driver_coords, dtype=float)
+    pickup_coords = np.asarray(pickup_coords, dtype=float)
+    n = len(driver_coords)
+    query = min(len(pickup_coords), k * oversample)
+    tree = cKDTree(_unit_vectors(pickup_coords))
+    _, nearest = tree.query(_unit_vectors(driver_coords), k=query)
+    nearest = nearest.reshape(n, query)
+
+    rows = np.repeat(np.arange(n), query)
+    cols = nearest.ravel()
+    keep = is_feasible(rows, cols) if is_feasible else np.ones(len(rows), dtype=bool)
+    rank = np.cumsum(keep.reshape(n, query), axis=1).ravel()
+    keep &= rank <= k
+
+    rows = np.concatenate([np.arange(n), rows[keep]])
+    cols = np.concatenate([np.arange(n), cols[keep]])
+    rank = np.concatenate([np.zeros(n, dtype=rank.dtype), rank[keep]])
+    _, first = np.unique(rows * len(pickup_coords) + cols, return_index=True)
+    return rows[first], cols[first], rank[first]
+
+
+def solve_sparse(rows, cols, costs, shape):
+    # A full matching always uses exactly one edge per row, so shifting every
+    # cost by the same constant keeps the optimum and stops zero-km edges from
+    # being read as missing entries of the sparse matrix.
+    weights = costs - costs.min() + 1.0
+    graph = csr_matrix((weights, (rows, cols)), shape=shape)
+    row_ind, col_ind = min_weight_full_bipartite_matching(graph)
+    return row_ind, col_ind
+
+
+def edge_lookup(rows, cols, n_cols, row_ind, col_ind):
+    # Position of each chosen (row_ind[i], col_ind[i]) edge in rows/cols,
+    # which nearest_candidates returns sorted by row * n_cols + col.
+    return np.searchsorted(rows * n_cols + cols, row_ind * n_cols + col_ind)
+
+
+def assignment_duals(cost, row_ind, col_ind, tol=1e-6):
+    # Potentials (u, v) with u[i] + v[j] <= cost[i, j] everywhere and equality
+    # on the given optimal assignment. v solves the difference constraints
+    # v[j] - v[col_ind[i]] <= cost[i, j] - cost[i, col_ind[i]] by Bellman-Ford
+    # from v = 0; each round only relaxes the rows whose column improved in
+    # the round before. Returns None if it does not settle, i.e. the
+    # assignment is not optimal.
+    by_row = cost[row_ind]
+    assigned = by_row[np.arange(len(row_ind)), col_ind]
+    row_of = np.empty(cost.shape[1], dtype=np.int64)
+    row_of[col_ind] = np.arange(len(row_ind))
+    v = np.zeros(cost.shape[1])
+    active = np.arange(len(row_ind))
+    for _ in range(len(row_ind) + 1):
+        if not len(active):
+            u = np.empty(cost.shape[0])
+            u[row_ind] = assigned - v[col_ind]
+            return u, v
+        relaxed = (by_row[active] - (assigned[active] - v[col_ind[active]])[:, None]).min(axis=0)
+        improved = np.flatnonzero(relaxed < v - tol)
+        v[improved] = relaxed[improved]
+        active = row_of[improved]
+    return None
+
+
+def augment_assignment(cost, u, v, col_of_row):
+    # Completes a partial assignment of a square cost matrix by one shortest
+    # augmenting path per unassigned row (Hungarian method, e-maxx form).
+    # (u, v) must be feasible potentials that are tight on the rows already
+    # assigned, which then keep their columns unless a path reroutes them.
+    # Work is O(n) per column scanned, so repairing a few rows of a warm
+    # start is far cheaper than a full solve.
+    n = cost.shape[1]
+    u = np.asarray(u, dtype=float).copy()
+    v = np.append(np.asarray(v, dtype=float), 0.0)
+    row_of_col = np.full(n + 1, -1)
+    assigned = np.flatnonzero(col_of_row >= 0)
+    row_of_col[col_of_row[assigned]] = assigned
+    free_rows = np.flatnonzero(col_of_row < 0)
+
+    for row in free_rows:
+        row_of_col[n] = row
+        minv = np.full(n, np.inf)
+        way = np.full(n, n)
+        used = np.zeros(n + 1, dtype=bool)
+        j0 = n
+        while True:
+            used[j0] = True
+            i0 = row_of_col[j0]
+            free = ~used[:n]
+            reduced = cost[i0] - u[i0] - v[:n]
+            better = free & (reduced < minv)
+            minv[better] = reduced[better]
+            way[better] = j0
+            candidates = np.where(free, minv, np.inf)
+            j1 = int(candidates.argmin())
+            delta = candidates[j1]
+            visited = np.flatnonzero(used)
+            u[row_of_col[visited]] += delta
+            v[visited] -= delta
+            minv[free] -= delta
+            j0 = j1
+            if row_of_col[j0] == -1:
+                break
+        while j0 != n:
+            j1 = way[j0]
+            row_of_col[j0] = row_of_col[j1]
+            j0 = j1
+
+    col_of_row = np.empty(n, dtype=np.int64)
+    col_of_row[row_of_col[:n]] = np.arange(n)
+    return col_of_row, u, v[:n]
+
+
+def cost_components(finite, chunk_rows=1024):
+    # Connected components of the bipartite graph whose edges are the True
+    # cells of `finite`: rows are nodes 0..n-1 and columns n..n+m-1. The
+    # edges go into a CSR graph built from row chunks, so only chunk_rows x m
+    # cells are scanned at once. Returns (row_labels, col_labels) numbered
+    # from 0; rows and columns without any edge get a component of their own.
+    n, m = finite.shape
+    counts = [np.zeros(0, dtype=np.int64)]
+    indices = [np.zeros(0, dtype=np.int64)]
+    for start in range(0, n, chunk_rows):
+        block = np.asarray(finite[start:start + chunk_rows])
+        counts.append(block.sum(axis=1, dtype=np.int64))
+        indices.append(np.nonzero(block)[1] + n)
+    indices = np.concatenate(indices)
+    indptr = np.zeros(n + m + 1, dtype=np.int64)
+    indptr[1:n + 1] = np.cumsum(np.concatenate(counts))
+    indptr[n + 1:] = indptr[n]
+    graph = csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr), shape=(n + m, n + m))
+    _, labels = connected_components(graph, directed=False)
+    return labels[:n], labels[n:]
+
+
+def assignment_blocks(row_labels, col_labels):
+    # Independent (rows, cols) subproblems. Components with as many rows as
+    # columns are solved on their own. The others cannot be matched inside
+    # themselves, so they are pooled into one block where the constraint
+    # penalty can pair them across.
+    n_labels = max(row_labels.max(initial=-1), col_labels.max(initial=-1)) + 1
+    row_counts = np.bincount(row_labels, minlength=n_labels)
+    col_counts = np.bincount(col_labels, minlength=n_labels)
+    balanced = row_counts == col_counts
+
+    row_order = np.argsort(row_labels, kind='stable')
+    col_order = np.argsort(col_labels, kind='stable')
+    rows_by_label = np.split(row_order, np.cumsum(row_counts)[:-1])
+    cols_by_label = np.split(col_order, np.cumsum(col_counts)[:-1])
+
+    blocks = [(rows_by_label[c], cols_by_label[c]) for c in np.flatnonzero(balanced & (row_counts > 0))]
+    if not balanced.all():
+        unbalanced = ~balanced
+        blocks.append((
+            np.sort(row_order[unbalanced[row_labels[row_order]]]),
+            np.sort(col_order[unbalanced[col_labels[col_order]]])
+        ))
+    return blocks
+
+
+def _solve_block(cost):
+    return linear_sum_assignment(cost)
+
+
+def solve_blocks(cost, blocks, workers=1, parallel_min_rows=200):
+    # linear_sum_assignment on every block, with blocks of at least
+    # parallel_min_rows rows spread over a process pool when there are
+    # several of them. The pool lives only for this call, so job processes
+    # are not left with idle children; the size threshold keeps its start-up
+    # cost small next to the solves. Returns the global (row_ind, col_ind)
+    # sorted by row and the number of blocks that went to the pool.
+    large = [i for i, (rows, _) in enumerate(blocks) if len(rows) >= parallel_min_rows]
+    pooled = large if workers > 1 and len(large) > 1 else []
+    solved = {}
+    if pooled:
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=min(workers, len(pooled)), mp_context=context) as pool:
+            futures = {i: pool.submit(_solve_block, cost[np.ix_(*blocks[i])]) for i in pooled}
+            solved = {i: future.result() for i, future in futures.items()}
+
+    row_ind = []
+    col_ind = []
+    for i, (rows, cols) in enumerate(blocks):
+        block_rows, block_cols = solved[i] if i in solved else _solve_block(cost[np.ix_(rows, cols)])
+        row_ind.append(rows[block_rows])
+        col_ind.append(cols[block_cols])
+    row_ind = np.concatenate(row_ind) if row_ind else np.empty(0, dtype=np.int64)
+    col_ind = np.concatenate(col_ind) if col_ind else np.empty(0, dtype=np.int64)
+    order = np.argsort(row_ind)
+    return row_ind[order], col_ind[order], len(pooled)
+
+
+def assignment_lower_bound(cost, prices, cap=None, chunk_rows=1024):
+    # Weak duality: for any column prices p, sum_i min_j (c_ij + p_j) - sum_j p_j
+    # is at most the cost of every full assignment, the optimal one included.
+    bound = -prices.sum()
+    for start in range(0, len(cost), chunk_rows):
+        block = cost[start:start + chunk_rows]
+        if cap is not None:
+            block = np.minimum(block, cap)
+        bound += (block + prices).min(axis=1).sum()
+    return bound
+
+
+def _greedy_complete(cost, col_of_row, cap=None, chunk_rows=1024):
+    # Gives every unassigned row a free column: each free row asks for its
+    # cheapest free column, the cheapest asker of each column gets it, and
+    # the rest ask again.
+    col_of_row = col_of_row.copy()
+    taken = np.zeros(cost.shape[1], dtype=bool)
+    taken[col_of_row[col_of_row >= 0]] = True
+    free_rows = np.flatnonzero(col_of_row < 0)
+    while len(free_rows):
+        free_cols = np.flatnonzero(~taken)
+        rows, cols, values = [], [], []
+        for start in range(0, len(free_rows), chunk_rows):
+            chunk = free_rows[start:start + chunk_rows]
+            block = cost[np.ix_(chunk, free_cols)]
+            if cap is not None:
+                block = np.minimum(block, cap)
+            best = block.argmin(axis=1)
+            rows.append(chunk)
+            cols.append(free_cols[best])
+            values.append(block[np.arange(len(chunk)), best])
+        rows, cols, values = np.concatenate(rows), np.concatenate(cols), np.concatenate(values)
+        order = np.lexsort((values, cols))
+        first = order[np.r_[True, cols[order][1:] != cols[order][:-1]]]
+        col_of_row[rows[first]] = cols[first]
+        taken[cols[first]] = True
+        free_rows = np.flatnonzero(col_of_row < 0)
+    return col_of_row
+
+
+def auction_assignment(cost, time_budget=None, min_epsilon=1e-3, scale=5.0, penalty=None,
+                       on_phase=None, chunk_rows=1024):
+    # Approximate min-cost assignment of a square matrix by the auction
+    # algorithm with epsilon-scaling (Bertsekas), Jacobi form: every free row
+    # bids at once, a column goes to its highest bid and its price rises by
+    # the bid. Each phase ends with a full assignment within n * epsilon of
+    # the optimum; epsilon then shrinks by `scale` and the prices carry over.
+    # Anytime: on_phase(phase, epsilon, col_of_row, cost, lower_bound) is
+    # called with every finished phase, and when time_budget seconds run out
+    # the best finished phase (or a greedy completion of the running one) is
+    # returned as (row_ind, col_ind, report).
+    #
+    # Cells at or above `penalty` are capped to a value that still makes one
+    # penalty cell cost more than any assignment of feasible cells, so prices
+    # stay in a range where epsilon is not lost to rounding.
+    started = time.perf_counter()
+    n = cost.shape[0]
+    span = 0.0
+    for start in range(0, n, chunk_rows):
+        block = cost[start:start + chunk_rows]
+        feasible = block[block < penalty] if penalty is not None else block
+        if feasible.size:
+            span = max(span, float(feasible.max()))
+    cap = (span + 1.0) * (n + 1) if penalty is not None else None
+
+    # Start from the prices of a row-then-column reduction, which are
+    # already near the final ones on geometric costs.
+    row_min = np.empty(n)
+    for start in range(0, n, chunk_rows):
+        block = cost[start:start + chunk_rows]
+        row_min[start:start + chunk_rows] = (np.minimum(block, cap) if cap is not None else block).min(axis=1)
+    prices = np.full(n, np.inf)
+    for start in range(0, n, chunk_rows):
+        block = cost[start:start + chunk_rows]
+        block = np.minimum(block, cap) if cap is not None else block
+        np.minimum(prices, (block - row_min[start:start + chunk_rows, None]).min(axis=0), out=prices)
+    prices = -prices
+    # Every row pays at least its cheapest cell, whatever the prices say.
+    floor = float(row_min.sum())
+    epsilon = max(span / 20, min_epsilon)
+    best = None
+    phase = 0
+    timed_out = False
+    col_of_row = np.full(n, -1)
+    rows_all = np.arange(n)
+    while True:
+        phase += 1
+        row_of_col = np.full(n, -1)
+        col_of_row = np.full(n, -1)
+        free = rows_all
+        while len(free):
+            if time_budget is not None and time.perf_counter() - started > time_budget:
+                timed_out = True
+                break
+            bidders, items, bids = [], [], []
+            for start in range(0, len(free), chunk_rows):
+                chunk = free[start:start + chunk_rows]
+                values = cost[chunk]
+                if cap is not None:
+                    np.minimum(values, cap, out=values)
+                values += prices
+                first = values.argmin(axis=1)
+                first_value = values[np.arange(len(chunk)), first]
+                if n > 1:
+                    values[np.arange(len(chunk)), first] = np.inf
+                    second_value = values.min(axis=1)
+                else:
+                    second_value = first_value
+                bidders.append(chunk)
+                items.append(first)
+                bids.append(prices[first] + (second_value - first_value) + epsilon)
+            bidders, items, bids = np.concatenate(bidders), np.concatenate(items), np.concatenate(bids)
+            order = np.lexsort((-bids, items))
+            winners = order[np.r_[True, items[order][1:] != items[order][:-1]]]
+            won_items = items[winners]
+            outbid = row_of_col[won_items]
+            col_of_row[outbid[outbid >= 0]] = -1
+            row_of_col[won_items] = bidders[winners]
+            col_of_row[bidders[winners]] = won_items
+            prices[won_items] = bids[winners]
+            free = np.flatnonzero(col_of_row < 0)
+        if timed_out:
+            break
+
+        total = _assignment_cost(cost, col_of_row, cap)
+        bound = max(floor, assignment_lower_bound(cost, prices, cap, chunk_rows))
+        if best is None or total < best[1]:
+            best = (col_of_row.copy(), total, bound, epsilon)
+        else:
+            best = (best[0], best[1], max(best[2], bound), best[3])
+        if on_phase:
+            on_phase(phase, epsilon, best[0], best[1], best[2])
+        if epsilon <= min_epsilon:
+            break
+        epsilon = max(epsilon / scale, min_epsilon)
+
+    if best is None:
+        # Out of time before the first phase finished.
+        col_of_row = _greedy_complete(cost, col_of_row, cap, chunk_rows)
+        bound = max(floor, assignment_lower_bound(cost, prices, cap, chunk_rows))
+        best = (col_of_row, _assignment_cost(cost, col_of_row, cap), bound, epsilon)
+    col_of_row, total, bound, epsilon = best
+    report = {
+        'phases': phase - timed_out,
+        'epsilon': epsilon,
+        'timed_out': timed_out,
+        'seconds': round(time.perf_counter() - started, 3),
+        'cost': total,
+        'lower_bound': float(bound),
+        'gap': float((total - bound) / total) if total > 0 else 0.0
+    }
+    return rows_all, col_of_row, report
+
+
+def _assignment_cost(cost, col_of_row, cap=None):
+    values = cost[np.arange(len(col_of_row)), col_of_row]
+    return float((np.minimum(values, cap) if cap is not None else values).sum())
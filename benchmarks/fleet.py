@@ -0,0 +1,98 @@
+import sys
+import argparse
+import numpy as np
+import pandas as pd
+
+from constraints import DEPOT_NAMES, MIN_DRIVER_EXP
+from data_processor import DataProcessor
+
+CITY_CENTER = (12.97, 77.59)
+CATEGORY_MIX = {'A+': 0.15, 'A': 0.35, 'B': 0.3, 'C': 0.2}
+PRESET_SIZES = [100, 1000, 5000, 20000]
+KM_PER_DEGREE = 111.32
+
+
+def _scatter(rng, centers, sigma_km):
+    # Gaussian scatter in km around each (lat, lon) center.
+    offsets = rng.normal(0, sigma_km, size=centers.shape) / KM_PER_DEGREE
+    offsets[:, 1] /= np.cos(np.radians(centers[:, 0]))
+    return centers + offsets
+
+
+# Synthetic rosters in the upload schema. Institutes sit around a city
+# center; a share of every institute's buses starts from a shared depot
+# (exact same point, as in real data), the rest park near their campus.
+# Pickups are drawn from a smaller pool of shared stops, categories follow
+# CATEGORY_MIX and some A+ drivers fall short of the experience rule, so
+# the depot and experience constraints both have work to do.
+def generate_fleet(vehicles, seed=0, institutes=None, depot_share=0.3, stops_per_vehicle=0.4,
+                   city_radius_km=20, category_mix=None):
+    rng = np.random.default_rng(seed)
+    category_mix = category_mix or CATEGORY_MIX
+    institutes = institutes or max(4, vehicles // 150)
+
+    names = list(DEPOT_NAMES) + [f'Institute {i + 1}' for i in range(max(0, institutes - len(DEPOT_NAMES)))]
+    names = names[:institutes]
+    campus = _scatter(rng, np.tile(CITY_CENTER, (institutes, 1)), city_radius_km / 2)
+    depots = _scatter(rng, campus, 1.0)
+
+    institute = rng.integers(0, institutes, vehicles)
+    from_depot = rng.random(vehicles) < depot_share
+    driver_points = _scatter(rng, campus[institute], 6.0)
+    driver_points[from_depot] = depots[institute[from_depot]]
+    driver_names = np.array([f'Home {i + 1}' for i in range(vehicles)], dtype=object)
+    driver_names[from_depot] = [
+        names[i] if names[i] in DEPOT_NAMES else f'{names[i]} Depot' for i in institute[from_depot]
+    ]
+
+    stop_count = max(1, int(vehicles * stops_per_vehicle))
+    stop_home = rng.integers(0, institutes, stop_count)
+    stops = _scatter(rng, campus[stop_home], city_radius_km / 3)
+    stop = rng.integers(0, stop_count, vehicles)
+
+    categories = list(category_mix)
+    weights = np.array([category_mix[c] for c in categories], dtype=float)
+    category = rng.choice(categories, vehicles, p=weights / weights.sum())
+    experience = rng.gamma(2.5, 3.5, vehicles)
+    senior = category == 'A+'
+    experience[senior] = np.where(
+        rng.random(senior.sum()) < 0.85,
+        MIN_DRIVER_EXP.get('A+', 0) + rng.gamma(2, 3, senior.sum()),
+        rng.uniform(0, MIN_DRIVER_EXP.get('A+', 0), senior.sum())
+    )
+
+    route = np.zeros(vehicles, dtype=np.int64)
+    for i in range(institutes):
+        members = np.flatnonzero(institute == i)
+        route[members] = np.arange(1, len(members) + 1)
+
+    df = pd.DataFrame({
+        'Vehicle Number': [f'VH{i + 1:06d}' for i in range(vehicles)],
+        'Institute': np.array(names, dtype=object)[institute],
+        'Category': category,
+        'Route Number': route,
+        'Driver Employee ID': [f'EMP{i + 1:06d}' for i in range(vehicles)],
+        'Licensed Experience (years)': np.round(experience, 1),
+        'Driver pt Latitude': np.round(driver_points[:, 0], 6),
+        'Driver pt Longitude': np.round(driver_points[:, 1], 6),
+        'Driver pt Name': driver_names,
+        '1st Pickup pt Latitude': np.round(stops[stop, 0], 6),
+        '1st Pickup pt Longitude': np.round(stops[stop, 1], 6),
+        '1st Pickup pt Name': [f'Stop {s + 1}' for s in stop]
+    })
+    return df[DataProcessor().required_columns]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a synthetic roster CSV')
+    parser.add_argument('vehicles', type=int)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--depot-share', type=float, default=0.3)
+    parser.add_argument('-o', '--output', default='-')
+    args = parser.parse_args(argv)
+    df = generate_fleet(args.vehicles, seed=args.seed, depot_share=args.depot_share)
+    df.to_csv(sys.stdout if args.output == '-' else args.output, index=False)
+
+
+if __name__ == '__main__':
+    main()
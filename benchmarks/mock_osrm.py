@@ -0,0 +1,143 @@
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+
+from geo import haversine, haversine_matrix
+
+
+# Stand-in for an OSRM server answering /route and /table with great-circle
+# distance times a detour factor. Every request waits latency (+- jitter)
+# seconds and fails with failure_rate probability, so the client's
+# concurrency and error paths can be measured without a routing server.
+class MockOSRM:
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, jitter=0.0, failure_rate=0.0,
+                 detour=1.3, max_table_size=None, seed=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.detour = detour
+        self.max_table_size = max_table_size
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.reset()
+        self.server = ThreadingHTTPServer((host, port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self):
+        with self.lock:
+            self.counts = {'route': 0, 'table': 0, 'failed': 0, 'cells': 0}
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def respond(self, path):
+        parts = urlsplit(path)
+        segments = parts.path.strip('/').split('/')
+        if len(segments) != 4 or segments[0] not in ('route', 'table'):
+            return 400, {'code': 'InvalidUrl', 'message': f'Unsupported path {parts.path}'}
+        service = segments[0]
+        try:
+            points = np.array([[float(v) for v in c.split(',')][::-1] for c in segments[3].split(';')])
+        except ValueError:
+            return 400, {'code': 'InvalidQuery', 'message': 'Bad coordinates'}
+
+        with self.lock:
+            self.counts[service] += 1
+            failed = self.random.random() < self.failure_rate
+            delay = max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+            if failed:
+                self.counts['failed'] += 1
+        if delay:
+            time.sleep(delay)
+        if failed:
+            return 503, {'code': 'TooBusy', 'message': 'Injected failure'}
+
+        if service == 'route':
+            distance = float(haversine(points[0], points[1])) * 1000 * self.detour
+            return 200, {'code': 'Ok', 'routes': [{'distance': distance, 'duration': distance / 8}]}
+
+        query = parse_qs(parts.query)
+        sources = [int(i) for i in query['sources'][0].split(';')] if 'sources' in query else list(range(len(points)))
+        destinations = (
+            [int(i) for i in query['destinations'][0].split(';')] if 'destinations' in query else list(range(len(points)))
+        )
+        if self.max_table_size and max(len(sources), len(destinations)) > self.max_table_size:
+            return 400, {'code': 'TooBig', 'message': 'Too many table coordinates'}
+        with self.lock:
+            self.counts['cells'] += len(sources) * len(destinations)
+        distances = haversine_matrix(points[sources], points[destinations]) * 1000 * self.detour
+        return 200, {'code': 'Ok', 'distances': np.round(distances, 1).tolist()}
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                status, body = mock.respond(self.path)
+                payload = json.dumps(body).encode()
+                try:
+                    self.send_response(status)
+                    self.send_header('Content-Type', 'application/json')
+                    self.send_header('Content-Length', str(len(payload)))
+                    self.end_headers()
+                    self.wfile.write(payload)
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up (read timeout) before the reply was ready.
+                    pass
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Serve a mock OSRM /route and /table API')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5001)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--max-table-size', type=int, default=None)
+    args = parser.parse_args(argv)
+    mock = MockOSRM(args.host, args.port, latency=args.latency, jitter=args.jitter,
+                    failure_rate=args.failure_rate, max_table_size=args.max_table_size)
+    print(f"Mock OSRM listening on {mock.url}")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        mock.server.server_close()
+
+
+if __name__ == '__main__':
+    main()
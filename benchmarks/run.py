@@ -0,0 +1,246 @@
+import io
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import resource
+import platform
+import subprocess
+import tracemalloc
+from datetime import datetime, timezone
+from multiprocessing import get_context
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import scipy
+
+from config import Config
+from data_processor import DataProcessor
+from osrm_service import OSRMService
+from solver import find_changed_chains, get_swap_details
+from benchmarks.fleet import generate_fleet
+from benchmarks.mock_osrm import MockOSRM
+
+STAGES = ['ingest', 'matrix', 'constraints', 'solve', 'chains', 'swap_details']
+DEFAULT_SIZES = [100, 1000, 5000]
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS.
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+# Takes the place of the job store: OSRMService reports every stage change
+# through jobs.progress(), which is where one stage is closed and the next
+# opened. Each stage records wall time, the process peak RSS when it ended
+# (and how much it raised it), OSRM calls made during it and, with
+# trace_memory, the peak of traced allocations.
+class StageClock:
+    def __init__(self, mock=None, trace_memory=False):
+        self.mock = mock
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self.current = None
+
+    def enter(self, stage):
+        self.finish()
+        self.current = stage
+        self.started = time.perf_counter()
+        self.rss_before = peak_rss_mb()
+        self.calls_before = self.mock.snapshot() if self.mock else None
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+
+    def finish(self):
+        if self.current is None:
+            return
+        stage = {'wall_s': round(time.perf_counter() - self.started, 4)}
+        stage['peak_rss_mb'] = peak_rss_mb()
+        stage['rss_growth_mb'] = round(stage['peak_rss_mb'] - self.rss_before, 1)
+        if self.trace_memory:
+            stage['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        if self.mock:
+            after = self.mock.snapshot()
+            stage['osrm_calls'] = {key: after[key] - self.calls_before[key] for key in after}
+        self.stages[self.current] = stage
+        self.current = None
+
+    def progress(self, job_id, percent, message, stage=None, details=None):
+        if stage and stage != self.current:
+            self.enter(stage)
+
+
+def benchmark_config(osrm_url, options):
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.update({
+        'OSRM_SERVER': osrm_url,
+        'DISTANCE_CACHE_PATH': None,
+        'RUN_STATE_DIR': None,
+        'METRICS_DIR': None,
+        'DISTANCE_MODE': options['distance_mode'] or config['DISTANCE_MODE'],
+        'PRUNE_MARGIN_KM': options['prune_margin']
+    })
+    if options.get('time_budget') is not None:
+        config['ASSIGNMENT_TIME_BUDGET'] = options['time_budget']
+    return config
+
+
+def run_size(vehicles, options):
+    logging.basicConfig(level=options['log_level'])
+    mock = None
+    osrm_url = options['osrm_url']
+    if not osrm_url:
+        mock = MockOSRM(
+            latency=options['latency'], jitter=options['jitter'],
+            failure_rate=options['failure_rate'], seed=options['seed']
+        ).start()
+        osrm_url = mock.url
+    config = benchmark_config(osrm_url, options)
+    payload = generate_fleet(vehicles, seed=options['seed']).to_csv(index=False).encode()
+
+    if options['trace_memory']:
+        tracemalloc.start()
+    clock = StageClock(mock, options['trace_memory'])
+    started = time.perf_counter()
+    try:
+        clock.enter('ingest')
+        roster = DataProcessor(chunk_rows=config['CSV_CHUNK_ROWS']).process_csv_file(io.BytesIO(payload))
+        service = OSRMService(config, jobs=clock)
+        service.task_id = 'benchmark'
+        driver_df, pickup_df = service.roster_frames(roster)
+
+        clock.enter('matrix')
+
+        def report(done, tiles):
+            service.report_stage('matrix', done / tiles)
+
+        if options['solver'] == 'sparse':
+            solved = service.solve_sparse(driver_df, pickup_df, progress=report)
+        else:
+            solved = service.solve_dense(driver_df, pickup_df, progress=report, solver=options['solver'])
+        optim_drivers, optim_pickups, original_km, optimized_km, solver_report = solved
+        result_df = service.result_frame(driver_df, pickup_df, optim_pickups, original_km, optimized_km)
+
+        clock.enter('chains')
+        chains = find_changed_chains(result_df['From Bus'].tolist(), result_df['To Bus'].tolist())
+        clock.enter('swap_details')
+        get_swap_details(chains, result_df, driver_df)
+        clock.finish()
+    finally:
+        if mock:
+            mock.stop()
+        if options['trace_memory']:
+            tracemalloc.stop()
+
+    return {
+        'vehicles': vehicles,
+        'solver': options['solver'],
+        'distance_mode': config['DISTANCE_MODE'],
+        'wall_s': round(time.perf_counter() - started, 4),
+        'peak_rss_mb': peak_rss_mb(),
+        'stages': clock.stages,
+        'osrm_calls': mock.snapshot() if mock else None,
+        'solver_report': solver_report,
+        'summary': {
+            'original_dead_km': round(float(np.sum(original_km)), 2),
+            'optimized_dead_km': round(float(np.sum(optimized_km)), 2),
+            'swaps': int((result_df['From Bus'] != result_df['To Bus']).sum()),
+            'chains': len(chains)
+        }
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, timeout=10,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def compare(previous, current):
+    # Best wall time per (vehicles, solver, stage) in each report, side by side.
+    def best(report):
+        times = {}
+        for run in report['runs']:
+            for stage, values in run['stages'].items():
+                key = (run['vehicles'], run['solver'], stage)
+                times[key] = min(times.get(key, np.inf), values['wall_s'])
+        return times
+
+    before, after = best(previous), best(current)
+    lines = [f"{'vehicles':>8} {'solver':<7} {'stage':<13} {previous.get('commit') or 'before':>10} {current.get('commit') or 'after':>10} {'ratio':>7}"]
+    for key in sorted(before.keys() & after.keys(), key=lambda k: (k[0], k[1], STAGES.index(k[2]))):
+        ratio = after[key] / before[key] if before[key] else np.inf
+        lines.append(f"{key[0]:>8} {key[1]:<7} {key[2]:<13} {before[key]:>10.4f} {after[key]:>10.4f} {ratio:>7.2f}")
+    if len(lines) == 1:
+        lines.append('No fleet size and solver in common with the earlier report')
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Time the optimization pipeline on synthetic rosters')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='Fleet sizes to run (20000 needs --solver sparse or a lot of memory)')
+    parser.add_argument('--solver', choices=['dense', 'sparse', 'auction'], default='dense')
+    parser.add_argument('--time-budget', type=float, default=None, help='ASSIGNMENT_TIME_BUDGET for auction runs')
+    parser.add_argument('--distance-mode', choices=['osrm', 'estimate'], default=None)
+    parser.add_argument('--prune-margin', type=float, default=None, help='PRUNE_MARGIN_KM for dense runs')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per size, each in a fresh process')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--osrm-url', default=None, help='Use this server instead of the built-in mock')
+    parser.add_argument('--latency', type=float, default=0.0, help='Mock OSRM seconds per request')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='Also record traced allocation peaks per stage (slows every stage down)')
+    parser.add_argument('--compare', default=None, help='Earlier JSON report to compare stage times with')
+    parser.add_argument('-o', '--output', default='-')
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    options = vars(args).copy()
+    options['log_level'] = logging.INFO if args.verbose else logging.WARNING
+    logging.basicConfig(level=options['log_level'])
+    report = {
+        'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'commit': git_revision(),
+        'host': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'scipy': scipy.__version__
+        },
+        'options': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'verbose')},
+        'runs': []
+    }
+    for vehicles in args.sizes:
+        for repeat in range(args.repeat):
+            # A fresh process per run keeps peak RSS and module-level caches per run.
+            with ProcessPoolExecutor(max_workers=1, mp_context=get_context('spawn')) as pool:
+                run = pool.submit(run_size, vehicles, options).result()
+            run['repeat'] = repeat
+            report['runs'].append(run)
+            print(f"{vehicles} vehicles ({args.solver}) run {repeat + 1}: {run['wall_s']:.2f}s, "
+                  f"peak {run['peak_rss_mb']} MB", file=sys.stderr)
+
+    output = json.dumps(report, indent=2, default=lambda value: value.item() if hasattr(value, 'item') else str(value))
+    if args.output == '-':
+        print(output)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    if args.compare:
+        with open(args.compare) as f:
+            print('\n'.join(compare(json.load(f), report)), file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
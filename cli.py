@@ -0,0 +1,210 @@
+import os
+import sys
+import glob
+import time
+import logging
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import pandas as pd
+
+from config import Config
+from exports import EXPORT_FORMATS, EXPORT_TABLES, ExportUnavailable, export_table, export_chunks
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_COLUMNS = [
+    'file', 'status', 'error', 'seconds', 'total_routes', 'original_dead_km', 'total_dead_km',
+    'total_minimized', 'total_swaps', 'inter_institute', 'intra_institute', 'chain_count',
+    'longest_chain', 'distance_cells_real', 'distance_cells_estimated', 'distance_cells_missing',
+    'assignments_file', 'swap_details_file'
+]
+
+
+def find_rosters(patterns):
+    # Files, directories (their *.csv) and glob patterns, in the order given, without repeats.
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '*.csv')))
+        elif os.path.isfile(pattern):
+            matches = [pattern]
+        else:
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if not matches:
+                raise ValueError(f'No roster files match {pattern}')
+        for path in matches:
+            path = os.path.abspath(path)
+            if os.path.isfile(path) and path not in paths:
+                paths.append(path)
+    return paths
+
+
+def output_names(paths):
+    # Rosters from different directories may share a file name.
+    names = {}
+    used = set()
+    for path in paths:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        name, n = stem, 2
+        while name in used:
+            name, n = f'{stem}_{n}', n + 1
+        used.add(name)
+        names[path] = name
+    return names
+
+
+def batch_config(args):
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.update({
+        'RUN_STATE_DIR': None,
+        'METRICS_DIR': None,
+        # The pool already keeps every CPU busy with whole rosters.
+        'ASSIGNMENT_WORKERS': 1 if args.workers > 1 else config['ASSIGNMENT_WORKERS']
+    })
+    if args.osrm_url:
+        config['OSRM_SERVER'] = args.osrm_url
+    if args.distance_cache is not None:
+        config['DISTANCE_CACHE_PATH'] = args.distance_cache or None
+    if args.max_chain_length is not None:
+        config['MAX_CHAIN_LENGTH'] = args.max_chain_length
+    return config
+
+
+def write_table(result, table, fmt, path, chunk_rows):
+    df = export_table(result, table)
+    with open(path, 'wb') as f:
+        for chunk in export_chunks(df, fmt, table, chunk_rows):
+            f.write(chunk)
+    return len(df)
+
+
+def run_roster(path, name, config, options):
+    # One roster from file to output files, in a pool process. The distance
+    # cache is a SQLite file, so every process shares what the others fetched.
+    from data_processor import DataProcessor
+    from osrm_service import OSRMService
+
+    logging.basicConfig(level=options['log_level'], format=f'%(asctime)s {name} %(levelname)s %(name)s: %(message)s')
+    started = time.perf_counter()
+    row = {'file': path, 'status': 'failed'}
+    try:
+        with open(path, 'rb') as f:
+            df = DataProcessor(chunk_rows=config['CSV_CHUNK_ROWS']).process_csv_file(f)
+        result = OSRMService(config).optimize_routes_vrp(
+            df, solver=options['solver'], distance_mode=options['distance_mode'], time_budget=options['time_budget']
+        )
+        extension = EXPORT_FORMATS[options['format']][1]
+        for table, column in (('results', 'assignments_file'), ('swap_details', 'swap_details_file')):
+            out = os.path.join(options['output_dir'], f'{name}_{EXPORT_TABLES[table][0]}.{extension}')
+            write_table(result, table, options['format'], out, config['EXPORT_CHUNK_ROWS'])
+            row[column] = out
+        row.update(result['summary'])
+        cells = result['distance_cells']
+        row.update({f'distance_cells_{kind}': cells.get(kind) for kind in ('real', 'estimated', 'missing')})
+        row['status'] = 'done'
+    except ValueError as e:
+        # Roster validation errors; the summary carries the message.
+        row['error'] = str(e)
+    except Exception as e:
+        logger.exception(f"Roster {path} failed")
+        row['error'] = str(e)
+    row['seconds'] = round(time.perf_counter() - started, 2)
+    return row
+
+
+def run_batch(paths, config, options, workers=1, report=None):
+    names = output_names(paths)
+    rows = {}
+    if workers <= 1:
+        for path in paths:
+            rows[path] = run_roster(path, names[path], config, options)
+            if report:
+                report(rows[path], len(rows), len(paths))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            futures = {pool.submit(run_roster, path, names[path], config, options): path for path in paths}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    rows[path] = future.result()
+                except Exception as e:
+                    # The worker process itself died (e.g. out of memory).
+                    rows[path] = {'file': path, 'status': 'failed', 'error': str(e) or type(e).__name__}
+                if report:
+                    report(rows[path], len(rows), len(paths))
+    summary = pd.DataFrame([rows[path] for path in paths])
+    return summary.reindex(columns=SUMMARY_COLUMNS)
+
+
+def print_progress(row, done, total):
+    if row['status'] == 'done':
+        detail = f"{row['total_dead_km']} dead km, {row['total_swaps']} swaps"
+    else:
+        detail = f"failed: {row.get('error')}"
+    print(f"[{done}/{total}] {os.path.basename(row['file'])}: {detail} ({row.get('seconds')}s)", file=sys.stderr)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Optimize many driver rosters without the web app and write assignments, '
+                    'swap details and a combined summary'
+    )
+    parser.add_argument('rosters', nargs='+', help='roster CSV files, directories of them or glob patterns')
+    parser.add_argument('-o', '--output-dir', default='batch_output')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help='rosters optimized at once, one process each')
+    parser.add_argument('--format', choices=sorted(EXPORT_FORMATS), default='csv')
+    parser.add_argument('--solver', choices=['dense', 'sparse', 'auction'], default=None)
+    parser.add_argument('--distance-mode', choices=['osrm', 'estimate'], default=None)
+    parser.add_argument('--time-budget', type=float, default=None, help='seconds for the auction solver')
+    parser.add_argument('--max-chain-length', type=int, default=None)
+    parser.add_argument('--osrm-url', default=None, help='defaults to OSRM_SERVER')
+    parser.add_argument('--distance-cache', default=None,
+                        help='SQLite distance cache shared by all workers (defaults to DISTANCE_CACHE_PATH; empty disables it)')
+    parser.add_argument('--log-level', default='WARNING')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    try:
+        paths = find_rosters(args.rosters)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return 2
+    if not paths:
+        print('No roster files found', file=sys.stderr)
+        return 2
+    if args.format != 'csv':
+        # Fail before any roster is optimized if the writer is not installed.
+        try:
+            for _ in export_chunks(pd.DataFrame(), args.format, 'results'):
+                pass
+        except ExportUnavailable as e:
+            print(e, file=sys.stderr)
+            return 2
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    workers = max(1, min(args.workers, len(paths)))
+    options = {
+        'solver': args.solver, 'distance_mode': args.distance_mode, 'time_budget': args.time_budget,
+        'format': args.format, 'output_dir': os.path.abspath(args.output_dir), 'log_level': args.log_level
+    }
+    print(f"Optimizing {len(paths)} rosters in {workers} processes", file=sys.stderr)
+    summary = run_batch(paths, batch_config(args), options, workers, report=print_progress)
+
+    summary_path = os.path.join(args.output_dir, 'summary.csv')
+    summary.to_csv(summary_path, index=False)
+    failed = int((summary['status'] != 'done').sum())
+    done = summary[summary['status'] == 'done']
+    print(
+        f"{len(done)} of {len(summary)} rosters optimized, {round(done['total_minimized'].sum(), 2)} km minimized; "
+        f"summary written to {summary_path}", file=sys.stderr
+    )
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,7 +2,56 @@ import os
 
 class Config:
     SECRET_KEY=os.environ.get("SESSION_SECRET", "shanaia-dev-key-Baghirathi!@#$!#^@%^%#$&")
-    MAX_CONTENT_LENGTH = 16 * 1024 * 1024  
+    MAX_CONTENT_LENGTH = int(os.environ.get('MAX_UPLOAD_MB', 512)) * 1024 * 1024
+    CSV_CHUNK_ROWS = int(os.environ.get('CSV_CHUNK_ROWS', 50000))
     UPLOAD_FOLDER = 'uploads'
     OSRM_SERVER = os.environ.get('OSRM_SERVER', 'http://localhost:5000')
+    JOB_DB_PATH = os.environ.get('JOB_DB_PATH', 'cache/jobs.sqlite3')
+    JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+    JOB_TTL = int(os.environ.get('JOB_TTL', 24 * 3600))
+    JOB_STALE_AFTER = int(os.environ.get('JOB_STALE_AFTER', 2 * 3600))
+    DATASET_DIR = os.environ.get('DATASET_DIR', 'cache/datasets')
+    DATASET_TTL = int(os.environ.get('DATASET_TTL', 24 * 3600))
+    METRICS_DIR = os.environ.get('METRICS_DIR', 'cache/metrics')
+    METRICS_TTL = int(os.environ.get('METRICS_TTL', 7 * 24 * 3600))
+    EXPORT_CHUNK_ROWS = int(os.environ.get('EXPORT_CHUNK_ROWS', 10000))
+    RESULT_PAGE_SIZE = int(os.environ.get('RESULT_PAGE_SIZE', 1000))
+    RESPONSE_COMPRESS_MIN_BYTES = int(os.environ.get('RESPONSE_COMPRESS_MIN_BYTES', 1024))
+    PROGRESS_STREAM_INTERVAL = float(os.environ.get('PROGRESS_STREAM_INTERVAL', 0.25))
+    OSRM_MAX_WORKERS = int(os.environ.get('OSRM_MAX_WORKERS', 8))
+    OSRM_CONNECT_TIMEOUT = float(os.environ.get('OSRM_CONNECT_TIMEOUT', 5))
+    OSRM_READ_TIMEOUT = float(os.environ.get('OSRM_READ_TIMEOUT', 30))
+    OSRM_MAX_TABLE_SIZE = int(os.environ.get('OSRM_MAX_TABLE_SIZE', 100))
+    OSRM_RUN_DEADLINE = float(os.environ.get('OSRM_RUN_DEADLINE', 900))
+    OSRM_RETRIES = int(os.environ.get('OSRM_RETRIES', 2))
+    OSRM_RETRY_BACKOFF = float(os.environ.get('OSRM_RETRY_BACKOFF', 0.5))
+    OSRM_RETRY_MAX_BACKOFF = float(os.environ.get('OSRM_RETRY_MAX_BACKOFF', 8))
+    OSRM_BREAKER_THRESHOLD = int(os.environ.get('OSRM_BREAKER_THRESHOLD', 5))
+    OSRM_BREAKER_RESET = float(os.environ.get('OSRM_BREAKER_RESET', 30))
+    OSRM_FALLBACK = os.environ.get('OSRM_FALLBACK', 'estimate')
+    ASSIGNMENT_SOLVER = os.environ.get('ASSIGNMENT_SOLVER', 'dense')
+    SPARSE_CANDIDATES = int(os.environ.get('SPARSE_CANDIDATES', 20))
+    SPARSE_VERIFY = os.environ.get('SPARSE_VERIFY', '0') == '1'
+    ASSIGNMENT_TIME_BUDGET = float(os.environ.get('ASSIGNMENT_TIME_BUDGET', 60))
+    AUCTION_EPSILON = float(os.environ.get('AUCTION_EPSILON', 0.001))
+    MAX_CHAIN_LENGTH = int(os.environ['MAX_CHAIN_LENGTH']) if os.environ.get('MAX_CHAIN_LENGTH') else None
+    RUN_STATE_DIR = os.environ.get('RUN_STATE_DIR', 'cache/runs')
+    RUN_STATE_TTL = int(os.environ.get('RUN_STATE_TTL', 7 * 24 * 3600))
+    RUN_STATE_KEEP = int(os.environ.get('RUN_STATE_KEEP', 4))
+    ASSIGNMENT_WORKERS = int(os.environ.get('ASSIGNMENT_WORKERS', max(1, (os.cpu_count() or 1) // JOB_WORKERS)))
+    COMPONENT_PARALLEL_MIN_ROWS = int(os.environ.get('COMPONENT_PARALLEL_MIN_ROWS', 2000))
+    SCENARIO_WORKERS = int(os.environ.get('SCENARIO_WORKERS', max(1, (os.cpu_count() or 1) // JOB_WORKERS)))
+    SCENARIO_MAX = int(os.environ.get('SCENARIO_MAX', 20))
+    MATRIX_SPILL_CELLS = int(os.environ.get('MATRIX_SPILL_CELLS', 64_000_000))
+    MATRIX_SPILL_DIR = os.environ.get('MATRIX_SPILL_DIR', 'cache/matrices')
+    INCREMENTAL_MAX_CHANGED = float(os.environ.get('INCREMENTAL_MAX_CHANGED', 0.25))
+    COORD_SNAP_METERS = float(os.environ.get('COORD_SNAP_METERS', 5))
+    DISTANCE_MODE = os.environ.get('DISTANCE_MODE', 'osrm')
+    DETOUR_FACTOR = float(os.environ['DETOUR_FACTOR']) if os.environ.get('DETOUR_FACTOR') else None
+    PRUNE_MARGIN_KM = float(os.environ['PRUNE_MARGIN_KM']) if os.environ.get('PRUNE_MARGIN_KM') else None
+    HISTORY_DB_URL = os.environ.get('HISTORY_DB_URL', 'sqlite:///cache/history.sqlite3')
+    HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 50))
+    DISTANCE_CACHE_PATH = os.environ.get('DISTANCE_CACHE_PATH', 'cache/distances.sqlite3')
+    DISTANCE_CACHE_MAX_ENTRIES = int(os.environ.get('DISTANCE_CACHE_MAX_ENTRIES', 5_000_000))
+    DISTANCE_CACHE_TTL = int(os.environ.get('DISTANCE_CACHE_TTL', 7 * 24 * 3600))
 
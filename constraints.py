@@ -0,0 +1,126 @@
+import logging
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEPOT_NAMES = ['MAHE', 'Kannamangla village Edify World School']
+SHARED_DEPOTS = {'MAHE': ['MAHE'], 'Amara Jyothi Public School': ['Amar Jyothi Public School & Pre-University College']}
+MIN_DRIVER_EXP = {'A+': 10, 'A': 0, 'B': 0, 'C': 0}
+CONSTRAINT_VAL = 10000000000
+
+MASK_CACHE_SIZE = 4
+_mask_cache = OrderedDict()
+_rules_cache = OrderedDict()
+
+
+def allowed_institutes(driver_df, depot_names=None, shared_depots=None):
+    depot_names = DEPOT_NAMES if depot_names is None else depot_names
+    shared_depots = SHARED_DEPOTS if shared_depots is None else shared_depots
+    is_depot = driver_df['dname'].isin(depot_names)
+    allowed = [
+        shared_depots.get(name, [site]) if depot else []
+        for name, site, depot in zip(driver_df['dname'], driver_df['cname'], is_depot)
+    ]
+    return is_depot, pd.Series(allowed, index=driver_df.index, dtype=object)
+
+
+def _roster_key(driver_df, pickup_df, is_depot, allowed, rules):
+    driver_hash = pd.util.hash_pandas_object(pd.DataFrame({
+        'bus': driver_df.index.astype(str),
+        'dexp': driver_df['dexp'].astype(str),
+        'is_depot': is_depot.to_numpy(),
+        'allowed': allowed.astype(str).to_numpy()
+    }), index=False).to_numpy()
+    pickup_hash = pd.util.hash_pandas_object(
+        pickup_df[['cname', 'category']].astype(str), index=False
+    ).to_numpy()
+    return (driver_hash.tobytes(), pickup_hash.tobytes(), repr(rules))
+
+
+def _rule_codes(driver_df, pickup_df, is_depot, allowed, min_driver_exp):
+    institutes, pickup_institute = np.unique(pickup_df['cname'].astype(str).to_numpy(), return_inverse=True)
+    pairs = allowed.reset_index(drop=True)[is_depot.to_numpy()].explode().dropna()
+    rows = pairs.index.to_numpy()
+    codes = pd.Index(institutes).get_indexer(pairs.astype(str))
+    allowed_codes = np.zeros((len(driver_df), len(institutes)), dtype=bool)
+    allowed_codes[rows[codes >= 0], codes[codes >= 0]] = True
+    allowed_codes[~is_depot.to_numpy()] = True
+
+    categories, pickup_category = np.unique(pickup_df['category'].astype(str).to_numpy(), return_inverse=True)
+    required = np.array([float(min_driver_exp.get(c, 0)) for c in categories])
+    # A blank experience (NaN) is not held against the driver: it passes
+    # every threshold, as the per-pair check always did.
+    dexp = pd.to_numeric(driver_df['dexp'], errors='coerce').to_numpy(dtype=float)
+    experienced = (dexp[:, None] >= required[None, :]) | np.isnan(dexp)[:, None]
+    return allowed_codes, pickup_institute, experienced, pickup_category
+
+
+def _driver_rules(driver_df, depot_names, shared_depots):
+    if 'is_depot' in driver_df.columns and 'allowed_institutes' in driver_df.columns:
+        return driver_df['is_depot'].astype(bool), driver_df['allowed_institutes']
+    return allowed_institutes(driver_df, depot_names, shared_depots)
+
+
+def _remember(cache, key, value):
+    cache[key] = value
+    while len(cache) > MASK_CACHE_SIZE:
+        cache.popitem(last=False)
+    return value
+
+
+def _compiled_rules(driver_df, pickup_df, depot_names, shared_depots, min_driver_exp):
+    # _rule_codes under the roster key, so the mask, the row blocks and the
+    # sparse pairs of a run (and of its re-runs) compile the rules once.
+    min_driver_exp = MIN_DRIVER_EXP if min_driver_exp is None else min_driver_exp
+    is_depot, allowed = _driver_rules(driver_df, depot_names, shared_depots)
+    key = _roster_key(driver_df, pickup_df, is_depot, allowed, sorted(min_driver_exp.items()))
+    if key in _rules_cache:
+        _rules_cache.move_to_end(key)
+        return key, _rules_cache[key]
+    codes = _rule_codes(driver_df, pickup_df, is_depot, allowed, min_driver_exp)
+    for array in codes:
+        array.flags.writeable = False
+    return key, _remember(_rules_cache, key, codes)
+
+
+def feasibility_mask(driver_df, pickup_df, depot_names=None, shared_depots=None, min_driver_exp=None):
+    # Boolean drivers x pickups array, True where the driver may take the
+    # pickup. Depot drivers are restricted to their allowed institutes and
+    # every driver must meet the pickup category's experience threshold.
+    key, (allowed_codes, pickup_institute, experienced, pickup_category) = _compiled_rules(
+        driver_df, pickup_df, depot_names, shared_depots, min_driver_exp
+    )
+    if key in _mask_cache:
+        _mask_cache.move_to_end(key)
+        return _mask_cache[key]
+
+    mask = allowed_codes[:, pickup_institute]
+    mask &= experienced[:, pickup_category]
+
+    mask.flags.writeable = False
+    _remember(_mask_cache, key, mask)
+    logger.debug(f"Compiled feasibility mask: {mask.sum()} of {mask.size} pairs feasible")
+    return mask
+
+
+def feasibility_blocks(driver_df, pickup_df, block_rows=1024, depot_names=None, shared_depots=None, min_driver_exp=None):
+    # feasibility_mask a block of rows at a time, as (start, mask) pairs, for
+    # callers that fill an N x N array in place and never need the whole mask.
+    _, (allowed_codes, pickup_institute, experienced, pickup_category) = _compiled_rules(
+        driver_df, pickup_df, depot_names, shared_depots, min_driver_exp
+    )
+    for start in range(0, len(driver_df), block_rows):
+        mask = allowed_codes[start:start + block_rows][:, pickup_institute]
+        mask &= experienced[start:start + block_rows][:, pickup_category]
+        yield start, mask
+
+
+def feasible_pairs(driver_df, pickup_df, rows, cols, depot_names=None, shared_depots=None, min_driver_exp=None):
+    # Same rules as feasibility_mask, evaluated only on the (rows[i], cols[i])
+    # driver/pickup positions so sparse callers never build the N x N mask.
+    _, (allowed_codes, pickup_institute, experienced, pickup_category) = _compiled_rules(
+        driver_df, pickup_df, depot_names, shared_depots, min_driver_exp
+    )
+    return allowed_codes[rows, pickup_institute[cols]] & experienced[rows, pickup_category[cols]]
@@ -1,12 +1,28 @@
 import pandas as pd
+import numpy as np
 import io
+import re
 import logging
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Iterable
 
 logger = logging.getLogger(__name__)
 
+class NonNumericValues(ValueError):
+    pass
+
 class DataProcessor:
-    def __init__(self):
+    coordinate_bounds = {
+        'Driver pt Latitude': 90,
+        'Driver pt Longitude': 180,
+        '1st Pickup pt Latitude': 90,
+        '1st Pickup pt Longitude': 180
+    }
+    numeric_columns = ['Licensed Experience (years)']
+    stripped_columns = ['Vehicle Number', 'Institute', 'Category', 'Driver Employee ID']
+
+    def __init__(self, chunk_rows: int = 50000, max_issue_rows: int = 10):
+        self.chunk_rows = chunk_rows
+        self.max_issue_rows = max_issue_rows
         self.required_columns = [
             'Vehicle Number',
             'Institute',
@@ -34,49 +50,117 @@ class DataProcessor:
 
         return True
 
+    @staticmethod
+    def normalize_column(name) -> str:
+        return re.sub(r'[^\x00-\x7F]+', '', str(name).strip())
+
     def validate_coordinates(self, df: pd.DataFrame) -> Dict[str, Any]:
-        issues = []
+        issues = {}
+        self.coerce_chunk(df, issues)
+        return {
+            'valid': len(issues) == 0,
+            'issues': self.format_issues(issues)
+        }
 
-        coordinate_columns = [
-            'Driver pt Latitude',
-            'Driver pt Longitude',
-            '1st Pickup pt Latitude',
-            '1st Pickup pt Longitude'
+    def coerce_chunk(self, chunk: pd.DataFrame, issues: Dict[str, List]) -> pd.DataFrame:
+        # One vectorized pass per column: text is stripped, coordinates are
+        # parsed and range-checked, and each problem keeps a count plus the
+        # first few row numbers instead of every failing row.
+        chunk = chunk.dropna(how='all').copy()
+        rows = chunk.index.to_numpy()
+
+        for col in self.stripped_columns:
+            if col in chunk.columns:
+                chunk[col] = chunk[col].where(chunk[col].isna(), chunk[col].astype(str).str.strip())
+
+        for col in self.numeric_columns:
+            if col in chunk.columns:
+                chunk[col] = pd.to_numeric(chunk[col], errors='coerce')
+
+        for col, bound in self.coordinate_bounds.items():
+            if col not in chunk.columns:
+                continue
+            values = pd.to_numeric(chunk[col], errors='coerce').to_numpy(dtype=float)
+            kind = 'latitude' if 'latitude' in col.lower() else 'longitude'
+            for message, bad in (
+                (f"Non-numeric values in {col}", np.isnan(values)),
+                (f"Invalid {kind} values in {col}", np.abs(values) > bound)
+            ):
+                if bad.any():
+                    entry = issues.setdefault(message, [0, []])
+                    entry[0] += int(bad.sum())
+                    room = self.max_issue_rows - len(entry[1])
+                    if room > 0:
+                        entry[1].extend(rows[bad][:room].tolist())
+            chunk[col] = values
+        return chunk
+
+    def format_issues(self, issues: Dict[str, List]) -> List[str]:
+        return [
+            f"{message}: {count} rows (first: {samples})" if count > len(samples) else f"{message}: rows {samples}"
+            for message, (count, samples) in issues.items()
         ]
 
-        for col in coordinate_columns:
-            if col in df.columns:
-                non_numeric = df[~pd.to_numeric(df[col], errors='coerce').notna()]
-                if not non_numeric.empty:
-                    issues.append(f"Non-numeric values in {col}: rows {non_numeric.index.tolist()}")
-
-                numeric_values = pd.to_numeric(df[col], errors='coerce')
-                if 'latitude' in col.lower():
-                    out_of_range = numeric_values[(numeric_values < -90) | (numeric_values > 90)]
-                    if not out_of_range.empty:
-                        issues.append(f"Invalid latitude values in {col}: rows {out_of_range.index.tolist()}")
-                elif 'longitude' in col.lower():
-                    out_of_range = numeric_values[(numeric_values < -180) | (numeric_values > 180)]
-                    if not out_of_range.empty:
-                        issues.append(f"Invalid longitude values in {col}: rows {out_of_range.index.tolist()}")
+    def read_chunks(self, source, typed: bool = True, **read_options) -> Iterable[pd.DataFrame]:
+        # Only the required columns are parsed, with explicit dtypes so chunks
+        # never disagree on inference: coordinates and experience go straight
+        # to float64 in the C parser and everything else stays a string.
+        header = pd.read_csv(source, nrows=0, **read_options).columns
+        source.seek(0)
+        names = {name: self.normalize_column(name) for name in header}
+        numeric = set(self.coordinate_bounds) | set(self.numeric_columns)
+        usecols = [name for name, normalized in names.items() if normalized in self.required_columns]
+        dtype = {name: 'float64' if typed and names[name] in numeric else str for name in usecols}
 
-        return {
-            'valid': len(issues) == 0,
-            'issues': issues
-        }
-    def process_csv_file(self, file) -> pd.DataFrame:
+        reader = pd.read_csv(source, usecols=usecols, dtype=dtype, chunksize=self.chunk_rows, **read_options)
+        while True:
+            try:
+                chunk = next(reader)
+            except StopIteration:
+                return
+            except ValueError as e:
+                raise NonNumericValues(str(e)) from e
+            chunk.columns = [names[c] for c in chunk.columns]
+            yield chunk
+
+    def read_csv(self, source, **read_options) -> pd.DataFrame:
         try:
-            df = pd.read_csv(file)
-            
-            if not self.validate_columns(df):
+            return self.load_chunks(self.read_chunks(source, **read_options))
+        except NonNumericValues:
+            # Text in a numeric column: re-read those columns as strings so
+            # the validation report can point at the offending rows.
+            source.seek(0)
+            return self.load_chunks(self.read_chunks(source, typed=False, **read_options))
+
+    def load_chunks(self, chunks: Iterable[pd.DataFrame]) -> pd.DataFrame:
+        # Each chunk is validated on arrival and kept only as its typed
+        # columns; once the roster is known to be invalid, later chunks are
+        # checked for the report and dropped. The columns are joined one at a
+        # time, releasing their chunks as they go, so at most one column is
+        # ever held twice.
+        issues = {}
+        columns = {}
+        for chunk in chunks:
+            if not columns and not self.validate_columns(chunk):
                 raise ValueError(f"Missing required columns. Expected: {self.required_columns}")
-            
-            validation_result = self.validate_coordinates(df)
-            if not validation_result['valid']:
-                raise ValueError(f"Data validation failed: {'; '.join(validation_result['issues'])}")
-            
-            df = self.clean_data(df)
-            
+            chunk = self.coerce_chunk(chunk[self.required_columns], issues)
+            for col in self.required_columns:
+                parts = columns.setdefault(col, [])
+                if not issues:
+                    # A copy of the column alone, so the chunk's blocks are freed.
+                    parts.append(chunk[col].copy())
+
+        if issues:
+            raise ValueError(f"Data validation failed: {'; '.join(self.format_issues(issues))}")
+        if not columns:
+            raise ValueError("No data provided")
+        return pd.DataFrame(
+            {col: pd.concat(columns.pop(col), ignore_index=True) for col in self.required_columns}, copy=False
+        )
+
+    def process_csv_file(self, file) -> pd.DataFrame:
+        try:
+            df = self.read_csv(file)
             logger.info(f"Successfully processed CSV file with {len(df)} rows")
             return df
             
@@ -91,22 +175,17 @@ class DataProcessor:
                 raise ValueError("No data provided")
     
             delimiter = self.detect_delimiter(content)
-            df = pd.read_csv(io.StringIO(content), delimiter=delimiter)
-            
-            if not self.validate_columns(df):
-                raise ValueError(f"Missing required columns. Expected: {self.required_columns}")
-            
-            validation_result = self.validate_coordinates(df)
-            if not validation_result['valid']:
-                raise ValueError(f"Data validation failed: {'; '.join(validation_result['issues'])}")
-            
-            df = self.clean_data(df)
+            df = self.read_csv(io.StringIO(content), delimiter=delimiter)
             logger.info(f"Successfully processed pasted data with {len(df)} rows")
             return df
             
         except Exception as e:
             logger.error(f"Error processing pasted data: {str(e)}")
             raise
+
+    def process_dataframe(self, df: pd.DataFrame) -> pd.DataFrame:
+        df = df.rename(columns=self.normalize_column)
+        return self.load_chunks([df])
     
     def detect_delimiter(self, content: str) -> str:
         
@@ -123,27 +202,6 @@ class DataProcessor:
         logger.debug(f"Detected delimiter: '{delimiter}'")
         return delimiter
     
-    def clean_data(self, df: pd.DataFrame) -> pd.DataFrame:
-        df =df.dropna(how='all')
-        string_columns = ['Vehicle Number', 'Institute','Category','Driver Employee ID']
-        for col in string_columns:
-            if col in df.columns:
-                df[col] = df[col].astype(str).str.strip()
-        
-        coordinate_columns = [
-            'Driver pt Latitude',
-            'Driver pt Longitude',
-            '1st Pickup pt Latitude',
-            '1st Pickup pt Longitude'
-        ]
-        for col in coordinate_columns:
-            if col in df.columns:
-                df[col] = pd.to_numeric(df[col], errors='coerce')
-        df=df.dropna(subset=coordinate_columns)
-        df=df.reset_index(drop=True)
-        
-        return df
-    
     def get_preview_data(self, df: pd.DataFrame, num_rows: int = 5) -> Dict[str, Any]:
         preview_df = df.head(num_rows)
         
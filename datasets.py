@@ -0,0 +1,117 @@
+import os
+import re
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+# Uploaded rosters are kept server-side as one .npz of column arrays per
+# dataset, so /calculate only needs the dataset id. Numeric columns keep
+# their dtype, text columns become fixed-width unicode arrays plus a null
+# mask, which lets np.load run with allow_pickle=False.
+class DatasetStore:
+    def __init__(self, directory, ttl=24 * 3600):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, dataset_id):
+        if not _ID_PATTERN.match(str(dataset_id)):
+            raise ValueError(f"Invalid dataset id: {dataset_id!r}")
+        return os.path.join(self.directory, f"{dataset_id}.npz")
+
+    def put(self, dataset_id, df):
+        arrays = {'columns': np.array([str(c) for c in df.columns])}
+        for i, column in enumerate(df.columns):
+            values = df[column]
+            if pd.api.types.is_numeric_dtype(values) or pd.api.types.is_bool_dtype(values):
+                arrays[f'c{i}'] = values.to_numpy()
+            else:
+                nulls = values.isna().to_numpy()
+                arrays[f'c{i}'] = np.where(nulls, '', values.astype(str)).astype(str)
+                if nulls.any():
+                    arrays[f'n{i}'] = nulls
+
+        path = self._path(dataset_id)
+        partial = f"{path[:-4]}.{os.getpid()}.tmp.npz"
+        np.savez(partial, **arrays)
+        os.replace(partial, path)
+        # A matrix imported for an earlier roster under this id no longer matches.
+        try:
+            os.remove(self._matrix_path(dataset_id))
+        except FileNotFoundError:
+            pass
+        self.evict()
+        return dataset_id
+
+    def get(self, dataset_id):
+        path = self._path(dataset_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with np.load(path, allow_pickle=False) as arrays:
+                data = {}
+                for i, column in enumerate(arrays['columns'].tolist()):
+                    values = arrays[f'c{i}']
+                    if values.dtype.kind == 'U':
+                        values = values.astype(object)
+                        if f'n{i}' in arrays:
+                            values[arrays[f'n{i}']] = None
+                    data[column] = values
+        except FileNotFoundError:
+            return None
+        return pd.DataFrame(data)
+
+    def _matrix_path(self, dataset_id):
+        return f"{self._path(dataset_id)[:-4]}.matrix.npy"
+
+    def put_matrix(self, dataset_id, matrix):
+        # An imported distance matrix, roster-ordered, next to its dataset.
+        path = self._matrix_path(dataset_id)
+        partial = f"{path[:-4]}.{os.getpid()}.tmp.npy"
+        stored = np.lib.format.open_memmap(partial, mode='w+', dtype=matrix.dtype, shape=matrix.shape)
+        for start in range(0, len(matrix), 1024):
+            stored[start:start + 1024] = matrix[start:start + 1024]
+        stored.flush()
+        del stored
+        os.replace(partial, path)
+
+    def get_matrix(self, dataset_id):
+        # Memory-mapped read-only; the solve copies what it changes.
+        path = self._matrix_path(dataset_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            return np.load(path, mmap_mode='r', allow_pickle=False)
+        except FileNotFoundError:
+            return None
+
+    def has_matrix(self, dataset_id):
+        return self.exists(dataset_id) and os.path.exists(self._matrix_path(dataset_id))
+
+    def exists(self, dataset_id):
+        if not _ID_PATTERN.match(str(dataset_id)):
+            return False
+        path = self._path(dataset_id)
+        return os.path.exists(path) and time.time() - os.path.getmtime(path) <= self.ttl
+
+    def delete(self, dataset_id):
+        for path in (self._path(dataset_id), self._matrix_path(dataset_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def evict(self):
+        cutoff = time.time() - self.ttl
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.name.endswith(('.npz', '.npy')) and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except FileNotFoundError:
+                continue
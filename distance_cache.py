@@ -0,0 +1,183 @@
+import os
+import sqlite3
+import time
+import logging
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+NO_ROUTE = -1.0
+
+
+# Distances are keyed by (origin, destination) coordinates rounded to
+# `precision` decimals; pairs with no route are kept as km = NO_ROUTE. WAL
+# mode lets every gunicorn worker read while one of them writes.
+class DistanceCache:
+    def __init__(self, path, max_entries=5_000_000, ttl=7 * 24 * 3600, precision=5, touch_after=3600):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.touch_after = touch_after
+        self.scale = 10 ** precision
+        self.hits = 0
+        self.misses = 0
+        self._conn = None
+        self._pid = None
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS distances (
+                    olat INTEGER, olon INTEGER, dlat INTEGER, dlon INTEGER,
+                    km REAL NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL,
+                    PRIMARY KEY (olat, olon, dlat, dlon)
+                ) WITHOUT ROWID
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS distances_accessed ON distances (accessed)")
+            conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _connect(self):
+        # sqlite connections must not cross a fork, so each process opens its own.
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._pid = os.getpid()
+        return self._conn
+
+    def _keys(self, coords):
+        return np.round(np.asarray(coords, dtype=float) * self.scale).astype(np.int64)
+
+    def get_many(self, origins, destinations, out=None):
+        origins = self._keys(origins)
+        destinations = self._keys(destinations)
+        if out is None:
+            matrix = np.full((len(origins), len(destinations)), np.nan)
+        else:
+            matrix = out
+            matrix.fill(np.nan)
+        if not len(origins) or not len(destinations):
+            return matrix
+
+        conn = self._connect()
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_o (lat INTEGER, lon INTEGER)")
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS lookup_d (lat INTEGER, lon INTEGER)")
+        now = time.time()
+        cutoff = now - self.ttl
+        conn.execute("BEGIN")
+        try:
+            conn.execute("DELETE FROM lookup_o")
+            conn.execute("DELETE FROM lookup_d")
+            conn.executemany("INSERT INTO lookup_o VALUES (?, ?)", set(map(tuple, origins.tolist())))
+            conn.executemany("INSERT INTO lookup_d VALUES (?, ?)", set(map(tuple, destinations.tolist())))
+            rows = conn.execute("""
+                SELECT c.olat, c.olon, c.dlat, c.dlon, c.km
+                FROM lookup_o o
+                JOIN lookup_d d
+                JOIN distances c ON c.olat = o.lat AND c.olon = o.lon AND c.dlat = d.lat AND c.dlon = d.lon
+                WHERE c.created >= ?
+            """, (cutoff,)).fetchall()
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if rows:
+            # A read transaction that turns into a write fails at once, without
+            # waiting, when another process wrote meanwhile; take the write
+            # lock up front so concurrent job and batch processes just queue.
+            # Eviction only needs a coarse LRU order, so a hit is touched at
+            # most once per touch_after seconds, in one statement over the
+            # lookup tables that still hold this request's keys.
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("""
+                    UPDATE distances SET accessed = ?
+                    FROM lookup_o o, lookup_d d
+                    WHERE distances.olat = o.lat AND distances.olon = o.lon
+                    AND distances.dlat = d.lat AND distances.dlon = d.lon
+                    AND distances.created >= ? AND distances.accessed < ?
+                """, (now, cutoff, now - self.touch_after))
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+        if rows:
+            found = pd.DataFrame(rows, columns=['olat', 'olon', 'dlat', 'dlon', 'km'])
+            o = pd.DataFrame(origins, columns=['olat', 'olon']).reset_index().rename(columns={'index': 'i'})
+            d = pd.DataFrame(destinations, columns=['dlat', 'dlon']).reset_index().rename(columns={'index': 'j'})
+            found = found.merge(o, on=['olat', 'olon']).merge(d, on=['dlat', 'dlon'])
+            km = found['km'].to_numpy()
+            matrix[found['i'].to_numpy(), found['j'].to_numpy()] = np.where(km == NO_ROUTE, np.inf, km)
+
+        hits = int(np.count_nonzero(~np.isnan(matrix)))
+        self._record(hits, matrix.size - hits)
+        return matrix
+
+    def put_many(self, origins, destinations, matrix, cells=None):
+        # cells limits the write to the pairs that were fetched, so cached
+        # pairs in the same block keep their original created time.
+        origins = self._keys(origins)
+        destinations = self._keys(destinations)
+        found = ~np.isnan(matrix)
+        rows, cols = np.nonzero(found if cells is None else found & cells)
+        if not len(rows):
+            return
+        now = time.time()
+        records = np.column_stack([origins[rows], destinations[cols]]).tolist()
+        values = matrix[rows, cols]
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO distances VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(*key, km, now, now) for key, km in zip(records, np.where(np.isinf(values), NO_ROUTE, values).tolist())]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.evict()
+
+    def evict(self):
+        conn = self._connect()
+        conn.execute("DELETE FROM distances WHERE created < ?", (time.time() - self.ttl,))
+        count = conn.execute("SELECT COUNT(*) FROM distances").fetchone()[0]
+        if count > self.max_entries:
+            conn.execute("""
+                DELETE FROM distances WHERE (olat, olon, dlat, dlon) IN (
+                    SELECT olat, olon, dlat, dlon FROM distances ORDER BY accessed LIMIT ?
+                )
+            """, (count - self.max_entries,))
+            logger.info(f"Evicted {count - self.max_entries} least recently used distance cache entries")
+
+    def _record(self, hits, misses):
+        self.hits += hits
+        self.misses += misses
+        self._connect().executemany(
+            "INSERT INTO stats VALUES (?, ?) ON CONFLICT(name) DO UPDATE SET value = value + excluded.value",
+            [('hits', hits), ('misses', misses)]
+        )
+
+    def sample(self, limit=5000):
+        rows = self._connect().execute(
+            "SELECT olat, olon, dlat, dlon, km FROM distances WHERE created >= ? AND km >= 0 ORDER BY RANDOM() LIMIT ?",
+            (time.time() - self.ttl, limit)
+        ).fetchall()
+        values = np.array(rows, dtype=float).reshape(-1, 5)
+        return values[:, 0:2] / self.scale, values[:, 2:4] / self.scale, values[:, 4]
+
+    def stats(self):
+        totals = dict(self._connect().execute("SELECT name, value FROM stats").fetchall())
+        return {
+            'entries': self._connect().execute("SELECT COUNT(*) FROM distances").fetchone()[0],
+            'hits': totals.get('hits', 0),
+            'misses': totals.get('misses', 0),
+            'run_hits': self.hits,
+            'run_misses': self.misses
+        }
+
+    def clear(self):
+        self._connect().execute("DELETE FROM distances")
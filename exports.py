@@ -0,0 +1,136 @@
+import zlib
+import tempfile
+from responses import table_frame
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'xlsx': ('application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 'xlsx'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet')
+}
+EXPORT_TABLES = {
+    'results': ('optimized_assignments', 'Optimized Assignments'),
+    'swap_details': ('swap_details', 'Swap Details'),
+    'scenarios': ('scenario_comparison', 'Scenario Comparison')
+}
+RESULT_COLUMNS = [
+    'From Bus', 'Driver Site', 'Driver pt lat', 'Driver pt long',
+    'Driver pt name', 'Driver Route', 'Driver Experience',
+    'To Bus', 'Pickup Site', 'Pickup Category', 'Pickup Route',
+    'Pickup pt name', 'Pickup pt lat', 'Pickup pt long',
+    'Original dead km', 'Optimized dead km'
+]
+FILE_CHUNK_BYTES = 64 * 1024
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+def export_table(result, table):
+    if table == 'scenarios':
+        return table_frame(result.get('scenarios') or [])
+    if table == 'results':
+        df = table_frame(result.get('results') or [])
+        return df[[col for col in RESULT_COLUMNS if col in df.columns]]
+    # Swap details are stored as positional rows whose first row is the header.
+    rows = table_frame(result.get('swap_details') or [])
+    if rows.empty:
+        return rows
+    df = rows.iloc[1:].reset_index(drop=True)
+    df.columns = rows.iloc[0].astype(str).tolist()
+    return df
+
+
+def csv_chunks(df, chunk_rows=10000):
+    yield df.iloc[:0].to_csv(index=False).encode('utf-8')
+    for start in range(0, len(df), chunk_rows):
+        yield df.iloc[start:start + chunk_rows].to_csv(index=False, header=False).encode('utf-8')
+
+
+def _unique_columns(columns):
+    names = []
+    for i, name in enumerate(columns, 1):
+        name = str(name).strip() or f'Column {i}'
+        names.append(name if name not in names else f'{name} ({i})')
+    return names
+
+
+def _file_chunks(f):
+    try:
+        f.seek(0)
+        while True:
+            chunk = f.read(FILE_CHUNK_BYTES)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        f.close()
+
+
+def xlsx_chunks(df, sheet_name, chunk_rows=10000):
+    # constant_memory makes xlsxwriter flush every finished row to disk, so
+    # only the workbook file, never the sheet, is held; it is then streamed.
+    try:
+        import xlsxwriter
+    except ImportError:
+        raise ExportUnavailable('XLSX export needs the xlsxwriter package')
+    f = tempfile.TemporaryFile()
+    try:
+        workbook = xlsxwriter.Workbook(f, {'constant_memory': True, 'nan_inf_to_errors': True})
+        sheet = workbook.add_worksheet(sheet_name)
+        sheet.write_row(0, 0, [str(c) for c in df.columns])
+        row = 1
+        for start in range(0, len(df), chunk_rows):
+            chunk = df.iloc[start:start + chunk_rows]
+            for values in chunk.astype(object).where(chunk.notna(), None).itertuples(index=False):
+                sheet.write_row(row, 0, values)
+                row += 1
+        workbook.close()
+    except Exception:
+        f.close()
+        raise
+    return _file_chunks(f)
+
+
+def parquet_chunks(df, chunk_rows=10000):
+    # One row group per chunk; mixed-type columns (swap details) become text.
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ExportUnavailable('Parquet export needs the pyarrow package')
+    df = df.copy()
+    df.columns = _unique_columns(df.columns)
+    for col in df.columns:
+        if df[col].dtype == object:
+            df[col] = df[col].map(lambda value: None if value is None or value != value else str(value))
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    f = tempfile.TemporaryFile()
+    try:
+        with pq.ParquetWriter(f, schema) as writer:
+            for start in range(0, len(df), chunk_rows):
+                chunk = df.iloc[start:start + chunk_rows]
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    except Exception:
+        f.close()
+        raise
+    return _file_chunks(f)
+
+
+def gzip_chunks(chunks, level=6):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_chunks(df, fmt, table, chunk_rows=10000, compress=False):
+    if fmt == 'csv':
+        chunks = csv_chunks(df, chunk_rows)
+    elif fmt == 'xlsx':
+        chunks = xlsx_chunks(df, EXPORT_TABLES[table][1], chunk_rows)
+    else:
+        chunks = parquet_chunks(df, chunk_rows)
+    return gzip_chunks(chunks) if compress else chunks
@@ -0,0 +1,59 @@
+import numpy as np
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine(origins, destinations):
+    # Great-circle km between matching rows of two (n, 2) lat/lon arrays, or
+    # between every pair when the inputs broadcast to (n, 1, 2) x (1, m, 2).
+    origins = np.radians(np.asarray(origins, dtype=float))
+    destinations = np.radians(np.asarray(destinations, dtype=float))
+    dlat = destinations[..., 0] - origins[..., 0]
+    dlon = destinations[..., 1] - origins[..., 1]
+    h = np.sin(dlat / 2) ** 2 + np.cos(origins[..., 0]) * np.cos(destinations[..., 0]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(h, 0, 1)))
+
+
+def haversine_matrix(sources, destinations):
+    sources = np.asarray(sources, dtype=float)
+    destinations = np.asarray(destinations, dtype=float)
+    return haversine(sources[:, None, :], destinations[None, :, :])
+
+
+def within_bound(sources, destinations, limits, block=1024):
+    # True where the great-circle lower bound from sources[i] to
+    # destinations[j] does not exceed limits[i]. Built in row blocks so the
+    # float bound matrix never exists in full.
+    keep = np.empty((len(sources), len(destinations)), dtype=bool)
+    for r in range(0, len(sources), block):
+        keep[r:r + block] = haversine_matrix(sources[r:r + block], destinations) <= limits[r:r + block, None]
+    return keep
+
+
+def detour_factor(origins, destinations, road_km, default=1.3):
+    # Median road / great-circle ratio over known pairs; pairs too short for a
+    # stable ratio are ignored.
+    crow_km = haversine(origins, destinations)
+    usable = (crow_km > 0.5) & np.isfinite(road_km)
+    if usable.sum() < 100:
+        return default
+    return float(np.median(road_km[usable] / crow_km[usable]))
+
+
+def intern_points(coords, tolerance_m=0.0):
+    # Maps (n, 2) lat/lon points to unique point ids. With a tolerance, points
+    # are snapped to a grid of roughly that many metres first, so buses
+    # parked at the same depot collapse to one point. Returns the
+    # representative coordinates (first point of each group) and the id of
+    # every input point.
+    coords = np.asarray(coords, dtype=float).reshape(-1, 2)
+    if tolerance_m > 0:
+        step = tolerance_m / 111320.0
+        keys = np.column_stack([
+            np.floor(coords[:, 0] / step),
+            np.floor(coords[:, 1] * np.cos(np.radians(coords[:, 0])) / step)
+        ])
+    else:
+        keys = coords
+    _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    return coords[first], inverse.reshape(-1)
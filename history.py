@@ -0,0 +1,280 @@
+import io
+import os
+import logging
+import threading
+from datetime import datetime, timezone
+import pandas as pd
+from responses import dumps, loads, column_table, table_frame
+
+try:
+    import sqlalchemy as sa
+except ImportError:
+    sa = None
+
+logger = logging.getLogger(__name__)
+
+# Result table column -> history_assignments column.
+ASSIGNMENT_COLUMNS = {
+    'From Bus': 'from_bus',
+    'Driver Site': 'driver_site',
+    'Category': 'driver_category',
+    'Driver pt lat': 'driver_lat',
+    'Driver pt long': 'driver_lon',
+    'Driver pt name': 'driver_point',
+    'Driver Route': 'driver_route',
+    'Driver Experience': 'driver_experience',
+    'To Bus': 'to_bus',
+    'Pickup Site': 'pickup_site',
+    'Pickup Category': 'pickup_category',
+    'Pickup Route': 'pickup_route',
+    'Pickup pt name': 'pickup_point',
+    'Pickup pt lat': 'pickup_lat',
+    'Pickup pt long': 'pickup_lon',
+    'Original dead km': 'original_km',
+    'Optimized dead km': 'optimized_km'
+}
+TEXT_COLUMNS = ['from_bus', 'driver_site', 'driver_category', 'driver_point', 'driver_route', 'to_bus', 'pickup_site',
+                'pickup_category', 'pickup_route', 'pickup_point']
+SUMMARY_FIELDS = ['total_routes', 'original_dead_km', 'total_dead_km', 'total_minimized', 'total_swaps',
+                  'inter_institute', 'intra_institute', 'chain_count', 'longest_chain']
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class HistoryUnavailable(Exception):
+    pass
+
+
+def _tables(metadata):
+    runs = sa.Table(
+        'history_runs', metadata,
+        sa.Column('run_id', sa.String(64), primary_key=True),
+        sa.Column('created', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('dataset_id', sa.String(64)),
+        sa.Column('solver', sa.String(32)),
+        sa.Column('distance_mode', sa.String(16)),
+        sa.Column('total_routes', sa.Integer),
+        sa.Column('original_dead_km', sa.Float),
+        sa.Column('total_dead_km', sa.Float),
+        sa.Column('total_minimized', sa.Float),
+        sa.Column('total_swaps', sa.Integer),
+        sa.Column('inter_institute', sa.Integer),
+        sa.Column('intra_institute', sa.Integer),
+        sa.Column('chain_count', sa.Integer),
+        sa.Column('longest_chain', sa.Integer),
+        sa.Column('summary', sa.JSON),
+        sa.Column('solver_report', sa.JSON),
+        sa.Column('distance_cells', sa.JSON),
+        sa.Column('swap_details', sa.JSON),
+        sa.Index('history_runs_created', 'created')
+    )
+    assignments = sa.Table(
+        'history_assignments', metadata,
+        sa.Column('run_id', sa.String(64), sa.ForeignKey('history_runs.run_id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('row_index', sa.Integer, primary_key=True, autoincrement=False),
+        *[sa.Column(name, sa.Text) for name in TEXT_COLUMNS],
+        *[sa.Column(name, sa.Float) for name in
+          ('driver_lat', 'driver_lon', 'driver_experience', 'pickup_lat', 'pickup_lon', 'original_km', 'optimized_km')],
+        sa.Index('history_assignments_driver_site', 'driver_site', 'run_id'),
+        sa.Index('history_assignments_pickup_site', 'pickup_site', 'run_id'),
+        sa.Index('history_assignments_from_bus', 'from_bus', 'run_id'),
+        sa.Index('history_assignments_to_bus', 'to_bus', 'run_id')
+    )
+    chains = sa.Table(
+        'history_chains', metadata,
+        sa.Column('run_id', sa.String(64), sa.ForeignKey('history_runs.run_id', ondelete='CASCADE'), primary_key=True),
+        sa.Column('chain', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('position', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('bus', sa.Text, nullable=False),
+        sa.Index('history_chains_bus', 'bus', 'run_id')
+    )
+    return runs, assignments, chains
+
+
+def _sqlite_pragmas(dbapi_connection, _):
+    # Job workers write while web workers read, as with the job store.
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+def history_store(url, chunk_rows=10000):
+    # One engine (and connection pool) per database and process.
+    with _stores_lock:
+        if url not in _stores:
+            _stores[url] = RunHistory(url, chunk_rows)
+        return _stores[url]
+
+
+# Finished optimization runs kept in SQLite or PostgreSQL through SQLAlchemy
+# Core: one history_runs row with the summary, the assignment rows and the
+# swap chains (one row per bus in each chain). History is served from these
+# tables alone, without OSRM or the solver.
+class RunHistory:
+    def __init__(self, url, chunk_rows=10000):
+        if sa is None:
+            raise HistoryUnavailable('Run history needs the sqlalchemy package')
+        self.chunk_rows = chunk_rows
+        url = sa.engine.make_url(url)
+        if url.get_backend_name() == 'sqlite' and url.database and url.database != ':memory:':
+            directory = os.path.dirname(url.database)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        self.engine = sa.create_engine(url, pool_pre_ping=True)
+        if self.engine.dialect.name == 'sqlite':
+            sa.event.listen(self.engine, 'connect', _sqlite_pragmas)
+        self.metadata = sa.MetaData()
+        self.runs, self.assignments, self.chains = _tables(self.metadata)
+        self.metadata.create_all(self.engine)
+
+    def assignment_frame(self, result):
+        df = table_frame(result.get('results') or []).rename(columns=ASSIGNMENT_COLUMNS)
+        df = df.reindex(columns=list(ASSIGNMENT_COLUMNS.values()))
+        for column in TEXT_COLUMNS:
+            df[column] = df[column].astype(object).where(df[column].notna(), None).map(
+                lambda value: None if value is None else str(value)
+            )
+        df.insert(0, 'row_index', range(len(df)))
+        return df
+
+    def _bulk_insert(self, conn, table, df):
+        # PostgreSQL gets COPY; other databases an executemany per chunk.
+        if conn.dialect.name == 'postgresql':
+            cursor = conn.connection.cursor()
+            columns = ', '.join(f'"{name}"' for name in df.columns)
+            for start in range(0, len(df), self.chunk_rows):
+                buffer = io.StringIO()
+                df.iloc[start:start + self.chunk_rows].to_csv(buffer, index=False, header=False)
+                buffer.seek(0)
+                cursor.copy_expert(f'COPY {table.name} ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+            cursor.close()
+            return
+        for start in range(0, len(df), self.chunk_rows):
+            chunk = df.iloc[start:start + self.chunk_rows]
+            records = chunk.astype(object).where(chunk.notna(), None).to_dict('records')
+            conn.execute(table.insert(), records)
+
+    def save(self, run_id, result, dataset_id=None, solver=None, distance_mode=None, created=None):
+        # The JSON columns get plain Python values, not the numpy ones a fresh result holds.
+        stored = loads(dumps({key: result.get(key) for key in ('summary', 'solver', 'distance_cells', 'swap_details')}))
+        summary = stored['summary'] or {}
+        assignments = self.assignment_frame(result)
+        chains = pd.DataFrame(
+            [(i, position, str(bus)) for i, chain in enumerate(result.get('chains') or [])
+             for position, bus in enumerate(chain)],
+            columns=['chain', 'position', 'bus']
+        )
+        chains.insert(0, 'run_id', run_id)
+        assignments.insert(0, 'run_id', run_id)
+        with self.engine.begin() as conn:
+            # A run id that is saved again (a rerun job) replaces the earlier plan.
+            for table in (self.chains, self.assignments, self.runs):
+                conn.execute(table.delete().where(table.c.run_id == run_id))
+            conn.execute(self.runs.insert(), {
+                'run_id': run_id,
+                'created': created or datetime.now(timezone.utc),
+                'dataset_id': dataset_id,
+                'solver': solver,
+                'distance_mode': distance_mode,
+                **{field: summary.get(field) for field in SUMMARY_FIELDS},
+                'summary': summary,
+                'solver_report': stored['solver'],
+                'distance_cells': stored['distance_cells'],
+                'swap_details': stored['swap_details']
+            })
+            self._bulk_insert(conn, self.assignments, assignments)
+            self._bulk_insert(conn, self.chains, chains)
+        logger.info(f"Saved run {run_id} to history: {len(assignments)} assignments, {chains['chain'].nunique()} chains")
+
+    def _run_filter(self, since=None, until=None, institute=None, vehicle=None):
+        runs, assignments = self.runs, self.assignments
+        conditions = []
+        if since is not None:
+            conditions.append(runs.c.created >= since)
+        if until is not None:
+            conditions.append(runs.c.created < until)
+        if institute:
+            conditions.append(runs.c.run_id.in_(
+                sa.select(assignments.c.run_id).where(assignments.c.driver_site == institute).union(
+                    sa.select(assignments.c.run_id).where(assignments.c.pickup_site == institute))
+            ))
+        if vehicle:
+            conditions.append(runs.c.run_id.in_(
+                sa.select(assignments.c.run_id).where(assignments.c.from_bus == vehicle).union(
+                    sa.select(assignments.c.run_id).where(assignments.c.to_bus == vehicle))
+            ))
+        return conditions
+
+    def list_runs(self, offset=0, limit=50, **filters):
+        # Newest first; returns (runs, total matching).
+        runs = self.runs
+        conditions = self._run_filter(**filters)
+        columns = [runs.c.run_id, runs.c.created, runs.c.dataset_id, runs.c.solver, runs.c.distance_mode,
+                   *[runs.c[field] for field in SUMMARY_FIELDS]]
+        query = (sa.select(*columns).where(*conditions)
+                 .order_by(runs.c.created.desc(), runs.c.run_id).offset(offset).limit(limit))
+        with self.engine.connect() as conn:
+            total = conn.execute(sa.select(sa.func.count()).select_from(runs).where(*conditions)).scalar_one()
+            rows = [self._run_row(row._asdict()) for row in conn.execute(query)]
+        return rows, total
+
+    @staticmethod
+    def _run_row(row):
+        if row.get('created') is not None:
+            created = row['created']
+            if created.tzinfo is None:
+                # SQLite hands back naive datetimes; they were stored as UTC.
+                created = created.replace(tzinfo=timezone.utc)
+            row['created'] = created.isoformat()
+        return row
+
+    def get_run(self, run_id):
+        with self.engine.connect() as conn:
+            row = conn.execute(sa.select(self.runs).where(self.runs.c.run_id == run_id)).first()
+        return None if row is None else self._run_row(row._asdict())
+
+    def assignment_page(self, run_id, offset=0, limit=1000, institute=None, vehicle=None):
+        # Rows in result order as a DataFrame with the result table's column
+        # names, plus the number of rows that match.
+        table = self.assignments
+        conditions = [table.c.run_id == run_id]
+        if institute:
+            conditions.append(sa.or_(table.c.driver_site == institute, table.c.pickup_site == institute))
+        if vehicle:
+            conditions.append(sa.or_(table.c.from_bus == vehicle, table.c.to_bus == vehicle))
+        columns = [table.c[name] for name in ASSIGNMENT_COLUMNS.values()]
+        query = sa.select(*columns).where(*conditions).order_by(table.c.row_index).offset(offset).limit(limit)
+        with self.engine.connect() as conn:
+            total = conn.execute(sa.select(sa.func.count()).select_from(table).where(*conditions)).scalar_one()
+            rows = conn.execute(query).all()
+        df = pd.DataFrame(rows, columns=list(ASSIGNMENT_COLUMNS))
+        return df, total
+
+    def chain_page(self, run_id, offset=0, limit=100):
+        # Chains are numbered from 0, so a page is a range of chain numbers.
+        table = self.chains
+        query = (sa.select(table.c.chain, table.c.bus)
+                 .where(table.c.run_id == run_id, table.c.chain >= offset, table.c.chain < offset + limit)
+                 .order_by(table.c.chain, table.c.position))
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).all()
+        chains = {}
+        for chain, bus in rows:
+            chains.setdefault(chain, []).append(bus)
+        return [chains[chain] for chain in sorted(chains)]
+
+    def result(self, run_id):
+        # A stored run in the shape of a job result, for exports.
+        run = self.get_run(run_id)
+        if run is None:
+            return None
+        df, _ = self.assignment_page(run_id, 0, None)
+        return {
+            'summary': run['summary'],
+            'results': column_table(df),
+            'swap_details': run['swap_details'],
+            'chains': self.chain_page(run_id, 0, run['chain_count'] or 0)
+        }
@@ -0,0 +1,231 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from responses import dumps
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+def to_json(obj):
+    return dumps(obj).decode('utf-8')
+
+
+# Job status, progress and results live in SQLite so that every gunicorn
+# worker sees the same state no matter which process runs the job.
+class JobStore:
+    _swept = set()
+
+    def __init__(self, path, ttl=24 * 3600, min_interval=0.5, stale_after=None):
+        self.path = path
+        self.ttl = ttl
+        self.min_interval = min_interval
+        self._last_progress = {}
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._connect().execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                percent INTEGER NOT NULL DEFAULT 0,
+                message TEXT NOT NULL DEFAULT '',
+                stage TEXT,
+                details TEXT,
+                cancel INTEGER NOT NULL DEFAULT 0,
+                created REAL NOT NULL,
+                updated REAL NOT NULL,
+                error TEXT,
+                result TEXT
+            )
+        """)
+        # Once per process: jobs of a worker that died mid-run would
+        # otherwise show as running (or queued) until they expire.
+        if stale_after and path not in JobStore._swept:
+            JobStore._swept.add(path)
+            self.fail_stale(stale_after)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def fail_stale(self, stale_after):
+        now = time.time()
+        stale = self._connect().execute(
+            "UPDATE jobs SET status = ?, message = ?, error = ?, updated = ? WHERE status IN (?, ?) AND updated < ?",
+            (FAILED, 'Optimization failed.', 'The worker running this job stopped before it finished.', now,
+             RUNNING, QUEUED, now - stale_after)
+        ).rowcount
+        if stale:
+            logger.warning(f"Marked {stale} stale job(s) as failed")
+        return stale
+
+    def create(self, job_id):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("DELETE FROM jobs WHERE updated < ?", (now - self.ttl,))
+        conn.execute(
+            "INSERT OR REPLACE INTO jobs (id, status, message, created, updated) VALUES (?, ?, ?, ?, ?)",
+            (job_id, QUEUED, 'Queued...', now, now)
+        )
+
+    def _update(self, job_id, **fields):
+        fields['updated'] = time.time()
+        columns = ', '.join(f"{name} = ?" for name in fields)
+        self._connect().execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def start(self, job_id):
+        self._update(job_id, status=RUNNING, message='Starting...')
+
+    def progress(self, job_id, percent, message, stage=None, details=None):
+        # Throttled: a write happens on a stage change, or on a percent or
+        # message change at most every min_interval seconds.
+        now = time.time()
+        last_time, last_percent, last_stage, last_message = self._last_progress.get(job_id, (0, None, None, None))
+        if stage == last_stage and ((int(percent) == last_percent and message == last_message)
+                                    or now - last_time < self.min_interval):
+            return
+        if self.cancelled(job_id):
+            raise JobCancelled(job_id)
+        self._last_progress[job_id] = (now, int(percent), stage, message)
+        self._update(
+            job_id, percent=int(percent), message=message, stage=stage,
+            details=to_json(details) if details else None
+        )
+
+    def finish(self, job_id, result):
+        self._last_progress.pop(job_id, None)
+        self._update(
+            job_id, status=DONE, percent=100, message='Optimization complete.', stage='done', result=to_json(result)
+        )
+
+    def fail(self, job_id, error):
+        self._last_progress.pop(job_id, None)
+        self._update(job_id, status=FAILED, message='Optimization failed.', error=error)
+
+    def cancel(self, job_id):
+        # Running jobs stop at their next progress report; queued ones never start.
+        job = self.get(job_id)
+        if job is None or job['status'] in FINISHED:
+            return job
+        self._last_progress.pop(job_id, None)
+        self._update(job_id, cancel=1)
+        if job['status'] == QUEUED:
+            self.mark_cancelled(job_id)
+        return self.get(job_id)
+
+    def mark_cancelled(self, job_id):
+        self._last_progress.pop(job_id, None)
+        self._update(job_id, status=CANCELLED, message='Cancelled.')
+
+    def cancelled(self, job_id):
+        row = self._connect().execute("SELECT cancel FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row and row['cancel'])
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            "SELECT id, status, percent, message, stage, details, error, created, updated FROM jobs WHERE id = ?",
+            (job_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job['details'] = json.loads(job['details']) if job['details'] else {}
+        return job
+
+    def result(self, job_id):
+        row = self._connect().execute("SELECT result FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row['result'] if row else None
+
+
+def save_history(job_id, dataset_id, result, solver, distance_mode, config):
+    # The job store forgets results after JOB_TTL; history keeps the plan.
+    # A history database that is down must not fail a finished job.
+    from history import history_store
+
+    try:
+        history_store(config['HISTORY_DB_URL'], config['EXPORT_CHUNK_ROWS']).save(
+            job_id, result, dataset_id=dataset_id, solver=solver, distance_mode=distance_mode
+        )
+    except Exception:
+        logger.exception(f"Could not save job {job_id} to the run history")
+
+
+def run_job(job_id, dataset_id, options, config):
+    from osrm_service import OSRMService
+    from datasets import DatasetStore
+    from metrics import REGISTRY
+
+    store = JobStore(config['JOB_DB_PATH'], ttl=config['JOB_TTL'])
+    if store.cancelled(job_id):
+        return
+    store.start(job_id)
+    solver = 'scenarios' if options.get('scenarios') else options.get('solver') or config['ASSIGNMENT_SOLVER']
+    outcome = DONE
+    try:
+        datasets = DatasetStore(config['DATASET_DIR'], ttl=config['DATASET_TTL'])
+        df = datasets.get(dataset_id)
+        if df is None:
+            raise ValueError('Dataset not found or expired. Please upload the data again.')
+        if options.get('matrix'):
+            matrix = datasets.get_matrix(dataset_id)
+            if matrix is None:
+                raise ValueError('The imported distance matrix has expired. Please upload it again.')
+            options = {**options, 'matrix': matrix}
+        service = OSRMService(config, jobs=store)
+        if options.get('scenarios'):
+            result = service.compare_scenarios(df, task_id=job_id, **options)
+        else:
+            result = service.optimize_routes_vrp(df, task_id=job_id, **options)
+        store.finish(job_id, result)
+        if config.get('HISTORY_DB_URL') and not options.get('scenarios'):
+            save_history(job_id, dataset_id, result, solver, service.distance_mode, config)
+    except JobCancelled:
+        outcome = CANCELLED
+        store.mark_cancelled(job_id)
+        logger.info(f"Job {job_id} cancelled")
+    except Exception as e:
+        outcome = FAILED
+        logger.exception(f"Job {job_id} failed")
+        store.fail(job_id, str(e))
+    finally:
+        REGISTRY.configure(config['METRICS_DIR'], config['METRICS_TTL'])
+        REGISTRY.inc('vrp_optimizations_total', solver=solver, outcome=outcome)
+        REGISTRY.flush()
+
+
+_executor = None
+
+
+def submit(job_id, dataset_id, options, config):
+    # The process pool is the local stand-in for a broker: each web worker
+    # owns one, and the shared JobStore is the only state they exchange.
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=config['JOB_WORKERS'], mp_context=multiprocessing.get_context('spawn')
+        )
+    return _executor.submit(run_job, job_id, dataset_id, options, config)
@@ -0,0 +1,70 @@
+import os
+import tempfile
+import numpy as np
+
+DISTANCE_DTYPE = np.float32
+ROW_BLOCK = 1024
+
+
+def allocate_matrix(shape, fill=np.inf, spill_cells=None, spill_dir=None, dtype=DISTANCE_DTYPE):
+    # Distance matrices are float32: road kilometres need nowhere near
+    # float64 precision, and half the size is what lets a 20k fleet fit in a
+    # job worker. From spill_cells cells on the array is a memmap over an
+    # unlinked temporary file rather than heap memory, so the kernel can
+    # write it out under memory pressure instead of failing the job.
+    if spill_cells and shape[0] * shape[1] >= spill_cells:
+        if spill_dir:
+            os.makedirs(spill_dir, exist_ok=True)
+        with tempfile.TemporaryFile(dir=spill_dir or None) as f:
+            matrix = np.memmap(f, dtype=dtype, mode='w+', shape=shape)
+    else:
+        matrix = np.empty(shape, dtype=dtype)
+    if fill is not None:
+        matrix.fill(fill)
+    return matrix
+
+
+def expand_matrix(compact, source_ids, destination_ids, spill_cells=None, spill_dir=None, block=ROW_BLOCK):
+    # compact[np.ix_(source_ids, destination_ids)], written a block of rows
+    # at a time into a new distance matrix so no full-size gather is made.
+    matrix = allocate_matrix((len(source_ids), len(destination_ids)), None, spill_cells, spill_dir)
+    for start in range(0, len(source_ids), block):
+        matrix[start:start + block] = compact[source_ids[start:start + block]][:, destination_ids]
+    return matrix
+
+
+def masked_cost(distance_matrix, feasible_blocks, penalty, out=None):
+    # The cost matrix for the solvers, filled one block of rows at a time
+    # from the distances and a (start, mask) feasibility iterator:
+    # infeasible and unreachable cells are set to penalty. With out=None this
+    # happens in place, so the float32 (or memmap) distance matrix is the
+    # cost and no full-size float64 copy is made; scipy upcasts per
+    # component. Pass out to keep the distances, e.g. when several rule sets
+    # share one matrix. Also returns which rows have at least one feasible
+    # pickup.
+    cost = distance_matrix if out is None else out
+    has_feasible = np.zeros(distance_matrix.shape[0], dtype=bool)
+    for start, feasible in feasible_blocks:
+        stop = start + len(feasible)
+        block = cost[start:stop]
+        if out is not None:
+            block[...] = distance_matrix[start:stop]
+        np.copyto(block, penalty, where=~(feasible & np.isfinite(block)))
+        has_feasible[start:stop] = feasible.any(axis=1)
+    return cost, has_feasible
+
+
+def cell_counts(compact, source_ids, destination_ids, block=256):
+    # NaN (unresolved) and inf (unreachable) cells of the matrix
+    # expand_matrix would build, counted on the compact one with every
+    # point weighted by the number of buses that share it.
+    source_weight = np.bincount(source_ids, minlength=compact.shape[0]).astype(float)
+    destination_weight = np.bincount(destination_ids, minlength=compact.shape[1]).astype(float)
+    unresolved = 0.0
+    unreachable = 0.0
+    for start in range(0, compact.shape[0], block):
+        rows = compact[start:start + block]
+        weight = source_weight[start:start + block]
+        unresolved += weight @ (np.isnan(rows) @ destination_weight)
+        unreachable += weight @ (np.isinf(rows) @ destination_weight)
+    return int(unresolved), int(unreachable)
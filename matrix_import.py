@@ -0,0 +1,138 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from matrix import allocate_matrix
+
+logger = logging.getLogger(__name__)
+
+MATRIX_FORMATS = ('npy', 'parquet', 'csv')
+LONG_COLUMNS = ['from_bus', 'to_bus', 'km']
+MAX_LISTED = 10
+
+
+def matrix_format(filename, requested=None):
+    fmt = (requested or os.path.splitext(filename or '')[1].lstrip('.')).lower()
+    if fmt not in MATRIX_FORMATS:
+        raise ValueError(f"Unsupported matrix format {fmt!r}. Use {', '.join(MATRIX_FORMATS)}")
+    return fmt
+
+
+def _listed(values):
+    values = sorted(set(map(str, values)))
+    more = f' and {len(values) - MAX_LISTED} more' if len(values) > MAX_LISTED else ''
+    return ', '.join(values[:MAX_LISTED]) + more
+
+
+def bus_index(buses):
+    ids = pd.Index([str(bus).strip() for bus in buses])
+    if ids.has_duplicates:
+        raise ValueError(f'Vehicle numbers must be unique to match a distance matrix: {_listed(ids[ids.duplicated()])}')
+    return ids
+
+
+def read_npy(source, n):
+    # A bare array has no vehicle numbers: rows and columns follow the roster order.
+    try:
+        matrix = np.load(source, allow_pickle=False)
+    except ValueError as e:
+        raise ValueError(f'Not a readable .npy matrix: {str(e)}')
+    if matrix.shape != (n, n):
+        raise ValueError(
+            f'The matrix is {" x ".join(map(str, matrix.shape))} but the roster has {n} vehicles; '
+            'an .npy matrix must be square and ordered like the roster'
+        )
+    if matrix.dtype.kind not in 'iuf':
+        raise ValueError(f'The matrix must hold numbers, not {matrix.dtype}')
+    return matrix
+
+
+def csv_chunks(source, chunk_rows):
+    return pd.read_csv(source, dtype=str, chunksize=chunk_rows, skipinitialspace=True)
+
+
+def parquet_chunks(source, chunk_rows):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ValueError('Parquet matrices need the pyarrow package')
+    for batch in pq.ParquetFile(source).iter_batches(batch_size=chunk_rows):
+        yield batch.to_pandas()
+
+
+def fill_long(matrix, ids, chunks):
+    # (from_bus, to_bus, km) rows: from_bus is the driver's vehicle, to_bus
+    # the route whose first pickup it would drive to. Pairs may come in any
+    # order; pairs left out and blank km stay NaN, i.e. gaps.
+    n = len(ids)
+    unknown = set()
+    for chunk in chunks:
+        chunk.columns = [str(col).strip().lower() for col in chunk.columns]
+        missing = [col for col in LONG_COLUMNS if col not in chunk.columns]
+        if missing:
+            raise ValueError(f"Long-format matrices need the columns {', '.join(LONG_COLUMNS)}; missing {', '.join(missing)}")
+        from_bus = chunk['from_bus'].astype(str).str.strip()
+        to_bus = chunk['to_bus'].astype(str).str.strip()
+        km = pd.to_numeric(chunk['km'], errors='coerce')
+        bad = km.isna() & chunk['km'].notna()
+        if bad.any():
+            raise ValueError(f"Non-numeric km values: {_listed(chunk.loc[bad, 'km'])}")
+        if (km < 0).any():
+            raise ValueError(f"Negative km for {_listed(from_bus[km < 0] + '->' + to_bus[km < 0])}")
+
+        rows = ids.get_indexer(from_bus)
+        cols = ids.get_indexer(to_bus)
+        unknown.update(from_bus[rows < 0])
+        unknown.update(to_bus[cols < 0])
+        if unknown:
+            continue
+        keep = km.notna().to_numpy()
+        rows, cols = rows[keep], cols[keep]
+        # The matrix starts out all NaN, so a filled target cell is a pair an
+        # earlier chunk already listed.
+        pairs = rows.astype(np.int64) * n + cols
+        if len(np.unique(pairs)) != len(pairs) or not np.isnan(matrix[rows, cols]).all():
+            raise ValueError('The matrix lists some vehicle pairs more than once')
+        matrix[rows, cols] = km.to_numpy()[keep]
+    if unknown:
+        raise ValueError(f'Vehicle numbers not in the roster: {_listed(unknown)}')
+    return matrix
+
+
+def read_matrix(source, fmt, buses, chunk_rows=50000, spill_cells=None, spill_dir=None):
+    # The roster-ordered distance matrix of an uploaded file, checked against
+    # the roster's vehicle numbers. NaN cells are gaps for routing to fill;
+    # inf means there is no route.
+    ids = bus_index(buses)
+    n = len(ids)
+    if fmt == 'npy':
+        loaded = read_npy(source, n)
+        matrix = allocate_matrix((n, n), None, spill_cells, spill_dir)
+        for start in range(0, n, 1024):
+            matrix[start:start + 1024] = loaded[start:start + 1024]
+            if (matrix[start:start + 1024] < 0).any():
+                raise ValueError('The matrix has negative distances')
+    else:
+        matrix = allocate_matrix((n, n), np.nan, spill_cells, spill_dir)
+        try:
+            chunks = csv_chunks(source, chunk_rows) if fmt == 'csv' else parquet_chunks(source, chunk_rows)
+            fill_long(matrix, ids, chunks)
+        except (pd.errors.ParserError, pd.errors.EmptyDataError) as e:
+            raise ValueError(f'Could not read the matrix: {str(e)}')
+    return matrix
+
+
+def matrix_report(matrix, fmt):
+    gaps = 0
+    unreachable = 0
+    for start in range(0, len(matrix), 1024):
+        rows = matrix[start:start + 1024]
+        gaps += int(np.isnan(rows).sum())
+        unreachable += int(np.isinf(rows).sum())
+    return {
+        'format': fmt,
+        'vehicles': len(matrix),
+        'provided': int(matrix.size - gaps),
+        'gaps': gaps,
+        'unreachable': unreachable
+    }
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+METRICS = {
+    'vrp_stage_seconds': ('histogram', 'Wall time of each optimization stage.', STAGE_BUCKETS),
+    'vrp_optimizations_total': ('counter', 'Optimization jobs by solver and outcome.', None),
+    'vrp_osrm_requests_total': ('counter', 'OSRM requests by service and outcome (ok, error, timeout).', None),
+    'vrp_osrm_retries_total': ('counter', 'OSRM requests repeated after a failed attempt.', None),
+    'vrp_osrm_request_seconds': ('histogram', 'OSRM request latency by service.', LATENCY_BUCKETS),
+    'vrp_osrm_breaker_trips_total': ('counter', 'Times the OSRM circuit breaker opened.', None),
+    'vrp_distance_cache_lookups_total': ('counter', 'Matrix cells looked up in the distance cache.', None),
+    'vrp_distance_cache_hits_total': ('counter', 'Matrix cells served from the distance cache.', None),
+    'vrp_distance_cells_total': ('counter', 'Matrix cells by source (real, estimated, missing).', None),
+}
+
+
+def _key(name, labels):
+    if name not in METRICS:
+        raise KeyError(f"Unknown metric {name}")
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+# Process-wide counters and histograms. Optimizations run in job worker
+# processes while /metrics is served by the web workers, so every process
+# writes its totals to its own JSON file under the metrics directory and
+# collect() adds up all files. Files are cumulative, so a finished process
+# keeps contributing until its file ages out after ttl seconds.
+class MetricsRegistry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.directory = None
+        self.ttl = 7 * 24 * 3600
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.token = f"{self.pid}-{time.time_ns()}"
+        self.counters = defaultdict(float)
+        self.histograms = {}
+        self.flushed = 0.0
+
+    def configure(self, directory, ttl=None):
+        if ttl is not None:
+            self.ttl = ttl
+        if directory and directory != self.directory:
+            os.makedirs(directory, exist_ok=True)
+        self.directory = directory or None
+
+    def _check_pid(self):
+        # A forked child starts from a copy of its parent's totals.
+        if os.getpid() != self.pid:
+            self._reset()
+
+    def inc(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self.lock:
+            self._check_pid()
+            self.counters[key] += value
+
+    def observe(self, name, value, **labels):
+        key = _key(name, labels)
+        buckets = METRICS[name][2]
+        with self.lock:
+            self._check_pid()
+            counts = self.histograms.setdefault(key, [0] * len(buckets) + [0.0, 0])
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def snapshot(self):
+        with self.lock:
+            self._check_pid()
+            return {
+                'counters': [[name, dict(labels), value] for (name, labels), value in self.counters.items()],
+                'histograms': [[name, dict(labels), list(counts)] for (name, labels), counts in self.histograms.items()]
+            }
+
+    def flush(self, min_interval=0.0):
+        if self.directory is None or time.monotonic() - self.flushed < min_interval:
+            return
+        snapshot = self.snapshot()
+        path = os.path.join(self.directory, f"{self.token}.json")
+        try:
+            with open(f"{path}.tmp", 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(f"{path}.tmp", path)
+            self.flushed = time.monotonic()
+        except OSError as e:
+            logger.warning(f"Could not write metrics to {path}: {e}")
+
+    def collect(self):
+        snapshots = [self.snapshot()]
+        if self.directory is not None:
+            cutoff = time.time() - self.ttl
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith('.json') or entry.name == f"{self.token}.json":
+                    continue
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                        continue
+                    with open(entry.path) as f:
+                        snapshots.append(json.load(f))
+                except (OSError, ValueError):
+                    continue
+
+        counters = defaultdict(float)
+        histograms = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot['counters']:
+                if name in METRICS:
+                    counters[_key(name, labels)] += value
+            for name, labels, counts in snapshot['histograms']:
+                if name in METRICS and len(counts) == len(METRICS[name][2]) + 2:
+                    total = histograms.setdefault(_key(name, labels), [0] * len(counts))
+                    for i, value in enumerate(counts):
+                        total[i] += value
+        return counters, histograms
+
+    def render(self):
+        counters, histograms = self.collect()
+        lines = []
+        for name, (kind, help_text, buckets) in METRICS.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'counter':
+                for (metric, labels), value in sorted(counters.items()):
+                    if metric == name:
+                        lines.append(f"{name}{_labels(labels)} {_number(value)}")
+                continue
+            for (metric, labels), counts in sorted(histograms.items()):
+                if metric != name:
+                    continue
+                for bound, count in zip(buckets, counts):
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', _number(bound)),))} {count}")
+                lines.append(f"{name}_bucket{_labels(labels + (('le', '+Inf'),))} {counts[-1]}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(counts[-2])}")
+                lines.append(f"{name}_count{_labels(labels)} {counts[-1]}")
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(labels):
+    if not labels:
+        return ''
+    escaped = (
+        (k, str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for k, v in labels
+    )
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def _number(value):
+    return repr(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+REGISTRY = MetricsRegistry()
+
+
+# One optimization's view of the same metrics: everything recorded here
+# also goes to the process registry, and summary() is what the result
+# reports about this run alone.
+class RunMetrics:
+    def __init__(self, registry=REGISTRY):
+        self.registry = registry
+        self.lock = threading.Lock()
+        self.totals = defaultdict(float)
+        self.stages = {}
+        self.stage = None
+        self.stage_started = None
+
+    def inc(self, name, value=1, **labels):
+        self.registry.inc(name, value, **labels)
+        with self.lock:
+            self.totals[_key(name, labels)] += value
+
+    def observe(self, name, value, **labels):
+        self.registry.observe(name, value, **labels)
+        with self.lock:
+            self.totals[_key(name, labels)] += value
+
+    def enter_stage(self, stage):
+        if stage == self.stage:
+            return
+        self.end_stage()
+        self.stage = stage
+        self.stage_started = time.perf_counter()
+
+    def end_stage(self):
+        if self.stage is None:
+            return
+        elapsed = time.perf_counter() - self.stage_started
+        self.stages[self.stage] = self.stages.get(self.stage, 0.0) + elapsed
+        self.registry.observe('vrp_stage_seconds', elapsed, stage=self.stage)
+        self.stage = None
+
+    def total(self, name, **labels):
+        wanted = set((k, str(v)) for k, v in labels.items())
+        with self.lock:
+            return sum(value for (metric, keys), value in self.totals.items()
+                       if metric == name and wanted <= set(keys))
+
+    def summary(self):
+        requests = self.total('vrp_osrm_requests_total')
+        latency = self.total('vrp_osrm_request_seconds')
+        return {
+            'stage_seconds': {stage: round(seconds, 3) for stage, seconds in self.stages.items()},
+            'osrm_requests': int(requests),
+            'osrm_errors': int(self.total('vrp_osrm_requests_total', outcome='error')),
+            'osrm_timeouts': int(self.total('vrp_osrm_requests_total', outcome='timeout')),
+            'osrm_retries': int(self.total('vrp_osrm_retries_total')),
+            'osrm_mean_latency': round(latency / requests, 4) if requests else None,
+            'cache_lookups': int(self.total('vrp_distance_cache_lookups_total')),
+            'cache_hits': int(self.total('vrp_distance_cache_hits_total'))
+        }
@@ -1,34 +1,769 @@
 
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import pandas as pd
 import numpy as np
 import logging
 import time
-from flask import current_app
-import uuid
-from flask import g
-
-progress_tracker={}
+from distance_cache import DistanceCache
+from scipy.optimize import linear_sum_assignment
+from constraints import CONSTRAINT_VAL, feasibility_mask, feasibility_blocks, feasible_pairs, allowed_institutes
+from geo import haversine_matrix, within_bound, detour_factor, intern_points
+from assignment import (
+    nearest_candidates, solve_sparse, edge_lookup, assignment_duals, augment_assignment,
+    cost_components, assignment_blocks, solve_blocks, auction_assignment
+)
+from run_state import RunStateStore
+from metrics import REGISTRY, RunMetrics
+from matrix import allocate_matrix, expand_matrix, masked_cost, cell_counts
+from resilience import OSRMUnavailable, DeadlineExceeded, Deadline, shared_breaker, backoff_delay
+from responses import column_table
 
 logger =logging.getLogger(__name__)
+
+# Overall percent range and label of each optimization stage.
+PROGRESS_STAGES={
+    'matrix': (0, 80, 'Fetching road distances'),
+    'constraints': (80, 85, 'Applying depot and experience rules'),
+    'solve': (85, 95, 'Optimizing Driver Assignments'),
+    'chains': (95, 100, 'Extracting swap chains')
+}
+
 class OSRMService:
-    def __init__(self):
-        self.base_url =current_app.config['OSRM_SERVER']
+    def __init__(self, config=None, jobs=None):
+        # Job workers and the batch CLI pass a plain dict; only the web app relies on current_app.
+        if config is None:
+            from flask import current_app
+            config=current_app.config
+        self.jobs=jobs
+        self.task_id=None
+        self.cache_hits=0
+        self.cache_lookups=0
+        REGISTRY.configure(config['METRICS_DIR'], config['METRICS_TTL'])
+        self.metrics=RunMetrics()
+        self.base_url =config['OSRM_SERVER']
+        self.max_workers=config['OSRM_MAX_WORKERS']
+        self.timeout=(config['OSRM_CONNECT_TIMEOUT'], config['OSRM_READ_TIMEOUT'])
+        self.run_deadline=config['OSRM_RUN_DEADLINE']
+        self.retries=config['OSRM_RETRIES']
+        self.retry_backoff=config['OSRM_RETRY_BACKOFF']
+        self.retry_max_backoff=config['OSRM_RETRY_MAX_BACKOFF']
+        self.fallback=config['OSRM_FALLBACK']
+        self.breaker=shared_breaker(self.base_url, config['OSRM_BREAKER_THRESHOLD'], config['OSRM_BREAKER_RESET'])
+        self.start_run()
         self.session =requests.Session()
+        adapter=HTTPAdapter(pool_connections=1, pool_maxsize=self.max_workers, pool_block=True)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.max_table_size=config['OSRM_MAX_TABLE_SIZE']
+        self.solver=config['ASSIGNMENT_SOLVER']
+        self.sparse_candidates=config['SPARSE_CANDIDATES']
+        self.sparse_verify=config['SPARSE_VERIFY']
+        self.max_chain_length=config['MAX_CHAIN_LENGTH']
+        self.distance_mode=config['DISTANCE_MODE']
+        self.snap_meters=config['COORD_SNAP_METERS']
+        self.prune_margin=config['PRUNE_MARGIN_KM']
+        self._detour_factor=config['DETOUR_FACTOR']
+        self.incremental_limit=config['INCREMENTAL_MAX_CHANGED']
+        self.assignment_workers=config['ASSIGNMENT_WORKERS']
+        self.parallel_min_rows=config['COMPONENT_PARALLEL_MIN_ROWS']
+        self.time_budget=config['ASSIGNMENT_TIME_BUDGET']
+        self.auction_epsilon=config['AUCTION_EPSILON']
+        self.scenario_workers=config['SCENARIO_WORKERS']
+        self.spill_cells=config['MATRIX_SPILL_CELLS']
+        self.spill_dir=config['MATRIX_SPILL_DIR']
+        self.solved_state=None
+        self.run_state=None
+        if config['RUN_STATE_DIR']:
+            self.run_state=RunStateStore(
+                config['RUN_STATE_DIR'], ttl=config['RUN_STATE_TTL'], keep=config['RUN_STATE_KEEP']
+            )
+        self.cache=None
+        if config['DISTANCE_CACHE_PATH']:
+            self.cache=DistanceCache(
+                config['DISTANCE_CACHE_PATH'],
+                max_entries=config['DISTANCE_CACHE_MAX_ENTRIES'],
+                ttl=config['DISTANCE_CACHE_TTL']
+            )
+
+    def start_run(self):
+        self.deadline=Deadline(self.run_deadline)
+        self.cells={'real': 0, 'estimated': 0, 'missing': 0, 'reused': 0, 'imported': 0}
+        self.unavailable=None
+
+    def distance_report(self):
+        return {
+            **self.cells,
+            'osrm_unavailable': self.unavailable,
+            'breaker': self.breaker.state
+        }
+
+    def record_request(self, service, outcome, started):
+        self.metrics.inc('vrp_osrm_requests_total', service=service, outcome=outcome)
+        self.metrics.observe('vrp_osrm_request_seconds', time.perf_counter() - started, service=service)
+
+    def osrm_get(self, service, url, params=None):
+        # One OSRM call under the run's deadline and the server's circuit
+        # breaker. Timeouts, connection errors, bad bodies and 429/5xx answers
+        # are retried with jittered backoff; any other OSRM answer (NoRoute,
+        # TooBig, ...) is returned as it is. Raises OSRMUnavailable once the
+        # retries, the breaker or the deadline give out.
+        error=None
+        for attempt in range(self.retries + 1):
+            timeout=self.deadline.timeout(*self.timeout)
+            self.breaker.before()
+            # Every attempt let past the breaker must report back to it; a
+            # half-open trial that never does keeps the circuit open for good.
+            settled=False
+            try:
+                if attempt:
+                    self.metrics.inc('vrp_osrm_retries_total', service=service)
+                started=time.perf_counter()
+                try:
+                    response=self.session.get(url, params=params, timeout=timeout)
+                    if response.status_code == 429 or response.status_code >= 500:
+                        raise requests.HTTPError(f"HTTP {response.status_code}")
+                    data=response.json()
+                    if not isinstance(data, dict):
+                        raise ValueError('OSRM answered with something other than a JSON object')
+                except requests.Timeout as e:
+                    outcome, error='timeout', e
+                except (requests.ConnectionError, requests.HTTPError, ValueError) as e:
+                    outcome, error='error', e
+                except requests.RequestException as e:
+                    self.record_request(service, 'error', started)
+                    raise OSRMUnavailable(f"OSRM {service} request failed: {str(e)}")
+                else:
+                    self.breaker.success()
+                    settled=True
+                    self.record_request(service, 'ok' if data.get('code') == 'Ok' else 'error', started)
+                    return data
+
+                self.record_request(service, outcome, started)
+                settled=True
+                if self.breaker.failure():
+                    self.metrics.inc('vrp_osrm_breaker_trips_total')
+                    logger.error(f"OSRM circuit breaker opened after {self.breaker.threshold} consecutive failures")
+            finally:
+                if not settled:
+                    self.breaker.failure()
+            logger.warning(f"OSRM {service} request attempt {attempt + 1} failed: {str(error)}")
+            if attempt == self.retries:
+                break
+            delay=backoff_delay(attempt, self.retry_backoff, self.retry_max_backoff)
+            remaining=self.deadline.remaining()
+            if remaining is not None and delay >= remaining:
+                raise DeadlineExceeded('OSRM time budget for this run is used up')
+            time.sleep(delay)
+        raise OSRMUnavailable(f"OSRM {service} request failed after {self.retries + 1} attempts: {str(error)}")
+
+    def osrm_table(self, sources, destinations):
+        coords=';'.join(f"{lon},{lat}" for lat, lon in list(sources) + list(destinations))
+        url=f"{self.base_url}/table/v1/driving/{coords}"
+        params={
+            'sources': ';'.join(str(i) for i in range(len(sources))),
+            'destinations': ';'.join(str(len(sources) + j) for j in range(len(destinations))),
+            'annotations': 'distance'
+        }
+        data=self.osrm_get('table', url, params)
+        if data.get('code') == 'Ok':
+            # null is OSRM's "no route": the cell is missing, not unknown.
+            distances=np.array(data['distances'], dtype=float) / 1000
+            distances[np.isnan(distances)]=np.inf
+            return distances
+        # A refused table (NoRoute, TooBig, ...) is no route for this run only;
+        # None keeps it out of the distance cache.
+        logger.warning(f"OSRM table request failed: {data.get('code')} {data.get('message', '')}")
+        return None
 
-    def osrm_distance(self, lat1, lon1, lat2, lon2):
-        coords =f"{lon1},{lat1};{lon2},{lat2}"
-        url=(f"{self.base_url}/route/v1/driving/{coords}")
+    def report_stage(self, stage, fraction=0.0, note=None, details=None):
+        self.metrics.enter_stage(stage)
+        REGISTRY.flush(min_interval=5)
+        if self.task_id is None or self.jobs is None:
+            return
+        start, end, label=PROGRESS_STAGES[stage]
+        percent=int(start + (end - start) * fraction)
+        details=dict(details or {})
+        if self.cache_lookups:
+            details['cache_hit_ratio']=round(self.cache_hits / self.cache_lookups, 3)
+        message=f'{label}... ({percent}%)' + (f' {note}' if note else '')
+        self.jobs.progress(self.task_id, percent, message, stage=stage, details=details)
+
+    def distance_matrix(self, sources, destinations, progress=None):
+        return self.distance_blocks([(sources, destinations)], progress)[0]
+
+    @property
+    def detour_factor(self):
+        if self._detour_factor is None:
+            if self.cache is not None:
+                self._detour_factor=detour_factor(*self.cache.sample())
+            else:
+                self._detour_factor=detour_factor(np.empty((0, 2)), np.empty((0, 2)), np.empty(0))
+            logger.info(f"Calibrated detour factor: {self._detour_factor:.3f}")
+        return self._detour_factor
+
+    def allocate(self, shape, fill=np.inf):
+        return allocate_matrix(shape, fill, self.spill_cells, self.spill_dir)
+
+    def estimate_blocks(self, blocks, progress=None):
+        matrices=[]
+        for sources, destinations in blocks:
+            matrix=self.allocate((len(sources), len(destinations)), None)
+            for start in range(0, len(sources), 1024):
+                matrix[start:start + 1024]=haversine_matrix(sources[start:start + 1024], destinations) * self.detour_factor
+            matrices.append(matrix)
+        if progress:
+            progress(1, 1)
+        return matrices
+
+    def count_cells(self, matrix, source_points, destination_points, source_ids, destination_ids):
+        # Tallies the bus-level cells behind a compact matrix as real (OSRM
+        # or cache), estimated or missing (no route), and fills the cells no
+        # OSRM answer arrived for with the great-circle estimate. Cells copied
+        # from a stored run count as reused; stored runs never hold estimates.
+        unresolved, unreachable=cell_counts(matrix, source_ids, destination_ids)
+        total=len(source_ids) * len(destination_ids)
+        estimated=total - unreachable if self.distance_mode == 'estimate' else unresolved
+        counts={'real': total - estimated - unreachable, 'estimated': estimated, 'missing': unreachable}
+        for source, cells in counts.items():
+            self.cells[source]+=cells
+            if cells:
+                self.metrics.inc('vrp_distance_cells_total', cells, source=source)
+        if unresolved and self.distance_mode != 'estimate':
+            for start in range(0, len(matrix), 1024):
+                rows=matrix[start:start + 1024]
+                unknown=np.isnan(rows)
+                if unknown.any():
+                    rows[unknown]=(haversine_matrix(source_points[start:start + 1024], destination_points) * self.detour_factor)[unknown]
+
+    def distance_blocks(self, blocks, progress=None):
+        # Many buses share a depot or a pickup point, so every block is reduced
+        # to its unique (snapped) points before lookup and expanded back to bus
+        # positions afterwards.
+        interned=[]
+        unique_blocks=[]
+        for sources, destinations in blocks:
+            source_points, source_ids=intern_points(sources, self.snap_meters)
+            destination_points, destination_ids=intern_points(destinations, self.snap_meters)
+            interned.append((source_ids, destination_ids))
+            unique_blocks.append((source_points, destination_points))
+
+        if self.distance_mode == 'estimate':
+            matrices=self.estimate_blocks(unique_blocks, progress)
+        else:
+            matrices=self.fetch_blocks(unique_blocks, progress)
+        for matrix, (source_points, destination_points), (source_ids, destination_ids) in zip(matrices, unique_blocks, interned):
+            self.count_cells(matrix, source_points, destination_points, source_ids, destination_ids)
+        return [
+            expand_matrix(matrix, source_ids, destination_ids, self.spill_cells, self.spill_dir)
+            for matrix, (source_ids, destination_ids) in zip(matrices, interned)
+        ]
+
+    def fetch_blocks(self, blocks, progress=None):
+        # Resolves several sources x destinations blocks at once: cache hits
+        # are filled first, then every block's misses are split into tiles of
+        # at most max-table-size² cells (OSRM rejects larger tables) and all
+        # tiles share one worker pool.
+        block=self.max_table_size
+        matrices=[]
+        missing_masks=[]
+        tiles=[]
+        refused=[]
+        for b, (sources, destinations) in enumerate(blocks):
+            sources=np.asarray(sources, dtype=float)
+            destinations=np.asarray(destinations, dtype=float)
+            matrix=self.allocate((len(sources), len(destinations)), np.nan)
+            if self.cache is not None:
+                self.cache.get_many(sources, destinations, out=matrix)
+            missing=np.isnan(matrix)
+            rows=np.flatnonzero(missing.any(axis=1))
+            cols=np.flatnonzero(missing.any(axis=0))
+            tiles.extend(
+                (b, rows[r:r + block], cols[c:c + block])
+                for r in range(0, len(rows), block) for c in range(0, len(cols), block)
+            )
+            matrices.append((sources, destinations, matrix))
+            missing_masks.append(missing)
+
+        missing_cells=[int(missing.sum()) for missing in missing_masks]
+        total_cells=sum(m.size for _, _, m in matrices)
+        self.cache_hits+=total_cells - sum(missing_cells)
+        self.cache_lookups+=total_cells
+        if self.cache is not None:
+            self.metrics.inc('vrp_distance_cache_lookups_total', total_cells)
+            self.metrics.inc('vrp_distance_cache_hits_total', total_cells - sum(missing_cells))
+        logger.info(f"Distance matrix: {total_cells - sum(missing_cells)} cached, {sum(missing_cells)} to fetch in {len(tiles)} tiles")
+        pool=ThreadPoolExecutor(max_workers=self.max_workers)
         try:
-            response=self.session.get(url, timeout=30)
-            data =response.json()
-            if data.get('code') == 'Ok':
-                return data['routes'][0]['distance'] / 1000
-            return float('inf')  
-        except Exception as e:
-            return float('inf')
-
-    def optimize_routes_vrp(self, df, task_id=None):
+            futures={
+                pool.submit(self.osrm_table, matrices[b][0][rows], matrices[b][1][cols]): (b, rows, cols)
+                for b, rows, cols in tiles
+            }
+            for done, future in enumerate(as_completed(futures), 1):
+                b, rows, cols=futures[future]
+                try:
+                    distances=future.result()
+                    if distances is None:
+                        refused.append((b, rows, cols))
+                except OSRMUnavailable as e:
+                    # The tile stays NaN; distance_blocks estimates it or the run fails.
+                    if self.fallback != 'estimate':
+                        raise
+                    if self.unavailable is None:
+                        logger.error(f"OSRM unavailable, estimating the rest of the matrix: {str(e)}")
+                    self.unavailable=self.unavailable or str(e)
+                    distances=None
+                if distances is not None:
+                    matrix=matrices[b][2]
+                    cells=matrix[np.ix_(rows, cols)]
+                    matrix[np.ix_(rows, cols)]=np.where(np.isnan(cells), distances, cells)
+                if progress:
+                    progress(done, len(tiles))
+        finally:
+            pool.shutdown(cancel_futures=True)
+        if not tiles and progress:
+            progress(1, 1)
+
+        if self.cache is not None:
+            # Only the cells that missed before the fetch: rewriting the hits
+            # would renew their created time and they would never expire.
+            for (sources, destinations, matrix), missing, missed in zip(matrices, missing_masks, missing_cells):
+                if missed:
+                    self.cache.put_many(sources, destinations, matrix, cells=missing)
+        for b, rows, cols in refused:
+            matrix=matrices[b][2]
+            cells=matrix[np.ix_(rows, cols)]
+            matrix[np.ix_(rows, cols)]=np.where(np.isnan(cells), np.inf, cells)
+        return [matrix for _, _, matrix in matrices]
+
+    def edge_distances(self, sources, destinations, rows, cols, progress=None):
+        # Road distance for each (sources[rows[e]], destinations[cols[e]]) edge.
+        # Edges are first reduced to unique point pairs, then drivers are
+        # grouped into spatially sorted chunks so that each chunk's candidate
+        # pickups overlap and one small table covers them.
+        source_points, source_ids=intern_points(sources, self.snap_meters)
+        destination_points, destination_ids=intern_points(destinations, self.snap_meters)
+        pairs, edge_pair=np.unique(
+            source_ids[rows] * len(destination_points) + destination_ids[cols], return_inverse=True
+        )
+        rows=pairs // len(destination_points)
+        cols=pairs % len(destination_points)
+
+        drivers=np.unique(rows)
+        spatial=drivers[np.lexsort((source_points[drivers, 1], np.round(source_points[drivers, 0], 1)))]
+        chunk_of=np.empty(len(source_points), dtype=np.int64)
+        chunk_of[spatial]=np.arange(len(spatial)) // self.max_table_size
+        order=np.argsort(chunk_of[rows], kind='stable')
+        bounds=np.flatnonzero(np.diff(chunk_of[rows][order])) + 1
+
+        chunks=[]
+        blocks=[]
+        for edges in np.split(order, bounds):
+            chunk_rows=np.unique(rows[edges])
+            chunk_cols=np.unique(cols[edges])
+            chunks.append((edges, chunk_rows, chunk_cols))
+            blocks.append((source_points[chunk_rows], destination_points[chunk_cols]))
+
+        distances=np.full(len(pairs), np.inf)
+        for (edges, chunk_rows, chunk_cols), matrix in zip(chunks, self.distance_blocks(blocks, progress)):
+            distances[edges]=matrix[
+                np.searchsorted(chunk_rows, rows[edges]), np.searchsorted(chunk_cols, cols[edges])
+            ]
+        logger.info(f"Edge distances: {len(edge_pair)} edges over {len(pairs)} unique point pairs")
+        return distances[edge_pair.reshape(-1)]
+
+    def imported_matrix(self, imported, sources, destinations, progress=None):
+        # A matrix uploaded with the roster, in roster order. Only its gaps
+        # (NaN cells) are routed; scattered gaps go through edge_distances,
+        # whole missing rows or columns as one block.
+        n=len(sources)
+        distance_matrix=self.allocate((n, n), None)
+        gap_rows=np.zeros(n, dtype=bool)
+        gap_cols=np.zeros(n, dtype=bool)
+        gaps=0
+        for start in range(0, n, 1024):
+            rows=distance_matrix[start:start + 1024]
+            rows[...]=imported[start:start + 1024]
+            unknown=np.isnan(rows)
+            gaps+=int(unknown.sum())
+            gap_rows[start:start + 1024]=unknown.any(axis=1)
+            gap_cols|=unknown.any(axis=0)
+        self.cells['imported']+=n * n - gaps
+        self.metrics.inc('vrp_distance_cells_total', n * n - gaps, source='imported')
+        rows=np.flatnonzero(gap_rows)
+        cols=np.flatnonzero(gap_cols)
+        logger.info(f"Imported distance matrix: {n * n - gaps} cells given, {gaps} gaps to route")
+        if not gaps:
+            if progress:
+                progress(1, 1)
+        elif gaps * 4 < len(rows) * len(cols):
+            edges=[]
+            for start in range(0, len(rows), 1024):
+                chunk=rows[start:start + 1024]
+                r, c=np.nonzero(np.isnan(distance_matrix[chunk][:, cols]))
+                edges.append((chunk[r], cols[c]))
+            edge_rows=np.concatenate([r for r, _ in edges])
+            edge_cols=np.concatenate([c for _, c in edges])
+            distance_matrix[edge_rows, edge_cols]=self.edge_distances(sources, destinations, edge_rows, edge_cols, progress)
+        else:
+            block=self.distance_blocks([(sources[rows], destinations[cols])], progress)[0]
+            for start in range(0, len(rows), 1024):
+                chunk=rows[start:start + 1024]
+                current=distance_matrix[chunk][:, cols]
+                distance_matrix[chunk[:, None], cols]=np.where(np.isnan(current), block[start:start + 1024], current)
+        return distance_matrix
+
+    def solve_dense(self, driver_df, pickup_df, progress=None, solver='dense', imported=None, keep_matrix=False):
+        sources=driver_df[['dlat', 'dlon']].to_numpy(dtype=float)
+        destinations=pickup_df[['plat', 'plon']].to_numpy(dtype=float)
+        solver_report={'mode': solver}
+        if imported is not None:
+            distance_matrix=self.imported_matrix(imported, sources, destinations, progress)
+            solver_report['matrix']='imported'
+        elif self.prune_margin is None or self.distance_mode == 'estimate':
+            distance_matrix=self.distance_matrix(sources, destinations, progress=progress)
+        else:
+            distance_matrix=self.pruned_matrix(driver_df, pickup_df, sources, destinations, progress)
+            solver_report['pruning']='heuristic'
+            solver_report['pruned_pairs']=int(np.isinf(distance_matrix).sum())
+        self.report_stage('constraints')
+        original_km=distance_matrix.diagonal().astype(float)
+        cost, problematic_mask=self.dense_cost(driver_df, pickup_df, distance_matrix, out=self.cost_buffer(distance_matrix, keep_matrix))
+
+        self.report_stage('solve')
+        if solver == 'auction':
+            optim_drivers, optim_pickups=self.solve_auction(cost, solver_report)
+        else:
+            optim_drivers, optim_pickups=self.solve_components(cost, solver_report)
+        self.solved_state={'matrix': distance_matrix, 'problematic': problematic_mask}
+        return (
+            optim_drivers, optim_pickups, original_km,
+            self.assigned_km(cost, optim_drivers, optim_pickups), solver_report
+        )
+
+    @staticmethod
+    def dense_cost(driver_df, pickup_df, distance_matrix, rules=None, pinned=None, out=None):
+        # rules overrides the depot and experience rules (feasibility_blocks
+        # keywords); pinned rows may only keep their own route. Masks
+        # distance_matrix in place unless out is given (see masked_cost).
+        diagonal=distance_matrix.diagonal().astype(float)
+        cost, has_feasible=masked_cost(
+            distance_matrix, feasibility_blocks(driver_df, pickup_df, **(rules or {})), CONSTRAINT_VAL, out
+        )
+
+        problematic_mask = ~has_feasible
+        if pinned is not None and pinned.any():
+            cost[pinned]=CONSTRAINT_VAL
+            cost[:, pinned]=CONSTRAINT_VAL
+            problematic_mask|=pinned
+        if problematic_mask.any():
+            rows=np.flatnonzero(problematic_mask)
+            cost[rows, rows]=np.where(np.isnan(diagonal[rows]), CONSTRAINT_VAL, diagonal[rows])
+        return cost, problematic_mask
+
+    @staticmethod
+    def assigned_km(cost, rows, cols):
+        # Dead km of the chosen cells of a masked cost matrix; a cell the
+        # solver could only fill with an infeasible pair has no distance left.
+        km=cost[rows, cols].astype(float)
+        km[km >= CONSTRAINT_VAL]=np.nan
+        return km
+
+    def cost_buffer(self, distance_matrix, keep_matrix):
+        # Where dense_cost writes: over the matrix itself unless the matrix is
+        # stored for later runs, which need the distances of cells these rules
+        # masked. The copy is float32 and spills like the matrix does.
+        return self.allocate(distance_matrix.shape, None) if keep_matrix else None
+
+    def solve_components(self, cost, solver_report):
+        # Rows and columns joined only by constraint-penalty cells never
+        # trade with each other, so each connected component of the finite
+        # cells is its own, much smaller, assignment problem.
+        blocks=assignment_blocks(*cost_components(cost < CONSTRAINT_VAL))
+        if len(blocks) == 1:
+            return linear_sum_assignment(cost)
+        optim_drivers, optim_pickups, pooled=solve_blocks(cost, blocks, self.assignment_workers, self.parallel_min_rows)
+        solver_report['components']=len(blocks)
+        solver_report['largest_component']=max(len(rows) for rows, _ in blocks)
+        solver_report['pooled_components']=pooled
+        return optim_drivers, optim_pickups
+
+    def solve_auction(self, cost, solver_report):
+        # Anytime solve for fleets the exact solver takes too long on. Every
+        # finished auction phase is reported as the incumbent with its gap to
+        # the dual lower bound; the best one when the time budget runs out is
+        # the answer.
+        started=time.perf_counter()
+
+        def on_phase(phase, epsilon, col_of_row, total, bound):
+            dead_km=float(np.nansum(self.assigned_km(cost, np.arange(len(col_of_row)), col_of_row)))
+            gap=(total - bound) / total if total > 0 else 0.0
+            logger.info(f"Auction phase {phase} (epsilon {epsilon:.4g}): {dead_km:.2f} dead km, gap {gap:.2%}")
+            elapsed=time.perf_counter() - started
+            self.report_stage(
+                'solve', min(1.0, elapsed / self.time_budget) if self.time_budget else phase / (phase + 1),
+                note=f'best {dead_km:.1f} km, gap {gap:.2%}',
+                details={'incumbent_dead_km': round(dead_km, 2), 'lower_bound': round(float(bound), 2), 'gap': round(gap, 5)}
+            )
+
+        optim_drivers, optim_pickups, report=auction_assignment(
+            cost, self.time_budget or None, self.auction_epsilon, penalty=CONSTRAINT_VAL, on_phase=on_phase
+        )
+        solver_report.update({
+            'time_budget': self.time_budget or None,
+            'timed_out': report['timed_out'],
+            'phases': report['phases'],
+            'epsilon': report['epsilon'],
+            'seconds': report['seconds'],
+            'lower_bound': round(report['lower_bound'], 2),
+            'gap': round(report['gap'], 5)
+        })
+        logger.info(f"Auction assignment: {solver_report}")
+        return optim_drivers, optim_pickups
+
+    def run_meta(self):
+        # Settings that change the matrix; a stored run is only reused under the same ones.
+        return {
+            'distance_mode': self.distance_mode,
+            'prune_margin': self.prune_margin,
+            'snap_meters': self.snap_meters,
+            'detour_factor': self.detour_factor if self.distance_mode == 'estimate' else None
+        }
+
+    @staticmethod
+    def rule_keys(driver_df):
+        return driver_df[['dname', 'cname', 'category', 'dexp']].astype(str).to_numpy().astype(str)
+
+    def solve_incremental(self, driver_df, pickup_df, baseline, progress=None, keep_matrix=False):
+        # Re-solves against a stored earlier run. Vehicles whose points and
+        # rules are unchanged keep their matrix cells, so only the rows and
+        # columns of changed vehicles are fetched, and the earlier assignment
+        # is repaired with shortest augmenting paths from the rows it no
+        # longer covers. Returns None when a full solve is needed instead.
+        state=self.run_state.get(baseline) if self.run_state is not None else None
+        if state is None or state['meta'] != self.run_meta():
+            logger.info(f"No reusable run state for baseline {baseline}; solving from scratch")
+            return None
+
+        sources=driver_df[['dlat', 'dlon']].to_numpy(dtype=float)
+        destinations=pickup_df[['plat', 'plon']].to_numpy(dtype=float)
+        n=len(sources)
+        old_pos=pd.Index(state['buses']).get_indexer(driver_df.index.astype(str))
+        kept=np.flatnonzero(old_pos >= 0)
+        stable=np.zeros(n, dtype=bool)
+        stable[kept]=(
+            (state['sources'][old_pos[kept]] == sources[kept]).all(axis=1)
+            & (state['destinations'][old_pos[kept]] == destinations[kept]).all(axis=1)
+            & (state['rules'][old_pos[kept]] == self.rule_keys(driver_df)[kept]).all(axis=1)
+        )
+        same=np.flatnonzero(stable)
+        changed=np.flatnonzero(~stable)
+        if len(changed) > self.incremental_limit * n:
+            logger.info(f"{len(changed)} of {n} routes changed since {baseline}; solving from scratch")
+            return None
+
+        distance_matrix=self.allocate((n, n), None)
+        self.cells['reused']+=len(same) * len(same)
+        for start in range(0, len(same), 1024):
+            chunk=same[start:start + 1024]
+            distance_matrix[chunk[:, None], same]=state['matrix'][old_pos[chunk]][:, old_pos[same]]
+        if len(changed):
+            changed_rows, changed_cols=self.distance_blocks(
+                [(sources[changed], destinations), (sources[same], destinations[changed])], progress
+            )
+            distance_matrix[changed]=changed_rows
+            distance_matrix[np.ix_(same, changed)]=changed_cols
+        elif progress:
+            progress(1, 1)
+
+        self.report_stage('constraints')
+        original_km=distance_matrix.diagonal().astype(float)
+        cost, problematic_mask=self.dense_cost(driver_df, pickup_df, distance_matrix, out=self.cost_buffer(distance_matrix, keep_matrix))
+        # A row whose fallback to its own route switched on or off has a new diagonal cost.
+        affected=~stable
+        affected[same]|=problematic_mask[same] != state['problematic'][old_pos[same]]
+
+        self.report_stage('solve')
+        new_of_old=np.full(len(state['buses']), -1)
+        new_of_old[old_pos[kept]]=kept
+        rows=np.flatnonzero(~affected)
+        cols=new_of_old[np.asarray(state['assignment'])[old_pos[rows]]]
+        keep=cols >= 0
+        keep[keep]=stable[cols[keep]]
+        rows, cols=rows[keep], cols[keep]
+        col_of_row=np.full(n, -1)
+        col_of_row[rows]=cols
+
+        u=np.zeros(n)
+        v=np.zeros(n)
+        if 'u' in state:
+            u[rows]=state['u'][old_pos[rows]]
+            v[cols]=state['v'][old_pos[cols]]
+        else:
+            # Runs solved from scratch do not store potentials; recover them
+            # once for the kept part of the assignment, which is still optimal
+            # on its own rows and columns.
+            duals=assignment_duals(cost[np.ix_(rows, cols)], np.arange(len(rows)), np.arange(len(rows)))
+            if duals is None:
+                return None
+            u[rows], v[cols]=duals
+        free_cols=np.setdiff1d(np.arange(n), cols)
+        if len(rows) and len(free_cols):
+            v[free_cols]=(cost[np.ix_(rows, free_cols)] - u[rows][:, None]).min(axis=0)
+        col_of_row, u, v=augment_assignment(cost, u, v, col_of_row)
+
+        solver_report={
+            'mode': 'incremental',
+            'baseline': baseline,
+            'changed_routes': len(changed),
+            'added_routes': n - len(kept),
+            'removed_routes': len(state['buses']) - len(kept),
+            'recomputed_cells': int(len(changed) * n + len(same) * len(changed)),
+            'repaired_rows': n - len(rows)
+        }
+        logger.info(f"Incremental assignment: {solver_report}")
+        self.solved_state={'matrix': distance_matrix, 'problematic': problematic_mask, 'u': u, 'v': v}
+        identity=np.arange(n)
+        return (
+            identity, col_of_row, original_km,
+            self.assigned_km(cost, identity, col_of_row), solver_report
+        )
+
+    def save_run_state(self, run_id, driver_df, pickup_df, optim_drivers, optim_pickups):
+        assignment=np.empty(len(driver_df), dtype=np.int64)
+        assignment[optim_drivers]=optim_pickups
+        self.run_state.put(run_id, {
+            'buses': driver_df.index.astype(str).to_numpy().astype(str),
+            'sources': driver_df[['dlat', 'dlon']].to_numpy(dtype=float),
+            'destinations': pickup_df[['plat', 'plon']].to_numpy(dtype=float),
+            'rules': self.rule_keys(driver_df),
+            'assignment': assignment,
+            'matrix': self.solved_state['matrix'],
+            'problematic': self.solved_state['problematic'],
+            'u': self.solved_state.get('u'),
+            'v': self.solved_state.get('v')
+        }, self.run_meta())
+
+    def pruned_matrix(self, driver_df, pickup_df, sources, destinations, progress=None):
+        # Road distance is never shorter than the great-circle distance, so a
+        # pair whose bound already exceeds the driver's current dead km by more
+        # than the margin is not sent to OSRM; those cells, and infeasible
+        # ones, stay inf. This is a heuristic: a long pair can still belong to
+        # the optimal assignment when it frees a cheaper pair elsewhere, so a
+        # pruned run may end a little above the unpruned optimum.
+        identity=np.arange(len(sources))
+        original=self.edge_distances(sources, destinations, identity, identity)
+        keep=within_bound(sources, destinations, original + self.prune_margin)
+        keep&=feasibility_mask(driver_df, pickup_df)
+        keep[identity, identity]=False
+        rows, cols=np.nonzero(keep)
+        distance_matrix=self.allocate(keep.shape)
+        distance_matrix[identity, identity]=original
+        distance_matrix[rows, cols]=self.edge_distances(sources, destinations, rows, cols, progress)
+        logger.info(f"Lower-bound pruning kept {len(rows)} of {keep.size} off-diagonal pairs")
+        return distance_matrix
+
+    def solve_sparse(self, driver_df, pickup_df, progress=None):
+        sources=driver_df[['dlat', 'dlon']].to_numpy(dtype=float)
+        destinations=pickup_df[['plat', 'plon']].to_numpy(dtype=float)
+        n=len(sources)
+        identity=np.arange(n)
+
+        def solve(k):
+            rows, cols, rank=nearest_candidates(
+                sources, destinations, k, is_feasible=lambda r, c: feasible_pairs(driver_df, pickup_df, r, c)
+            )
+            distances=self.edge_distances(sources, destinations, rows, cols, progress)
+            self.report_stage('constraints')
+            feasible=feasible_pairs(driver_df, pickup_df, rows, cols)
+            # Drivers with no feasible candidate keep their own route at road cost, as in the dense path.
+            stranded=np.bincount(rows[feasible], minlength=n) == 0
+            costs=np.where(feasible | (stranded[rows] & (rows == cols)), distances, CONSTRAINT_VAL)
+            costs[~np.isfinite(costs)]=CONSTRAINT_VAL
+            self.report_stage('solve')
+            optim_drivers, optim_pickups=solve_sparse(rows, cols, costs, (n, n))
+            chosen=edge_lookup(rows, cols, n, optim_drivers, optim_pickups)
+            own=edge_lookup(rows, cols, n, identity, identity)
+            return optim_drivers, optim_pickups, distances[own], distances[chosen], rank[chosen], len(rows)
+
+        k=min(self.sparse_candidates, n)
+        optim_drivers, optim_pickups, original_km, optimized_km, rank, edges=solve(k)
+        solver_report={
+            'mode': 'sparse',
+            'candidates_per_driver': k,
+            'edges': edges,
+            'density': round(edges / max(n * n, 1), 6),
+            'boundary_assignments': int((rank == k).sum())
+        }
+        if self.sparse_verify and k < n:
+            # Re-solve with twice the candidates to measure how often a wider
+            # neighbourhood would have changed the answer.
+            _, wide_pickups, _, wide_km, _, _=solve(min(2 * k, n))
+            solver_report['widened_changes']=int((wide_pickups != optim_pickups).sum())
+            solver_report['widened_dead_km_delta']=round(float(optimized_km.sum() - wide_km.sum()), 2)
+        logger.info(f"Sparse assignment: {solver_report}")
+        return optim_drivers, optim_pickups, original_km, optimized_km, solver_report
+
+    def scenario_matrix(self, driver_df, pickup_df, baseline=None, progress=None):
+        # The full (unpruned) matrix: scenarios change the rules a pruned one
+        # was cut down with. An earlier dense run on the same roster and
+        # distance settings supplies it without any routing.
+        sources=driver_df[['dlat', 'dlon']].to_numpy(dtype=float)
+        destinations=pickup_df[['plat', 'plon']].to_numpy(dtype=float)
+        state=self.run_state.get(baseline) if baseline and self.run_state is not None else None
+        if state is not None:
+            stored=dict(state['meta'])
+            current=self.run_meta()
+            pruned=stored.pop('prune_margin', None) is not None and self.distance_mode != 'estimate'
+            current.pop('prune_margin')
+            if (not pruned and stored == current
+                    and np.array_equal(state['buses'], driver_df.index.astype(str).to_numpy().astype(str))
+                    and np.array_equal(state['sources'], sources)
+                    and np.array_equal(state['destinations'], destinations)):
+                if progress:
+                    progress(1, 1)
+                self.cells['reused']+=state['matrix'].size
+                return state['matrix'], 'baseline'
+            logger.info(f"Run {baseline} does not match this roster; building the scenario matrix")
+        return self.distance_matrix(sources, destinations, progress=progress), 'built'
+
+    def compare_scenarios(self, df, scenarios, task_id=None, distance_mode=None, baseline=None, matrix=None, **_):
+        # Builds (or loads) the road matrix once and solves every rule set on it.
+        from scenarios import run_scenarios, comparison_table
+
+        self.distance_mode=distance_mode or self.distance_mode
+        driver_df, pickup_df=self.roster_frames(df)
+        self.task_id=task_id
+        self.metrics=RunMetrics()
+        self.start_run()
+        self.report_stage('matrix')
+
+        def report(done, tiles):
+            self.report_stage('matrix', done / tiles)
+
+        if matrix is not None:
+            sources=driver_df[['dlat', 'dlon']].to_numpy(dtype=float)
+            destinations=pickup_df[['plat', 'plon']].to_numpy(dtype=float)
+            distance_matrix, source=self.imported_matrix(matrix, sources, destinations, progress=report), 'imported'
+        else:
+            distance_matrix, source=self.scenario_matrix(driver_df, pickup_df, baseline, progress=report)
+        self.report_stage('solve')
+        summaries=run_scenarios(
+            distance_matrix, driver_df, pickup_df, scenarios, self.scenario_workers, self.max_chain_length,
+            progress=lambda done, total: self.report_stage('solve', done / total)
+        )
+        self.metrics.end_stage()
+        return {
+            'success': True,
+            'scenarios': column_table(comparison_table(scenarios, summaries)),
+            'matrix': {'source': source, 'baseline': baseline if source == 'baseline' else None, 'routes': len(driver_df)},
+            'distance_cells': self.distance_report(),
+            'metrics': self.metrics.summary()
+        }
+
+    @staticmethod
+    def roster_frames(df):
         driver_df=df[['Vehicle Number', 'Route Number', 'Driver pt Latitude', 'Driver pt Longitude', 'Driver pt Name',
                         'Institute', 'Licensed Experience (years)', 'Category']].rename(columns={
             'Vehicle Number': 'bus', 'Route Number': 'route',
@@ -44,22 +779,13 @@ class OSRMService:
             '1st Pickup pt Name': 'pname', 'Institute': 'cname',
             'Category': 'category'
         }).set_index('bus')
-        depot_names=['MAHE', 'Kannamangla village Edify World School']
-        shared_depots={'MAHE': ['MAHE'], 'Amara Jyothi Public School': ['Amar Jyothi Public School & Pre-University College']}
-        min_driver_exp= {'A+': 10, 'A': 0, 'B': 0, 'C': 0}
+        driver_df['is_depot'], driver_df['allowed_institutes']=allowed_institutes(driver_df)
+        return driver_df, pickup_df
 
-        driver_df['is_depot']=driver_df['dname'].isin(depot_names)
-        driver_df['allowed_institutes']= driver_df.apply(
-            lambda row: shared_depots.get(row['dname'],[row['cname']]) if row['is_depot'] else [], axis=1
-        )
-        
+    @staticmethod
+    def result_frame(driver_df, pickup_df, optim_pickups, original_km, optimized_km):
         buses= driver_df.index
-        matrix=pd.DataFrame(index=buses, columns=buses, dtype=float)
-        cache={}
-
-        total= len(buses)
 
-        leng=np.arange(0,len(driver_df))
         result_df=pd.DataFrame({
             'From Bus': driver_df.index, 
             'Driver Site':driver_df['cname'],
@@ -81,63 +807,9 @@ class OSRMService:
         })
 
         result_df.set_index(np.arange(1,len(driver_df)+1))
-        for idx, bus in enumerate(buses):
-            dlat, dlon=driver_df.loc[bus, ['dlat', 'dlon']]
-            key=(dlat, dlon)
-            if key in cache:
-                matrix.loc[bus]=cache[key]
-                continue
-            distances={}
-            for target in buses:
-                plat, plon=pickup_df.loc[target, ['plat', 'plon']]
-                distances[target]=self.osrm_distance(dlat, dlon, plat, plon)
-                if task_id:
-                    percent=int(((idx + 1) / total) * 100)
-                    if task_id not in progress_tracker or progress_tracker[task_id]['percent'] != percent:
-                        progress_tracker[task_id]={
-                            'percent': percent,
-                            'message': f'Optimizing Driver Assignments... ({percent}%)'
-                        }
-
-            matrix.loc[bus]=distances
-            cache[key]=distances
-
-        distance_matrix=matrix.copy()
-        constraint_val=10000000000
-
-        result_df['Original dead km']=np.round(matrix.values.diagonal(),2)
-        for dbus in matrix.index:
-            drow=driver_df.loc[dbus]
-            driver_exp=float(drow['dexp'])  
-            if drow['is_depot']:
-                for pbus in matrix.columns:
-                    pinc=pickup_df.loc[pbus, 'cname']
-                    if pinc not in drow['allowed_institutes']:
-                        matrix.loc[dbus, pbus]=constraint_val
-            for pbus in matrix.columns:
-                pcat=pickup_df.loc[pbus, 'category']
-                try:
-                    driver_exp=float(drow['dexp'])  
-                    required_exp=float(min_driver_exp.get(pcat, 0))
-                    if driver_exp < required_exp:
-                        matrix.loc[dbus, pbus]=constraint_val
-                except Exception as e:
-                    matrix.loc[dbus, pbus]=float('inf')
-        
-        problematic_mask = np.all(matrix.to_numpy()==constraint_val, axis=1)
-        if problematic_mask.any():
-            for bus in matrix.index[problematic_mask]:
-                matrix.at[bus,bus]=distance_matrix.at[bus,bus] if pd.notna(distance_matrix.at[bus, bus]) else constraint_val
-
-        from scipy.optimize import linear_sum_assignment
-        from solver import find_changed_chains
-        from solver import get_swap_details
 
-        optim_drivers, optim_pickups=linear_sum_assignment(matrix.to_numpy())
-        driver_ids=matrix.index[optim_drivers]
-        pickup_ids=matrix.columns[optim_pickups]
-
-        assigned_bus=matrix.columns[optim_pickups]
+        result_df['Original dead km']=np.round(original_km, 2)
+        assigned_bus=buses[optim_pickups]
         result_df['To Bus']=assigned_bus
         result_df['Pickup Site']=pickup_df.loc[assigned_bus, 'cname'].values
         result_df['Pickup Category']=pickup_df.loc[assigned_bus, 'category'].values
@@ -145,38 +817,62 @@ class OSRMService:
         result_df['Pickup pt name']=pickup_df.loc[assigned_bus, 'pname'].values
         result_df['Pickup pt lat']=pickup_df.loc[assigned_bus, 'plat'].values
         result_df['Pickup pt long']=pickup_df.loc[assigned_bus, 'plon'].values
-        result_df['Optimized dead km']=np.round(distance_matrix.values[optim_drivers, optim_pickups] , 2)
+        result_df['Optimized dead km']=np.round(optimized_km, 2)
+        return result_df
+
+    def optimize_routes_vrp(self, df, task_id=None, solver=None, distance_mode=None, baseline=None, time_budget=None, matrix=None):
+        solver=solver or self.solver
+        if matrix is not None and solver == 'sparse':
+            raise ValueError('An imported distance matrix needs the dense or auction solver')
+        self.distance_mode=distance_mode or self.distance_mode
+        self.time_budget=self.time_budget if time_budget is None else time_budget
+        driver_df, pickup_df=self.roster_frames(df)
 
-        if task_id:
-            progress_tracker[task_id] ={'percent':100, 'message':'Optimization complete.'}
+        self.task_id=task_id
+        self.metrics=RunMetrics()
+        self.start_run()
+        self.report_stage('matrix')
 
+        def report(done, tiles):
+            self.report_stage('matrix', done / tiles)
+
+        if solver == 'sparse':
+            optim_drivers, optim_pickups, original_km, optimized_km, solver_report=self.solve_sparse(driver_df, pickup_df, progress=report)
+        else:
+            # Incremental repair starts from an optimal assignment; an auction one is not stored,
+            # nor is one solved on an imported matrix, whose cells other runs could not reproduce.
+            store=bool(task_id) and self.run_state is not None and solver == 'dense' and matrix is None
+            solved=None
+            if baseline and solver == 'dense' and matrix is None:
+                solved=self.solve_incremental(driver_df, pickup_df, baseline, progress=report, keep_matrix=store)
+            if solved is None:
+                solved=self.solve_dense(driver_df, pickup_df, progress=report, solver=solver, imported=matrix, keep_matrix=store)
+            optim_drivers, optim_pickups, original_km, optimized_km, solver_report=solved
+            if store:
+                if self.cells['estimated']:
+                    logger.info(f"Not storing run {task_id} for reuse: {self.cells['estimated']} distances are estimates")
+                else:
+                    self.save_run_state(task_id, driver_df, pickup_df, optim_drivers, optim_pickups)
+
+        from solver import find_changed_chains, get_swap_details, route_summary
+
+        result_df=self.result_frame(driver_df, pickup_df, optim_pickups, original_km, optimized_km)
+
+        self.report_stage('chains')
         chains =find_changed_chains(result_df['From Bus'].tolist(), result_df['To Bus'].tolist())
         logger.info(f"Optimized {len(result_df)} routes. Detected {len(chains)} swap chains.")
-        logger.info(chains)
+        logger.debug(chains)
 
         swap_df=get_swap_details(chains, result_df, driver_df)
-        total_routes =len(result_df)
-        total_dead_km =result_df['Optimized dead km'].sum()
-        original_dead_km =result_df['Original dead km'].sum()
-        total_minimized=(original_dead_km-total_dead_km)*2
-        total_swaps=sum(result_df['From Bus'] != result_df['To Bus'])
-        inter_institute=sum(
-            result_df['Driver Site'] != result_df['Pickup Site']
-        )
-        intra_institute= total_swaps - inter_institute
+        self.metrics.end_stage()
 
         return {
             'success': True,
-            'results': result_df.to_dict('records'),
-            'summary': {
-                'total_routes': total_routes,
-                'original_dead_km': round(original_dead_km, 2),
-                'total_dead_km': round(total_dead_km, 2),
-                'total_minimized': round(total_minimized, 2),
-                'total_swaps': total_swaps,
-                'inter_institute': inter_institute,
-                'intra_institute': intra_institute
-            },
+            'results': column_table(result_df),
+            'summary': route_summary(result_df, chains, self.max_chain_length),
+            'solver': solver_report,
+            'distance_cells': self.distance_report(),
+            'metrics': self.metrics.summary(),
             'chains': chains,
-            'swap_details': swap_df.to_dict('records') if not swap_df.empty else [] 
+            'swap_details': column_table(swap_df)
         }
\ No newline at end of file
@@ -0,0 +1,107 @@
+import time
+import random
+import threading
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+class OSRMUnavailable(Exception):
+    pass
+
+
+class DeadlineExceeded(OSRMUnavailable):
+    pass
+
+
+class CircuitOpen(OSRMUnavailable):
+    pass
+
+
+# The wall-clock budget for all OSRM traffic of one run. seconds=None (or 0)
+# means no budget.
+class Deadline:
+    def __init__(self, seconds=None):
+        self.expires = time.monotonic() + seconds if seconds else None
+
+    def remaining(self):
+        if self.expires is None:
+            return None
+        return self.expires - time.monotonic()
+
+    def check(self):
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded('OSRM time budget for this run is used up')
+        return remaining
+
+    def timeout(self, connect, read):
+        # Per-request (connect, read) timeouts, cut down so no request
+        # outlasts the budget.
+        remaining = self.check()
+        if remaining is None:
+            return connect, read
+        return min(connect, remaining), min(read, remaining)
+
+
+# Opens after threshold consecutive failed requests; while open, requests
+# fail at once instead of waiting on a server that is down. After reset_after
+# seconds a single trial request is let through and a success closes it.
+class CircuitBreaker:
+    def __init__(self, threshold=5, reset_after=30):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.lock = threading.Lock()
+        self.failures = 0
+        self.opened = None
+        self.trial = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        with self.lock:
+            if self.opened is None:
+                return 'closed'
+            return 'half-open' if self.trial else 'open'
+
+    def before(self):
+        with self.lock:
+            if self.opened is None:
+                return
+            if not self.trial and time.monotonic() - self.opened >= self.reset_after:
+                self.trial = True
+                return
+            raise CircuitOpen(f'OSRM circuit breaker is open after {self.failures} consecutive failures')
+
+    def success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened = None
+            self.trial = False
+
+    def failure(self):
+        # Returns True when this failure opened the breaker.
+        with self.lock:
+            self.failures += 1
+            if self.trial or (self.opened is None and self.failures >= self.threshold):
+                tripped = self.opened is None
+                self.opened = time.monotonic()
+                self.trial = False
+                self.trips += tripped
+                return tripped
+            return False
+
+
+def shared_breaker(key, threshold=5, reset_after=30):
+    # One breaker per OSRM server and process, so later runs in the same job
+    # worker fail fast too while the server is down.
+    with _breakers_lock:
+        if key not in _breakers:
+            _breakers[key] = CircuitBreaker(threshold, reset_after)
+        return _breakers[key]
+
+
+def backoff_delay(attempt, base=0.5, cap=8.0):
+    # Full jitter: uniform over [0, min(cap, base * 2^attempt)], so clients
+    # retrying together do not hit the server again in lockstep.
+    return random.uniform(0, min(cap, base * 2 ** attempt))
@@ -0,0 +1,82 @@
+import json
+import gzip
+import numpy as np
+import pandas as pd
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+# orjson when it is installed (several times faster on large results, and
+# NaN becomes null instead of invalid JSON), the standard library otherwise.
+def dumps(obj):
+    if orjson is not None:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS)
+    return json.dumps(obj, default=_default).encode('utf-8')
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Results are sent column-oriented: the column names once and one array of
+# values per column, instead of a dict with every key per row.
+def column_table(df):
+    return {
+        'columns': df.columns.tolist(),
+        'data': [df[col].astype(object).where(df[col].notna(), None).tolist() for col in df.columns]
+    }
+
+
+def table_page(table, offset=0, limit=None):
+    total = len(table['data'][0]) if table['data'] else 0
+    end = total if limit is None else min(total, offset + limit)
+    return {
+        'columns': table['columns'],
+        'data': [values[offset:end] for values in table['data']],
+        'offset': offset,
+        'limit': limit,
+        'total': total
+    }
+
+
+def table_records(table):
+    return [dict(zip(table['columns'], row)) for row in zip(*table['data'])]
+
+
+def table_frame(table):
+    # Runs stored before the column layout kept a list of records.
+    if isinstance(table, list):
+        return pd.DataFrame(table)
+    return pd.DataFrame(dict(zip(table['columns'], table['data'])), columns=table['columns'])
+
+
+def negotiate_encoding(accept_encodings):
+    if brotli is not None and accept_encodings.quality('br'):
+        return 'br'
+    if accept_encodings.quality('gzip'):
+        return 'gzip'
+    return None
+
+
+def compress_body(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=5)
+    return gzip.compress(data, compresslevel=6)
@@ -1,14 +1,22 @@
-import os
 import json
 import logging
-from flask import render_template, request, jsonify, send_file, flash, redirect, url_for
-from werkzeug.utils import secure_filename
+import time
+import uuid
+from datetime import datetime, timezone
+from flask import render_template, request, jsonify, send_file, Response, stream_with_context
+from werkzeug.exceptions import RequestEntityTooLarge
 import pandas as pd
-import io
 from app import app
-from osrm_service import OSRMService, progress_tracker
+from jobs import JobStore, submit
+from scenarios import parse_scenarios
+from datasets import DatasetStore
+from matrix_import import matrix_format, read_matrix, matrix_report
+from history import HistoryUnavailable, history_store
+from metrics import REGISTRY
+from exports import EXPORT_FORMATS, EXPORT_TABLES, ExportUnavailable, export_table, export_chunks
+from responses import dumps, loads, column_table, table_page, table_records, negotiate_encoding, compress_body
+import jobs
 from data_processor import DataProcessor
-from solver import run_deadkm_optimization
 
 
 logger = logging.getLogger(__name__)
@@ -16,7 +24,6 @@ logger = logging.getLogger(__name__)
 @app.route('/')
 def index():
     return render_template('index.html')
-import uuid
 
 
 @app.route('/upload', methods=['POST'])
@@ -30,20 +37,32 @@ def upload_file():
             return jsonify({'error': 'No file selected'}), 400
         
         if file and file.filename.lower().endswith('.csv'):
-            processor = DataProcessor()
+            processor = DataProcessor(chunk_rows=app.config['CSV_CHUNK_ROWS'])
             try:
                 df = processor.process_csv_file(file)
                 preview_data = processor.get_preview_data(df)
 
                 task_id = str(uuid.uuid4()) 
+                dataset_store().put(task_id, df)
+
+                # An optional precomputed distance matrix sent with the roster.
+                matrix_file = request.files.get('matrix')
+                matrix = None
+                if matrix_file and matrix_file.filename:
+                    try:
+                        matrix = store_matrix(task_id, df, matrix_file, request.form.get('matrix_format'))
+                    except ValueError as e:
+                        dataset_store().delete(task_id)
+                        return jsonify({'error': f'Error importing distance matrix: {str(e)}'}), 400
 
                 return jsonify({
                     'success': True,
                     'task_id': task_id, 
+                    'dataset_id': task_id,
                     'preview': preview_data,
-                    'full_data': df.values.tolist(),
                     'columns': df.columns.tolist(),
                     'row_count': len(df),
+                    'matrix': matrix,
                     'message': f'Successfully loaded {len(df)} rows'
                 })
 
@@ -53,6 +72,8 @@ def upload_file():
         else:
             return jsonify({'error': 'Invalid file format. Please upload a CSV file.'}), 400
     
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         logger.error(f"Upload error: {str(e)}")
         return jsonify({'error': 'An error occurred during upload'}), 500
@@ -65,17 +86,17 @@ def process_paste():
             return jsonify({'error': 'No data provided'}), 400
         
         content = data['content']
-        processor = DataProcessor()
+        processor = DataProcessor(chunk_rows=app.config['CSV_CHUNK_ROWS'])
         
         try:
             df = processor.process_pasted_data(content)
             preview_data = processor.get_preview_data(df)
-            
+            dataset_id = dataset_store().put(str(uuid.uuid4()), df)
 
             return jsonify({
                 'success': True,
+                'dataset_id': dataset_id,
                 'preview': preview_data,
-                'full_data': df.values.tolist(),
                 'row_count': len(df),
                 'message': f'Successfully processed {len(df)} rows'
             })
@@ -84,124 +105,392 @@ def process_paste():
             logger.error(f"Error processing pasted data: {str(e)}")
             return jsonify({'error': f'Error processing data: {str(e)}'}), 400
     
+    except RequestEntityTooLarge:
+        raise
     except Exception as e:
         logger.error(f"Process paste error: {str(e)}")
-        return jsonify({'error': 'An error occurred processing the data'}), 00
+        return jsonify({'error': 'An error occurred processing the data'}), 500
+
+def job_store():
+    return JobStore(app.config['JOB_DB_PATH'], ttl=app.config['JOB_TTL'], stale_after=app.config['JOB_STALE_AFTER'])
+
+def dataset_store():
+    return DatasetStore(app.config['DATASET_DIR'], ttl=app.config['DATASET_TTL'])
+
+def store_matrix(dataset_id, df, file, fmt=None):
+    fmt = matrix_format(file.filename, fmt)
+    matrix = read_matrix(
+        file.stream, fmt, df['Vehicle Number'], chunk_rows=app.config['CSV_CHUNK_ROWS'],
+        spill_cells=app.config['MATRIX_SPILL_CELLS'], spill_dir=app.config['MATRIX_SPILL_DIR']
+    )
+    dataset_store().put_matrix(dataset_id, matrix)
+    report = matrix_report(matrix, fmt)
+    logger.info(f"Imported distance matrix for dataset {dataset_id}: {report}")
+    return report
+
+# Attaches a precomputed distance matrix (.npy in roster order, or
+# from_bus,to_bus,km rows as CSV or Parquet) to an uploaded roster. Later
+# /calculate and /scenarios runs on the dataset use it and route only its gaps.
+@app.route('/datasets/<dataset_id>/matrix', methods=['POST'])
+def upload_matrix(dataset_id):
+    try:
+        file = request.files.get('file')
+        if not file or file.filename == '':
+            return jsonify({'error': 'No matrix file provided'}), 400
+        df = dataset_store().get(dataset_id) if dataset_store().exists(dataset_id) else None
+        if df is None:
+            return jsonify({'error': 'Dataset not found or expired. Please upload the data again.'}), 404
+        try:
+            report = store_matrix(dataset_id, df, file, request.form.get('format'))
+        except ValueError as e:
+            return jsonify({'error': f'Error importing distance matrix: {str(e)}'}), 400
+        return jsonify({'success': True, 'dataset_id': dataset_id, 'matrix': report})
+
+    except RequestEntityTooLarge:
+        raise
+    except Exception as e:
+        logger.error(f"Matrix upload error: {str(e)}")
+        return jsonify({'error': 'An error occurred importing the matrix'}), 500
+
+def imported_matrix(data, dataset_id):
+    # Datasets with an imported matrix use it unless the request sets use_matrix to false.
+    return data.get('use_matrix', True) is not False and dataset_store().has_matrix(dataset_id)
+
+def request_dataset(data, task_id):
+    datasets = dataset_store()
+    if 'dataset_id' in data:
+        dataset_id = data['dataset_id']
+        if not datasets.exists(dataset_id):
+            return None, (jsonify({'error': 'Dataset not found or expired. Please upload the data again.'}), 404)
+        return dataset_id, None
+    # Rows posted inline are validated and stored like an upload.
+    df = pd.DataFrame(data['data'], columns=data.get('columns'))
+    try:
+        df = DataProcessor().process_dataframe(df)
+    except ValueError as e:
+        return None, (jsonify({'error': f'Invalid data format: {str(e)}'}), 400)
+    return datasets.put(task_id, df), None
+
 @app.route('/calculate', methods=['POST'])
 def calculate_distances():
     try:
         data = request.get_json()
-        if not data or 'data' not in data:
+        if not data or ('dataset_id' not in data and 'data' not in data):
             return jsonify({'error': 'No data provided for calculation'}), 400
-
-        df = pd.DataFrame(data['data'], columns=data.get('columns'))
-        df.columns = df.columns.str.strip()
-        task_id = data.get('task_id')
-
-        processor = DataProcessor()
-        if not processor.validate_columns(df):
-            return jsonify({'error': 'Invalid data format. Please check required columns.'}), 400
-
-        osrm_service = OSRMService()
-        try:
-            results = osrm_service.optimize_routes_vrp(df, task_id=task_id)
-            return jsonify(results)
-
-        except Exception as e:
-            logger.error(f"Dead KM optimization error: {str(e)}")
-            return jsonify({'error': f'Error during dead km optimization: {str(e)}'}), 400
+        task_id = data.get('task_id') or str(uuid.uuid4())
+        dataset_id, error = request_dataset(data, task_id)
+        if error:
+            return error
+
+        if data.get('solver') not in (None, 'dense', 'sparse', 'auction'):
+            return jsonify({'error': 'Unknown solver. Use dense, sparse or auction'}), 400
+        if data.get('distance_mode') not in (None, 'osrm', 'estimate'):
+            return jsonify({'error': 'Unknown distance_mode. Use osrm or estimate'}), 400
+        time_budget = data.get('time_budget')
+        if time_budget is not None and (not isinstance(time_budget, (int, float)) or time_budget < 0):
+            return jsonify({'error': 'time_budget must be a number of seconds'}), 400
+
+        options = {
+            'solver': data.get('solver'),
+            'distance_mode': data.get('distance_mode'),
+            'baseline': data.get('baseline'),
+            'time_budget': time_budget
+        }
+        if imported_matrix(data, dataset_id):
+            if (data.get('solver') or app.config['ASSIGNMENT_SOLVER']) == 'sparse':
+                return jsonify({'error': 'An imported distance matrix needs the dense or auction solver'}), 400
+            options['matrix'] = True
+        config = {key: value for key, value in app.config.items() if key.isupper()}
+        job_store().create(task_id)
+        submit(task_id, dataset_id, options, config)
+        return jsonify({'success': True, 'task_id': task_id, 'status': jobs.QUEUED}), 202
 
     except Exception as e:
         logger.error(f"Calculate route error: {str(e)}")
         return jsonify({'error': 'An error occurred during calculation'}), 400
 
-@app.route('/export/optimized', methods=['POST'])
-def export_optimized():
+# What-if runs: one road matrix, many rule sets. Queued like /calculate; the
+# job result holds a comparison table of the scenarios' summaries.
+@app.route('/scenarios', methods=['POST'])
+def compare_scenarios():
     try:
         data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No data received'}), 400
-
-        df = pd.DataFrame(data)
-
-        ordered_columns = [
-            'From Bus', 'Driver Site', 'Driver pt lat', 'Driver pt long',
-            'Driver pt name', 'Driver Route', 'Driver Experience',
-            'To Bus', 'Pickup Site', 'Pickup Category', 'Pickup Route',
-            'Pickup pt name', 'Pickup pt lat', 'Pickup pt long',
-            'Original dead km', 'Optimized dead km'
-        ]
-        df = df[[col for col in ordered_columns if col in df.columns]]
-
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
+        if not data or ('dataset_id' not in data and 'data' not in data):
+            return jsonify({'error': 'No data provided for the scenarios'}), 400
+        try:
+            scenarios = parse_scenarios(data.get('scenarios'), app.config['SCENARIO_MAX'])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if data.get('distance_mode') not in (None, 'osrm', 'estimate'):
+            return jsonify({'error': 'Unknown distance_mode. Use osrm or estimate'}), 400
+        task_id = data.get('task_id') or str(uuid.uuid4())
+        dataset_id, error = request_dataset(data, task_id)
+        if error:
+            return error
+
+        options = {
+            'scenarios': scenarios,
+            'distance_mode': data.get('distance_mode'),
+            'baseline': data.get('baseline')
+        }
+        if imported_matrix(data, dataset_id):
+            options['matrix'] = True
+        config = {key: value for key, value in app.config.items() if key.isupper()}
+        job_store().create(task_id)
+        submit(task_id, dataset_id, options, config)
+        return jsonify({'success': True, 'task_id': task_id, 'status': jobs.QUEUED}), 202
 
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name='optimized_assignments.csv'
-        )
     except Exception as e:
-        logger.error(f"Export error: {str(e)}")
-        return jsonify({'error': 'Export failed'}), 500
-
-
-@app.route('/export/swap-details', methods=['POST'])
-def export_swap_details():
+        logger.error(f"Scenarios route error: {str(e)}")
+        return jsonify({'error': 'An error occurred while queueing the scenarios'}), 400
+
+@app.route('/jobs/<task_id>')
+def get_job(task_id):
+    job = job_store().get(task_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<task_id>/cancel', methods=['POST'])
+def cancel_job(task_id):
+    job = job_store().cancel(task_id)
+    if job is None:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job)
+
+def finished_result(task_id):
+    store = job_store()
+    job = store.get(task_id)
+    if job is None:
+        return None, (jsonify({'error': 'Unknown job'}), 404)
+    if job['status'] == jobs.FAILED:
+        return None, (jsonify({'error': f"Error during dead km optimization: {job['error']}"}), 400)
+    if job['status'] == jobs.CANCELLED:
+        return None, (jsonify(job), 409)
+    if job['status'] != jobs.DONE:
+        return None, (jsonify(job), 202)
+    return loads(store.result(task_id)), None
+
+def page_args(default_limit):
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No data received'}), 400
+        offset = int(request.args.get('offset', 0))
+        limit = int(request.args.get('limit', default_limit))
+    except ValueError:
+        return None, (jsonify({'error': 'offset and limit must be integers'}), 400)
+    if offset < 0 or limit < 1:
+        return None, (jsonify({'error': 'offset must be 0 or more and limit at least 1'}), 400)
+    layout = request.args.get('layout', 'columns')
+    if layout not in ('columns', 'records'):
+        return None, (jsonify({'error': 'Unknown layout. Use columns or records'}), 400)
+    return (offset, limit, layout), None
+
+def results_page(result):
+    args, error = page_args(app.config['RESULT_PAGE_SIZE'])
+    if error:
+        return None, error
+    offset, limit, layout = args
+
+    table = result.get('results')
+    if table is None:
+        return None, (jsonify({'error': 'This job has no result rows'}), 404)
+    if isinstance(table, list):
+        table = column_table(pd.DataFrame(table))
+    page = table_page(table, offset, limit)
+    if layout == 'records':
+        page = {**page, 'data': table_records(page)}
+    return page, None
+
+def json_response(payload, status=200):
+    return app.response_class(dumps(payload), status=status, mimetype='application/json')
+
+# The summary, chains and swap details come with the first page of results,
+# so the page can render at once; /results serves the remaining pages.
+@app.route('/jobs/<task_id>/result')
+def get_job_result(task_id):
+    result, error = finished_result(task_id)
+    if error:
+        return error
+    if 'results' not in result:
+        return json_response(result)
+    page, error = results_page(result)
+    if error:
+        return error
+    result['results'] = page
+    return json_response(result)
+
+@app.route('/jobs/<task_id>/results')
+def get_job_results_page(task_id):
+    result, error = finished_result(task_id)
+    if error:
+        return error
+    page, error = results_page(result)
+    if error:
+        return error
+    return json_response(page)
+
+@app.after_request
+def compress_response(response):
+    # Brotli or gzip for JSON bodies worth compressing, if the client takes it.
+    if (response.direct_passthrough or response.is_streamed or response.mimetype != 'application/json'
+            or 'Content-Encoding' in response.headers):
+        return response
+    response.vary.add('Accept-Encoding')
+    data = response.get_data()
+    encoding = negotiate_encoding(request.accept_encodings)
+    if encoding is None or len(data) < app.config['RESPONSE_COMPRESS_MIN_BYTES']:
+        return response
+    response.set_data(compress_body(data, encoding))
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+@app.route('/export/<run_id>')
+def export_run(run_id):
+    fmt = request.args.get('format', 'csv').lower()
+    table = request.args.get('table', 'results')
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unsupported format. Use one of: {', '.join(EXPORT_FORMATS)}"}), 400
+    if table not in EXPORT_TABLES:
+        return jsonify({'error': f"Unknown table. Use one of: {', '.join(EXPORT_TABLES)}"}), 400
+
+    store = job_store()
+    job = store.get(run_id)
+    if job is None:
+        # Expired from the job store; the run history may still hold the plan.
+        history, _ = run_history()
+        result = history.result(run_id) if history is not None else None
+        if result is None:
+            return jsonify({'error': 'Unknown run'}), 404
+    elif job['status'] != jobs.DONE:
+        return jsonify({'error': 'Run has no results to export', 'status': job['status']}), 409
+    else:
+        result = loads(store.result(run_id))
+    if table not in result:
+        # Scenario runs have no assignments, optimization runs no comparison.
+        tables = [name for name in EXPORT_TABLES if name in result]
+        return jsonify({'error': f"Run has no {table} table", 'tables': tables}), 404
 
-        df=pd.DataFrame(data['swap_details'])
-        print(df)
-        df.columns = df.iloc[0]
-        df = df[1:] 
-        output = io.StringIO()
-        df.to_csv(output, index=False)
-        output.seek(0)
-
-        return send_file(
-            io.BytesIO(output.getvalue().encode('utf-8')),
-            mimetype='text/csv',
-            as_attachment=True,
-            download_name='swap_details.csv'
-        )
+    try:
+        df = export_table(result, table)
+        chunks = export_chunks(df, fmt, table, app.config['EXPORT_CHUNK_ROWS'], compress)
+    except ExportUnavailable as e:
+        return jsonify({'error': str(e)}), 501
     except Exception as e:
         logger.error(f"Export error: {str(e)}")
         return jsonify({'error': 'Export failed'}), 500
 
-# @app.route("/export/swap-details", methods=['POST'])
-# def export_swap_details():
-#     try:
-#         data = request.get_json()
-#         logger.info(f"Swap details export payload: {data}")  # DEBUG
-
-#         if not data or "swap_details" not in data:
-#             return jsonify({"error": "No swap details provided"}), 400
-
-#         df = pd.DataFrame(data["swap_details"])
-#         logger.info(f"Swap details dataframe shape: {df.shape}")  # DEBUG
-
-#         if df.empty:
-#             return jsonify({"error": "No data to export"}), 400
-
-#         output = io.BytesIO()
-#         with pd.ExcelWriter(output, engine="xlsxwriter") as writer:
-#             df.to_excel(writer, index=False, sheet_name="Swap Details")
-
-#         output.seek(0)
-#         return send_file(
-#             output,
-#             mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-#             as_attachment=True,
-#             download_name="swap_details.xlsx",
-#         )
-#     except Exception as e:
-#         logger.error(f"Swap details export error: {str(e)}")
-#         return jsonify({"error": "Failed to export swap details"}), 500
+    mimetype, extension = EXPORT_FORMATS[fmt]
+    filename = f"{EXPORT_TABLES[table][0]}.{extension}{'.gz' if compress else ''}"
+    return Response(
+        chunks,
+        mimetype='application/gzip' if compress else mimetype,
+        headers={'Content-Disposition': f'attachment; filename="{filename}"'}
+    )
+
+def run_history():
+    if not app.config['HISTORY_DB_URL']:
+        return None, (jsonify({'error': 'Run history is disabled'}), 404)
+    try:
+        return history_store(app.config['HISTORY_DB_URL'], app.config['EXPORT_CHUNK_ROWS']), None
+    except HistoryUnavailable as e:
+        return None, (jsonify({'error': str(e)}), 501)
+
+def history_filters():
+    filters = {'institute': request.args.get('institute') or None, 'vehicle': request.args.get('vehicle') or None}
+    for name in ('since', 'until'):
+        value = request.args.get(name)
+        if not value:
+            continue
+        try:
+            moment = datetime.fromisoformat(value)
+        except ValueError:
+            return None, (jsonify({'error': f'{name} must be an ISO date or date and time'}), 400)
+        # Runs are stored in UTC; a date or time without an offset is taken as UTC.
+        filters[name] = (moment if moment.tzinfo else moment.replace(tzinfo=timezone.utc)).astimezone(timezone.utc)
+    return filters, None
+
+def history_assignments(history, run_id, offset, limit, layout):
+    df, total = history.assignment_page(
+        run_id, offset, limit, institute=request.args.get('institute') or None,
+        vehicle=request.args.get('vehicle') or None
+    )
+    page = {**column_table(df), 'offset': offset, 'limit': limit, 'total': total}
+    if layout == 'records':
+        page['data'] = table_records(page)
+    return page
+
+# Stored plans, newest first; filter by since/until (run date), institute
+# (driver or pickup site) and vehicle (from or to bus). Served from the
+# history tables only, never from OSRM or the solver.
+@app.route('/history')
+def list_history():
+    history, error = run_history()
+    if error:
+        return error
+    args, error = page_args(app.config['HISTORY_PAGE_SIZE'])
+    if error:
+        return error
+    filters, error = history_filters()
+    if error:
+        return error
+    offset, limit, _ = args
+    runs, total = history.list_runs(offset, limit, **filters)
+    return json_response({'success': True, 'runs': runs, 'offset': offset, 'limit': limit, 'total': total})
+
+# A stored run with its summary, swap details, the first page of
+# assignments and the first page of swap chains.
+@app.route('/history/<run_id>')
+def get_history_run(run_id):
+    history, error = run_history()
+    if error:
+        return error
+    run = history.get_run(run_id)
+    if run is None:
+        return jsonify({'error': 'Run not found in history'}), 404
+    args, error = page_args(app.config['RESULT_PAGE_SIZE'])
+    if error:
+        return error
+    offset, limit, layout = args
+    summary = run.pop('summary')
+    return json_response({
+        'success': True,
+        'run': {key: value for key, value in run.items() if key not in ('swap_details', 'solver_report', 'distance_cells')},
+        'summary': summary,
+        'solver': run['solver_report'],
+        'distance_cells': run['distance_cells'],
+        'swap_details': run['swap_details'],
+        'chains': history.chain_page(run_id, 0, app.config['RESULT_PAGE_SIZE']),
+        'results': history_assignments(history, run_id, offset, limit, layout)
+    })
+
+@app.route('/history/<run_id>/assignments')
+def get_history_assignments(run_id):
+    history, error = run_history()
+    if error:
+        return error
+    args, error = page_args(app.config['RESULT_PAGE_SIZE'])
+    if error:
+        return error
+    if history.get_run(run_id) is None:
+        return jsonify({'error': 'Run not found in history'}), 404
+    return json_response(history_assignments(history, run_id, *args))
+
+@app.route('/history/<run_id>/chains')
+def get_history_chains(run_id):
+    history, error = run_history()
+    if error:
+        return error
+    args, error = page_args(app.config['RESULT_PAGE_SIZE'])
+    if error:
+        return error
+    run = history.get_run(run_id)
+    if run is None:
+        return jsonify({'error': 'Run not found in history'}), 404
+    offset, limit, _ = args
+    return json_response({
+        'chains': history.chain_page(run_id, offset, limit), 'offset': offset, 'limit': limit,
+        'total': run['chain_count']
+    })
 
 @app.route('/download-sample')
 def download_sample():
@@ -218,16 +507,54 @@ def download_sample():
 
 @app.errorhandler(413)
 def too_large(e):
-    return jsonify({'error': 'File too large. Maximum size is 16MB.'}), 413
+    limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+    return jsonify({'error': f'File too large. Maximum size is {limit_mb}MB.'}), 413
 
 @app.errorhandler(500)
 def internal_error(e):
     logger.error(f"Internal server error: {str(e)}")
     return jsonify({'error': 'Internal server error'}), 500
 
+@app.route('/progress/<task_id>/stream')
+def stream_progress(task_id):
+    store = job_store()
+
+    def events():
+        last_state = None
+        last_sent = time.time()
+        while True:
+            job = store.get(task_id)
+            if job is None:
+                yield f"event: missing\ndata: {json.dumps({'error': 'Unknown job'})}\n\n"
+                return
+            # updated moves with every write, details included (cache hit
+            # ratio, auction incumbent), not only percent and message ones.
+            state = (job['status'], job['updated'])
+            if state != last_state:
+                yield f"data: {json.dumps(job)}\n\n"
+                last_state = state
+                last_sent = time.time()
+            elif time.time() - last_sent > 15:
+                yield ": keep-alive\n\n"
+                last_sent = time.time()
+            if job['status'] in jobs.FINISHED:
+                return
+            time.sleep(app.config['PROGRESS_STREAM_INTERVAL'])
+
+    return Response(
+        stream_with_context(events()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
 @app.route('/progress/<task_id>')
 def get_progress(task_id):
-    progress = progress_tracker.get(task_id)
+    progress = job_store().get(task_id)
     if progress:
         return jsonify(progress)
-    return jsonify({'percent': 0, 'message': 'Starting...'})
\ No newline at end of file
+    return jsonify({'percent': 0, 'message': 'Starting...'})
+
+@app.route('/metrics')
+def metrics():
+    REGISTRY.configure(app.config['METRICS_DIR'], app.config['METRICS_TTL'])
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
\ No newline at end of file
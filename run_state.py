@@ -0,0 +1,71 @@
+import os
+import re
+import json
+import time
+import shutil
+import logging
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+# What an incremental run needs from the run before it: the roster it was
+# solved for, its distance matrix, the assignment and, once known, the dual
+# potentials. Each run is a directory of .npy files so the matrix can be
+# memory-mapped instead of read whole.
+class RunStateStore:
+    def __init__(self, directory, ttl=7 * 24 * 3600, keep=4):
+        self.directory = directory
+        self.ttl = ttl
+        self.keep = keep
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, run_id):
+        if not _ID_PATTERN.match(str(run_id)):
+            raise ValueError(f"Invalid run id: {run_id!r}")
+        return os.path.join(self.directory, run_id)
+
+    def put(self, run_id, arrays, meta):
+        if not self.keep:
+            return
+        path = self._path(run_id)
+        partial = f"{path}.{os.getpid()}.tmp"
+        shutil.rmtree(partial, ignore_errors=True)
+        os.makedirs(partial)
+        for name, values in arrays.items():
+            if values is not None:
+                np.save(os.path.join(partial, f"{name}.npy"), values, allow_pickle=False)
+        with open(os.path.join(partial, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(partial, path)
+        self.evict()
+
+    def get(self, run_id):
+        if not _ID_PATTERN.match(str(run_id)):
+            return None
+        path = self._path(run_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(os.path.join(path, 'meta.json')) as f:
+                state = {'meta': json.load(f)}
+            for entry in os.scandir(path):
+                if entry.name.endswith('.npy'):
+                    state[entry.name[:-4]] = np.load(entry.path, mmap_mode='r', allow_pickle=False)
+        except FileNotFoundError:
+            return None
+        return state
+
+    def evict(self):
+        cutoff = time.time() - self.ttl
+        runs = []
+        for entry in os.scandir(self.directory):
+            if entry.is_dir() and not entry.name.endswith('.tmp'):
+                runs.append((entry.stat().st_mtime, entry.path))
+        runs.sort(reverse=True)
+        for position, (modified, path) in enumerate(runs):
+            if position >= self.keep or modified < cutoff:
+                shutil.rmtree(path, ignore_errors=True)
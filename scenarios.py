@@ -0,0 +1,160 @@
+import logging
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+from constraints import CONSTRAINT_VAL, MIN_DRIVER_EXP
+from assignment import cost_components, assignment_blocks, solve_blocks
+from osrm_service import OSRMService
+from solver import find_changed_chains, route_summary
+from matrix import ROW_BLOCK, allocate_matrix
+
+logger = logging.getLogger(__name__)
+
+SCENARIO_FIELDS = ('name', 'min_driver_exp', 'depot_names', 'shared_depots', 'excluded_vehicles')
+COMPARISON_COLUMNS = [
+    'scenario', 'total_routes', 'original_dead_km', 'total_dead_km', 'total_minimized', 'dead_km_delta',
+    'total_swaps', 'inter_institute', 'intra_institute', 'chain_count', 'longest_chain',
+    'excluded_vehicles', 'stranded_routes'
+]
+
+
+def _string_list(value, label):
+    if not isinstance(value, list) or not all(isinstance(item, (str, int)) for item in value):
+        raise ValueError(f'{label} must be a list of names')
+    return [str(item) for item in value]
+
+
+def parse_scenarios(raw, max_scenarios=20):
+    # Each scenario is a rule set: experience thresholds merged over the
+    # defaults, a replacement depot list and sharing map, and vehicles that
+    # are held out of swapping (they keep their own route).
+    if not isinstance(raw, list) or not raw:
+        raise ValueError('scenarios must be a non-empty list')
+    if len(raw) > max_scenarios:
+        raise ValueError(f'At most {max_scenarios} scenarios per request')
+    scenarios = []
+    for i, item in enumerate(raw, 1):
+        if not isinstance(item, dict):
+            raise ValueError(f'Scenario {i} must be an object')
+        unknown = sorted(set(item) - set(SCENARIO_FIELDS))
+        if unknown:
+            raise ValueError(f"Scenario {i} has unknown fields: {', '.join(unknown)}")
+        scenario = {'name': str(item.get('name') or f'Scenario {i}'), 'rules': {}}
+        if item.get('min_driver_exp') is not None:
+            thresholds = item['min_driver_exp']
+            if not isinstance(thresholds, dict) or not all(
+                    isinstance(v, (int, float)) and not isinstance(v, bool) for v in thresholds.values()):
+                raise ValueError(f'Scenario {i}: min_driver_exp must map categories to years')
+            scenario['rules']['min_driver_exp'] = {**MIN_DRIVER_EXP, **{str(k): v for k, v in thresholds.items()}}
+        if item.get('depot_names') is not None:
+            scenario['rules']['depot_names'] = _string_list(item['depot_names'], f'Scenario {i}: depot_names')
+        if item.get('shared_depots') is not None:
+            shared = item['shared_depots']
+            if not isinstance(shared, dict):
+                raise ValueError(f'Scenario {i}: shared_depots must map depot names to institutes')
+            scenario['rules']['shared_depots'] = {
+                str(depot): _string_list(sites, f'Scenario {i}: shared_depots[{depot}]') for depot, sites in shared.items()
+            }
+        scenario['excluded_vehicles'] = _string_list(item.get('excluded_vehicles') or [], f'Scenario {i}: excluded_vehicles')
+        scenarios.append(scenario)
+    names = [scenario['name'] for scenario in scenarios]
+    if len(set(names)) != len(names):
+        raise ValueError('Scenario names must be unique')
+    return scenarios
+
+
+def evaluate_scenario(distance_matrix, driver_df, pickup_df, scenario, max_chain_length=None):
+    rules = scenario['rules']
+    if 'depot_names' in rules or 'shared_depots' in rules:
+        # The roster carries the default depot rules precomputed.
+        driver_df = driver_df.drop(columns=['is_depot', 'allowed_institutes'], errors='ignore')
+    pinned = driver_df.index.astype(str).isin(scenario['excluded_vehicles'])
+    # The matrix is shared by every scenario, so each masks its own float32 copy.
+    cost, problematic = OSRMService.dense_cost(
+        driver_df, pickup_df, distance_matrix, rules, pinned, out=allocate_matrix(distance_matrix.shape, None)
+    )
+    blocks = assignment_blocks(*cost_components(cost < CONSTRAINT_VAL))
+    if len(blocks) == 1:
+        optim_drivers, optim_pickups = linear_sum_assignment(cost)
+    else:
+        optim_drivers, optim_pickups, _ = solve_blocks(cost, blocks)
+    del cost
+
+    result_df = OSRMService.result_frame(
+        driver_df, pickup_df, optim_pickups, distance_matrix.diagonal().astype(float),
+        distance_matrix[optim_drivers, optim_pickups].astype(float)
+    )
+    chains = find_changed_chains(result_df['From Bus'].tolist(), result_df['To Bus'].tolist())
+    summary = route_summary(result_df, chains, max_chain_length)
+    summary['excluded_vehicles'] = int(pinned.sum())
+    summary['stranded_routes'] = int((problematic & ~pinned).sum())
+    return summary
+
+
+_shared = {}
+
+
+def _attach(name, shape, dtype, driver_df, pickup_df, max_chain_length):
+    # Pool initializer: every worker maps the one matrix instead of receiving a copy.
+    block = shared_memory.SharedMemory(name=name)
+    _shared.update(
+        block=block, matrix=np.ndarray(shape, dtype=dtype, buffer=block.buf),
+        driver_df=driver_df, pickup_df=pickup_df, max_chain_length=max_chain_length
+    )
+
+
+def _evaluate_shared(scenario):
+    return evaluate_scenario(
+        _shared['matrix'], _shared['driver_df'], _shared['pickup_df'], scenario, _shared['max_chain_length']
+    )
+
+
+def share_matrix(distance_matrix):
+    block = shared_memory.SharedMemory(create=True, size=max(distance_matrix.nbytes, 1))
+    shared = np.ndarray(distance_matrix.shape, dtype=distance_matrix.dtype, buffer=block.buf)
+    for start in range(0, len(distance_matrix), ROW_BLOCK):
+        shared[start:start + ROW_BLOCK] = distance_matrix[start:start + ROW_BLOCK]
+    return block
+
+
+def run_scenarios(distance_matrix, driver_df, pickup_df, scenarios, workers=1, max_chain_length=None, progress=None):
+    # One summary per scenario, in request order. With several workers the
+    # matrix is copied once into shared memory and each pool process maps it.
+    summaries = [None] * len(scenarios)
+    workers = min(workers, len(scenarios))
+    if workers <= 1:
+        for i, scenario in enumerate(scenarios):
+            summaries[i] = evaluate_scenario(distance_matrix, driver_df, pickup_df, scenario, max_chain_length)
+            if progress:
+                progress(i + 1, len(scenarios))
+        return summaries
+
+    logger.info(f"Evaluating {len(scenarios)} scenarios in {workers} processes over a shared {distance_matrix.shape} matrix")
+    block = share_matrix(distance_matrix)
+    pool = None
+    try:
+        pool = ProcessPoolExecutor(
+            max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=_attach,
+            initargs=(block.name, distance_matrix.shape, distance_matrix.dtype, driver_df, pickup_df, max_chain_length)
+        )
+        futures = {pool.submit(_evaluate_shared, scenario): i for i, scenario in enumerate(scenarios)}
+        for done, future in enumerate(as_completed(futures), 1):
+            summaries[futures[future]] = future.result()
+            if progress:
+                progress(done, len(scenarios))
+    finally:
+        if pool is not None:
+            pool.shutdown(cancel_futures=True)
+        block.close()
+        block.unlink()
+    return summaries
+
+
+def comparison_table(scenarios, summaries):
+    df = pd.DataFrame(summaries)
+    df.insert(0, 'scenario', [scenario['name'] for scenario in scenarios])
+    df['dead_km_delta'] = (df['total_dead_km'] - df['total_dead_km'].iloc[0]).round(2)
+    return df[COMPARISON_COLUMNS]
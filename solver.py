@@ -1,20 +1,17 @@
 import numpy as np
 import pandas as pd
 from scipy.optimize import linear_sum_assignment
+from assignment import auction_assignment
+from constraints import CONSTRAINT_VAL, MIN_DRIVER_EXP, feasibility_mask
 
-min_driver_exp={
-    'A+': 10,
-    'A': 0,
-    'B': 0,
-    'C': 0
-}
+min_driver_exp=MIN_DRIVER_EXP
 
-def run_deadkm_optimization(driver_data, pickup_data, distance_matrix):
+def run_deadkm_optimization(driver_data, pickup_data, distance_matrix, solver='dense', time_budget=None):
     driver_df=pd.DataFrame(driver_data)
     pickup_df=pd.DataFrame(pickup_data)
     distance_df=pd.DataFrame(distance_matrix)
 
-    optimized_df, insights, chains=optimize_routes(driver_df, pickup_df, distance_df)
+    optimized_df, insights, chains=optimize_routes(driver_df, pickup_df, distance_df, solver, time_budget)
 
     return {
         'assignments': optimized_df,
@@ -22,19 +19,20 @@ def run_deadkm_optimization(driver_data, pickup_data, distance_matrix):
         'swap_chains':chains
     }
 
-def optimize_routes(driver_df, pickup_df, distance_mat):
-    dist=distance_mat.copy()
-    for d in dist.index:
-        driver=driver_df.loc[d]
-        for p in dist.columns:
-            pickup=pickup_df.loc[p]
-            if driver['is_depot']:
-                if pickup['cname'] not in driver['allowed_institutes']:
-                    dist.at[d, p]=np.inf
-            if driver['dexp'] < min_driver_exp[pickup['category']]:
-                dist.at[d, p]=np.inf
-
-    optim_drivers, optim_pickups=linear_sum_assignment(dist.to_numpy())
+def optimize_routes(driver_df, pickup_df, distance_mat, solver='dense', time_budget=None):
+    feasible=feasibility_mask(driver_df.loc[distance_mat.index], pickup_df.loc[distance_mat.columns], min_driver_exp=min_driver_exp)
+    dist=pd.DataFrame(
+        np.where(feasible, distance_mat.to_numpy(dtype=float), np.inf),
+        index=distance_mat.index, columns=distance_mat.columns
+    )
+
+    if solver == 'auction':
+        # The auction needs finite costs; infeasible cells get the penalty.
+        optim_drivers, optim_pickups, _=auction_assignment(
+            np.where(feasible, dist.to_numpy(), CONSTRAINT_VAL), time_budget, penalty=CONSTRAINT_VAL
+        )
+    else:
+        optim_drivers, optim_pickups=linear_sum_assignment(dist.to_numpy())
     result_df=pd.DataFrame({
         'From Bus': dist.index[optim_drivers],
         'To Bus': dist.columns[optim_pickups]
@@ -49,52 +47,107 @@ def optimize_routes(driver_df, pickup_df, distance_mat):
     chains=find_changed_chains(result_df['From Bus'].tolist(), result_df['To Bus'].tolist())
     return result_df, insights, chains
 
-def find_changed_chains(from_buses, to_buses):
-    visited=set()
+def chain_positions(next_pos):
+    # next_pos[i] is the position whose vehicle takes over from position i,
+    # or -1 when it leaves the roster. Each position is walked at most once,
+    # so this is O(N); a cycle is returned closed ([c0, ..., ck-1, c0]) and
+    # starts at its lowest position.
+    next_pos=np.asarray(next_pos, dtype=np.int64)
+    visited=np.zeros(len(next_pos), dtype=bool)
+    visited[next_pos == np.arange(len(next_pos))]=True
+    visited=visited.tolist()
+    nxt=next_pos.tolist()
     chains=[]
-    for i, start in enumerate(from_buses):
-        if start in visited:
+    for i in range(len(nxt)):
+        if visited[i]:
             continue
-        chain=[start]
-        current=to_buses[i]
-        while current not in visited and current in from_buses:
+        chain=[i]
+        current=nxt[i]
+        while current >= 0 and not visited[current]:
             chain.append(current)
-            visited.add(current)
-            idx=from_buses.index(current)
-            current=to_buses[idx]
+            visited[current]=True
+            current=nxt[current]
         if len(chain) > 2:
             chains.append(chain)
-    print(chains)
     return chains
 
+def find_changed_chains(from_buses, to_buses):
+    from_buses=pd.Index(from_buses)
+    next_pos=from_buses.get_indexer(pd.Index(to_buses))
+    return [from_buses[chain].tolist() for chain in chain_positions(next_pos)]
+
+def chain_length(chain):
+    return len(chain) - 1 if len(chain) > 1 and chain[0] == chain[-1] else len(chain)
+
+def chain_stats(chains, max_chain_length=None):
+    lengths=np.array([chain_length(chain) for chain in chains], dtype=np.int64)
+    sizes, counts=np.unique(lengths, return_counts=True)
+    stats={
+        'chain_count': len(chains),
+        'longest_chain': int(lengths.max()) if len(lengths) else 0,
+        'chain_length_histogram': {str(size): int(count) for size, count in zip(sizes, counts)}
+    }
+    if max_chain_length:
+        stats['max_chain_length']=int(max_chain_length)
+        stats['chains_over_limit']=int((lengths > max_chain_length).sum())
+    return stats
+
+def route_summary(result_df, chains, max_chain_length=None):
+    total_routes =len(result_df)
+    total_dead_km =result_df['Optimized dead km'].sum()
+    original_dead_km =result_df['Original dead km'].sum()
+    total_minimized=(original_dead_km-total_dead_km)*2
+    total_swaps=sum(result_df['From Bus'] != result_df['To Bus'])
+    inter_institute=sum(
+        result_df['Driver Site'] != result_df['Pickup Site']
+    )
+    intra_institute= total_swaps - inter_institute
+    return {
+        'total_routes': total_routes,
+        'original_dead_km': round(original_dead_km, 2),
+        'total_dead_km': round(total_dead_km, 2),
+        'total_minimized': round(total_minimized, 2),
+        'total_swaps': total_swaps,
+        'inter_institute': inter_institute,
+        'intra_institute': intra_institute,
+        **chain_stats(chains, max_chain_length)
+    }
+
 def get_swap_details(chains, optimized_df, driver_df):
+    if not chains:
+        return pd.DataFrame()
+
+    lengths=np.array([len(chain) for chain in chains])
+    vehicles=pd.Index(np.concatenate([np.asarray(chain, dtype=object) for chain in chains]))
+    known=vehicles.isin(driver_df.index)
+    info=driver_df.reindex(vehicles)
+    routes=np.where(known, info['route'].astype(str), 'NA')
+    institutes=np.where(known, info['cname'].astype(str), 'NA')
+    bounds=np.cumsum(lengths)[:-1]
+
     output_rows=[]
-    totals_summary=[]
-
-    for i, chain in enumerate(chains, 1):
-        vehicles=chain
-        routes=[str(driver_df.loc[v, 'route']) if v in driver_df.index else 'NA' for v in vehicles]
-        institutes=[str(driver_df.loc[v, 'cname']) if v in driver_df.index else 'NA' for v in vehicles]
-        
-        row_chain=[f'Chain {i}'] + [''] * (len(vehicles) - 1)
-        row_vehicles=['Vehicles'] + vehicles
-        row_routes=['Routes'] + routes
-        row_institutes=['Institutes'] + institutes
-        
-        output_rows.extend([row_chain, row_vehicles, row_routes, row_institutes])
-        
-        mask=optimized_df['From Bus'].isin(vehicles)
-        total_opt_dead_km=optimized_df.loc[mask, 'Optimized dead km'].sum()
-        total_orig_dead_km=optimized_df.loc[mask, 'Original dead km'].sum()
-        totals_summary.append([
-            f'Chain {i}',
-            len(vehicles),
-            round(total_opt_dead_km, 2),
-            round(total_orig_dead_km, 2)
+    for i, (chain, chain_routes, chain_institutes) in enumerate(
+            zip(chains, np.split(routes, bounds), np.split(institutes, bounds)), 1):
+        output_rows.extend([
+            [f'Chain {i}'] + [''] * (len(chain) - 1),
+            ['Vehicles'] + list(chain),
+            ['Routes'] + chain_routes.tolist(),
+            ['Institutes'] + chain_institutes.tolist()
         ])
     output_rows.append(['']*max(len(r) for r in output_rows))
 
+    # Each vehicle counts once per chain, even where a cycle repeats its start.
+    members=pd.DataFrame({'chain': np.repeat(np.arange(len(chains)), lengths), 'From Bus': vehicles}).drop_duplicates()
+    totals=members.merge(
+        optimized_df[['From Bus', 'Optimized dead km', 'Original dead km']], on='From Bus'
+    ).groupby('chain')[['Optimized dead km', 'Original dead km']].sum().reindex(np.arange(len(chains)), fill_value=0)
+
     output_rows.append(['Swap Chain', 'Count', 'Optimized km', 'Original km'])
-    output_rows.extend(totals_summary)
+    output_rows.extend(
+        [f'Chain {i}', int(count), round(float(opt_km), 2), round(float(orig_km), 2)]
+        for i, count, opt_km, orig_km in zip(
+            range(1, len(chains) + 1), lengths, totals['Optimized dead km'], totals['Original dead km']
+        )
+    )
     output_df=pd.DataFrame(output_rows)
-    return output_df
\ No newline at end of file
+    return output_df
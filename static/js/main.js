@@ -1,4 +1,5 @@
-let currentData = null;
+let currentDatasetId = null;
+let lastRunId = null;
 let currentResults = null;
 
 document.addEventListener('DOMContentLoaded', () => {
@@ -26,6 +27,12 @@ function setupFileUpload() {
     fileInput.addEventListener('change', () => {
         showStatus('File selected. Click "Upload CSV File" to continue.', 'info');
     });
+
+    const matrixInput = document.getElementById('matrix-input');
+    matrixInput.addEventListener('change', () => {
+        const matrix = matrixInput.files[0];
+        document.getElementById('matrix-name').textContent = matrix ? matrix.name : '';
+    });
 }
 
 function uploadCSV() {
@@ -36,6 +43,8 @@ function uploadCSV() {
     const formData = new FormData();
     formData.append('file', file);
     formData.append('task_id', taskId); 
+    const matrix = document.getElementById('matrix-input').files[0];
+    if (matrix) formData.append('matrix', matrix);
 
     showStatus('Uploading CSV...', 'info');
 
@@ -46,9 +55,14 @@ function uploadCSV() {
         .then(res => res.json())
         .then(data => {
             if (data.success) {
-                currentData = data.full_data;
+                currentDatasetId = data.dataset_id;
                 showPreview(data.preview);
-                showStatus(`File uploaded successfully! ${data.row_count} rows loaded.`, 'success');
+                let message = `File uploaded successfully! ${data.row_count} rows loaded.`;
+                if (data.matrix) {
+                    message += ` Distance matrix imported: ${data.matrix.provided} distances given`;
+                    message += data.matrix.gaps ? `, ${data.matrix.gaps} gaps will be routed.` : '.';
+                }
+                showStatus(message, 'success');
             } else {
                 showStatus(data.error, 'error');
             }
@@ -88,7 +102,7 @@ function processPastedData() {
         .then(res => res.json())
         .then(data => {
             if (data.success) {
-                currentData = data.full_data;
+                currentDatasetId = data.dataset_id;
                 showPreview(data.preview);
                 showStatus(`Pasted data processed. ${data.row_count} rows loaded.`, 'success');
             } else {
@@ -103,58 +117,67 @@ function processPastedData() {
 
 // calculating distances
 async function calculateDistances() {
-    if (!currentData) return showStatus('No data loaded.', 'error');
+    if (!currentDatasetId) return showStatus('No data loaded.', 'error');
 
     const modal = document.getElementById('progressModal');
     modal.classList.remove('hidden');
     modal.classList.add('show');
 
     const taskId = generateUUID();
-    pollProgress(taskId);
+    let doneMessage = 'Distance calculation complete.';
+    let doneType = 'success';
 
     const payload = {
         task_id: taskId,
-        data: currentData.map(row => ({
-            'Vehicle Number': row[0],
-            'Institute': row[1],
-            'Category': row[2],
-            'Route Number': row[3],
-            'Driver Employee ID': row[4],
-            'Licensed Experience (years)': row[5],
-            'Driver pt Latitude': row[6],
-            'Driver pt Longitude': row[7],
-            'Driver pt Name': row[8],
-            '1st Pickup pt Latitude': row[9],
-            '1st Pickup pt Longitude': row[10],
-            '1st Pickup pt Name': row[11]
-        }))
+        dataset_id: currentDatasetId,
+        baseline: lastRunId
     };
 
     try {
-        const res = await fetch('/calculate', {
+        const queued = await fetch('/calculate', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
             body: JSON.stringify(payload)
         });
 
+        if (!queued.ok) {
+            const text = await queued.text(); 
+            throw new Error(`HTTP ${queued.status}: ${text}`);
+        }
+
+        const job = await pollProgress(taskId);
+        if (job.status !== 'done') {
+            throw new Error(job.error || job.message || 'Calculation failed.');
+        }
+
+        const res = await fetch(`/jobs/${taskId}/result`);
         if (!res.ok) {
-            const text = await res.text(); 
+            const text = await res.text();
             throw new Error(`HTTP ${res.status}: ${text}`);
         }
 
         const data = await res.json();
 
         if (data.success) {
-            currentResults = data.results;
+            lastRunId = taskId;
+            currentResults = tableRecords(data.results);
             currentChains = data.chains || [];
-            currentChainsDetails = data.swap_details || []; 
+            currentChainsDetails = data.swap_details; 
 
-            showOptimizedAssignments(data.results);
+            showOptimizedAssignments(currentResults);
             updateInsightsDashboard(data.summary);
             showSwapChains(data.chains || []);
-            showSwapDetails(data.swap_details || []);
+            showSwapDetails(data.swap_details);
+            loadRemainingResults(taskId, data.results);
 
             document.getElementById('download-csv').style.display = 'inline-block';
+
+            const cells = data.distance_cells;
+            if (cells && cells.estimated) {
+                // OSRM was unreachable or out of time; say so rather than presenting estimates as road distances.
+                doneMessage = `Calculation complete, but ${cells.estimated} of ${cells.real + cells.estimated + cells.missing + cells.reused} distances are straight-line estimates (${cells.osrm_unavailable || 'OSRM unavailable'}).`;
+                doneType = 'error';
+            }
         } else {
             showStatus(data.error || 'Calculation failed.', 'error');
         }
@@ -167,7 +190,7 @@ async function calculateDistances() {
             updateProgress(0, '');
             
             document.getElementById('stats-sec').scrollIntoView({ behavior: 'smooth' });
-            showStatus('Distance calculation complete.', 'success'); 
+            showStatus(doneMessage, doneType); 
         }, 1500);
     }
 }
@@ -178,11 +201,40 @@ let currentPollInterval = null;
 let driverList = []; 
 let pickupList = [];   
 
-function showOptimizedAssignments(assignments) {
+// Result tables arrive column-oriented: {columns: [...], data: [[...], ...]}
+// with one array of values per column.
+function tableRows(table) {
+  if (!table || !table.data || !table.data.length) return [];
+  return table.data[0].map((_, i) => table.data.map((values) => values[i]));
+}
+
+function tableRecords(table) {
+  return tableRows(table).map((row) => Object.fromEntries(table.columns.map((col, i) => [col, row[i]])));
+}
+
+// The first page comes with the summary; the rest is appended as it arrives.
+async function loadRemainingResults(runId, page, path = `/jobs/${encodeURIComponent(runId)}/results`) {
+  let offset = page.offset + (page.data[0]?.length || 0);
+  while (offset < page.total && lastRunId === runId) {
+    const res = await fetch(`${path}?offset=${offset}&limit=${page.limit}`);
+    if (!res.ok) {
+      console.error('Loading results failed:', res.status);
+      return;
+    }
+    const next = await res.json();
+    if (lastRunId !== runId || !next.data.length || !next.data[0].length) return;
+    const rows = tableRecords(next);
+    currentResults.push(...rows);
+    showOptimizedAssignments(rows, true);
+    offset += rows.length;
+  }
+}
+
+function showOptimizedAssignments(assignments, append = false) {
   const section = document.getElementById('results-section');
   const table = document.getElementById('results-table');
   section.style.display = 'block';
-  table.innerHTML = '';
+  if (!append) table.innerHTML = '';
 
   const columns = [
     'From Bus', 'Driver Site','Category', 'Driver pt lat', 'Driver pt long',
@@ -192,6 +244,12 @@ function showOptimizedAssignments(assignments) {
     'Original dead km', 'Optimized dead km'
   ];
 
+  let tbody = table.querySelector('tbody');
+  if (append && tbody) {
+    appendAssignmentRows(tbody, assignments, columns);
+    return;
+  }
+
   const thead = document.createElement('thead');
   const headRow = document.createElement('tr');
   columns.forEach(col => {
@@ -202,7 +260,12 @@ function showOptimizedAssignments(assignments) {
   thead.appendChild(headRow);
   table.appendChild(thead);
 
-  const tbody = document.createElement('tbody');
+  tbody = document.createElement('tbody');
+  appendAssignmentRows(tbody, assignments, columns);
+  table.appendChild(tbody);
+}
+
+function appendAssignmentRows(tbody, assignments, columns) {
   assignments.forEach(row => {
     const tr = document.createElement('tr');
     columns.forEach(col => {
@@ -212,32 +275,80 @@ function showOptimizedAssignments(assignments) {
     });
     tbody.appendChild(tr);
   });
-  table.appendChild(tbody);
+}
+
+// Stored plans are read back from the run history without re-optimizing.
+let historyPage = { offset: 0, limit: 20, total: 0 };
+
+async function loadHistory(offset = 0) {
+  const filter = document.getElementById('history-filter').value.trim();
+  const params = new URLSearchParams({ offset: Math.max(0, offset), limit: historyPage.limit });
+  if (filter) params.set(document.getElementById('history-filter-by').value, filter);
+  const res = await fetch(`/history?${params}`);
+  const data = await res.json();
+  if (!res.ok) return showStatus(data.error || 'Could not load the run history.', 'error');
+  historyPage = { offset: data.offset, limit: data.limit, total: data.total };
+
+  const table = document.getElementById('history-table');
+  table.innerHTML = '';
+  if (!data.runs.length) {
+    table.innerHTML = '<tr><td>No stored runs</td></tr>';
+  } else {
+    const columns = ['created', 'solver', 'total_routes', 'original_dead_km', 'total_dead_km', 'total_swaps', 'chain_count'];
+    const headRow = table.createTHead().insertRow();
+    ['Run date', 'Solver', 'Routes', 'Original dead km', 'Optimized dead km', 'Swaps', 'Chains', ''].forEach(label => {
+      const th = document.createElement('th');
+      th.textContent = label;
+      headRow.appendChild(th);
+    });
+    const tbody = table.createTBody();
+    data.runs.forEach(run => {
+      const tr = tbody.insertRow();
+      columns.forEach(col => {
+        tr.insertCell().textContent = col === 'created' ? new Date(run.created).toLocaleString() : (run[col] ?? '—');
+      });
+      const open = document.createElement('a');
+      open.className = 'app-btn';
+      open.textContent = 'Open';
+      open.addEventListener('click', () => openHistoryRun(run.run_id));
+      tr.insertCell().appendChild(open);
+    });
+  }
+  document.getElementById('history-prev').style.display = data.offset > 0 ? 'inline-block' : 'none';
+  document.getElementById('history-next').style.display = data.offset + data.limit < data.total ? 'inline-block' : 'none';
+}
+
+async function openHistoryRun(runId) {
+  const res = await fetch(`/history/${encodeURIComponent(runId)}`);
+  const data = await res.json();
+  if (!res.ok) return showStatus(data.error || 'Could not load the run.', 'error');
+
+  lastRunId = runId;
+  currentResults = tableRecords(data.results);
+  showOptimizedAssignments(currentResults);
+  updateInsightsDashboard(data.summary);
+  showSwapChains(data.chains || []);
+  showSwapDetails(data.swap_details);
+  document.getElementById('download-csv').style.display = 'inline-block';
+  loadRemainingResults(runId, data.results, `/history/${encodeURIComponent(runId)}/assignments`);
+  document.getElementById('stats-sec').scrollIntoView({ behavior: 'smooth' });
+  showStatus(`Showing the stored plan from ${new Date(data.run.created).toLocaleString()}.`, 'success');
+}
+
+// Exports are built server-side from the stored run, so nothing is uploaded back.
+function downloadExport(table, format) {
+  if (!lastRunId) return showStatus('No results to export.', 'error');
+
+  const link = document.createElement('a');
+  link.href = `/export/${encodeURIComponent(lastRunId)}?table=${table}&format=${format}`;
+  document.body.appendChild(link);
+  link.click();
+  document.body.removeChild(link);
 }
 
 document.getElementById('download-csv').addEventListener('click', () => {
   if (!currentResults) return;
-
-  fetch('/export/optimized', {
-    method: 'POST',
-    headers: { 'Content-Type': 'application/json' },
-    body: JSON.stringify(currentResults)
-  })
-  .then(res => res.blob())
-  .then(blob => {
-    const url = window.URL.createObjectURL(blob);
-    const link = document.createElement('a');
-    link.href = url;
-    link.download = 'optimized_assignments.csv';
-    document.body.appendChild(link);
-    link.click();
-    document.body.removeChild(link);
-    window.URL.revokeObjectURL(url);
-  })
-  .catch(err => {
-    console.error('Export failed:', err);
-    showStatus('Export failed.', 'error');
-  });
+  downloadExport('results', 'csv');
 });
 
 function updateInsightsDashboard(insights) {
@@ -266,13 +377,12 @@ function showSwapDetails(data) {
   const table=document.getElementById("swap-details-table");
   table.innerHTML= "";
 
-  if (!data || !data.length) {
+  const rows = tableRows(data);
+  if (!rows.length) {
     table.innerHTML="<tr><td>No swap details available</td></tr>";
     return;
   }
 
-  const rows = data.map((obj) => Object.values(obj));
-
   let headers=rows[0];
   if (headers.every((h) => typeof h === "string" && h.trim() !== "")) {
     rows.shift(); 
@@ -301,72 +411,80 @@ function showSwapDetails(data) {
 
 function exportResultsXLSX() {
     if (!currentResults) return showStatus('No results to export.', 'error');
-
-    const url = `/export/xlsx?data=${encodeURIComponent(JSON.stringify(currentResults))}`;
-    const link = document.createElement('a');
-    link.href = url;
-    link.download = 'distance_results.xlsx';
-    document.body.appendChild(link);
-    link.click();
-    document.body.removeChild(link);
-
-    showStatus('Results exported successfully as XLSX!', 'success');
+    downloadExport('results', 'xlsx');
 }
 
 function exportSwapDetails() {
     if (!currentChainsDetails) {
         return showStatus("No swap details to export.", "error");
     }
-
-    console.log("Sending swap details:", currentChainsDetails); // DEBUG
-
-    fetch("/export/swap-details", {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify({ swap_details: currentChainsDetails }),
-    })
-    .then((res) => {
-        if (!res.ok) throw new Error("Download failed");
-        return res.blob();
-    })
-    .then((blob) => {
-        const link = document.createElement("a");
-        link.href = URL.createObjectURL(blob);
-        link.download = "swap_details.csv";
-        link.click();
-    })
-    .catch((err) => {
-        console.error("Export swap details error:", err);
-        showStatus("Failed to export swap details.", "error");
-    });
+    downloadExport('swap_details', 'csv');
 }
 
 
 function pollProgress(taskId) {
-    if (currentPollInterval) {
-        console.log('Clearing old polling loop');
-        clearInterval(currentPollInterval);
+    if (!window.EventSource) {
+        return pollProgressInterval(taskId);
     }
 
-    currentPollInterval = setInterval(async () => {
-        try {
-            const res = await fetch(`/progress/${taskId}`);
-            const data = await res.json();
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(`/progress/${taskId}/stream`);
+        source.onmessage = (event) => {
+            const data = JSON.parse(event.data);
 
             if (data.percent != null) {
                 updateProgress(data.percent, data.message || `${data.percent}% complete`);
             }
 
-            if (data.percent >= 100) {
+            if (['done', 'failed', 'cancelled'].includes(data.status)) {
+                source.close();
+                resolve(data);
+            }
+        };
+
+        source.addEventListener('missing', () => {
+            source.close();
+            reject(new Error('Unknown job'));
+        });
+
+        source.onerror = () => {
+            // Fall back to polling if the stream drops (e.g. a proxy closed it).
+            console.warn('Progress stream interrupted, falling back to polling');
+            source.close();
+            pollProgressInterval(taskId).then(resolve, reject);
+        };
+    });
+}
+
+function pollProgressInterval(taskId) {
+    if (currentPollInterval) {
+        console.log('Clearing old polling loop');
+        clearInterval(currentPollInterval);
+    }
+
+    return new Promise((resolve, reject) => {
+        currentPollInterval = setInterval(async () => {
+            try {
+                const res = await fetch(`/progress/${taskId}`);
+                const data = await res.json();
+
+                if (data.percent != null) {
+                    updateProgress(data.percent, data.message || `${data.percent}% complete`);
+                }
+
+                if (['done', 'failed', 'cancelled'].includes(data.status)) {
+                    clearInterval(currentPollInterval);
+                    currentPollInterval = null;
+                    resolve(data);
+                }
+            } catch (err) {
+                console.warn('Progress polling error:', err);
                 clearInterval(currentPollInterval);
                 currentPollInterval = null;
+                reject(err);
             }
-        } catch (err) {
-            console.warn('Progress polling error:', err);
-            clearInterval(currentPollInterval);
-            currentPollInterval = null;
-        }
-    }, 1000);
+        }, 1000);
+    });
 }
 
 // =======================
@@ -602,15 +720,7 @@ function showResults(data) {
 // =======================
 function exportResults() {
     if (!currentResults) return showStatus('No results to export.', 'error');
-
-    const url = `/export/csv?data=${encodeURIComponent(JSON.stringify(currentResults))}`;
-    const link = document.createElement('a');
-    link.href = url;
-    link.download = 'distance_results.csv';
-    document.body.appendChild(link);
-    link.click();
-    document.body.removeChild(link);
-
+    downloadExport('results', 'csv');
     showStatus('Results exported successfully!', 'success');
 }
 
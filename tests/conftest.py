@@ -0,0 +1,55 @@
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+
+@pytest.fixture
+def service_config():
+    # Config as a plain dict, the way job workers pass it, with nothing
+    # written to disk.
+    config = {key: getattr(Config, key) for key in dir(Config) if key.isupper()}
+    config.update({
+        'RUN_STATE_DIR': None,
+        'METRICS_DIR': None,
+        'DISTANCE_CACHE_PATH': None,
+        'OSRM_RETRY_BACKOFF': 0,
+        'OSRM_RETRY_MAX_BACKOFF': 0
+    })
+    return config
+
+
+@pytest.fixture
+def make_roster():
+    # Roster CSV frames: some drivers start at depots, pickups share stops.
+    def make(n, seed=0):
+        rng = np.random.default_rng(seed)
+        depots = {'MAHE': (13.35, 77.1), 'Depot X': (13.2, 77.3)}
+        names = np.where(rng.random(n) < 0.3, rng.choice(list(depots), n), np.array([f'D{i}' for i in range(n)]))
+        dlat = 13 + rng.uniform(0, 0.5, n)
+        dlon = 77 + rng.uniform(0, 0.5, n)
+        for name, (lat, lon) in depots.items():
+            dlat[names == name], dlon[names == name] = lat, lon
+        stops = np.column_stack([13 + rng.uniform(0, 0.5, n // 3 + 1), 77 + rng.uniform(0, 0.5, n // 3 + 1)])
+        pickups = stops[rng.integers(0, len(stops), n)]
+        return pd.DataFrame({
+            'Vehicle Number': [f'V{i:04d}' for i in range(n)],
+            'Institute': rng.choice(['MAHE', 'Inst B', 'Inst C', 'Amara Jyothi Public School'], n),
+            'Category': rng.choice(['A+', 'A', 'B', 'C'], n),
+            'Route Number': rng.integers(1, 100, n),
+            'Driver Employee ID': [f'E{i}' for i in range(n)],
+            'Licensed Experience (years)': rng.uniform(0, 20, n).round(1),
+            'Driver pt Latitude': dlat,
+            'Driver pt Longitude': dlon,
+            'Driver pt Name': names,
+            '1st Pickup pt Latitude': pickups[:, 0],
+            '1st Pickup pt Longitude': pickups[:, 1],
+            '1st Pickup pt Name': [f'P{i}' for i in range(n)]
+        })
+    return make
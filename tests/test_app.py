@@ -0,0 +1,117 @@
+import io
+import json
+import time
+
+import pandas as pd
+import pytest
+
+import jobs
+from app import app
+from jobs import JobStore
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    for key, value in {
+        'JOB_DB_PATH': str(tmp_path / 'jobs.sqlite3'),
+        'DATASET_DIR': str(tmp_path / 'datasets'),
+        'METRICS_DIR': None,
+        'DISTANCE_CACHE_PATH': str(tmp_path / 'distances.sqlite3'),
+        'JOB_WORKERS': 1
+    }.items():
+        monkeypatch.setitem(app.config, key, value)
+    yield app.test_client()
+    if jobs._executor is not None:
+        jobs._executor.shutdown()
+        jobs._executor = None
+
+
+def upload(client, df):
+    response = client.post('/upload', data={'file': (io.BytesIO(df.to_csv(index=False).encode()), 'roster.csv')},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['dataset_id']
+
+
+def wait(client, task_id, timeout=120):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f'/jobs/{task_id}').get_json()
+        if job['status'] in jobs.FINISHED:
+            return job
+        time.sleep(0.2)
+    pytest.fail(f'Job {task_id} did not finish within {timeout}s')
+
+
+def assignments(result):
+    return pd.DataFrame(dict(zip(result['results']['columns'], result['results']['data'])))
+
+
+def test_upload_calculate_result(client, make_roster):
+    # Estimate mode needs no routing server.
+    dataset_id = upload(client, make_roster(30))
+    response = client.post('/calculate', json={'task_id': 'run1', 'dataset_id': dataset_id, 'distance_mode': 'estimate'})
+    assert response.status_code == 202
+    job = wait(client, 'run1')
+    assert job['status'] == jobs.DONE, job
+
+    result = json.loads(client.get('/jobs/run1/result').data)
+    summary = result['summary']
+    assert summary['total_routes'] == 30
+    assert summary['total_dead_km'] <= summary['original_dead_km']
+    table = assignments(result)
+    assert sorted(table['To Bus']) == sorted(table['From Bus'])
+
+
+def test_unknown_dataset(client):
+    response = client.post('/calculate', json={'dataset_id': 'expired'})
+    assert response.status_code == 404
+    assert client.post('/calculate', json={'dataset_id': '../etc'}).status_code == 404
+
+
+def test_unknown_job(client):
+    assert client.get('/jobs/nope').status_code == 404
+    assert client.get('/jobs/nope/result').status_code == 404
+
+
+def test_progress_stream_sends_detail_changes(client, monkeypatch):
+    monkeypatch.setitem(app.config, 'PROGRESS_STREAM_INTERVAL', 0.01)
+    store = JobStore(app.config['JOB_DB_PATH'])
+    store.create('watched')
+    store.start('watched')
+    store.progress('watched', 40, 'Fetching road distances', stage='matrix', details={'cache_hit_ratio': 0.25})
+    events = (json.loads(chunk[len(b'data: '):]) for chunk in client.get('/progress/watched/stream').response
+              if chunk.startswith(b'data: '))
+    assert next(events)['details'] == {'cache_hit_ratio': 0.25}
+
+    # Another worker's store reports the same percent and message with a new ratio.
+    JobStore(app.config['JOB_DB_PATH']).progress(
+        'watched', 40, 'Fetching road distances', stage='matrix', details={'cache_hit_ratio': 0.5}
+    )
+    assert next(events)['details'] == {'cache_hit_ratio': 0.5}
+    store.finish('watched', {})
+    assert next(events)['status'] == jobs.DONE
+
+@pytest.mark.parametrize('path, body', [
+    ('/calculate', {'solver': 'greedy'}),
+    ('/calculate', {'distance_mode': 'road'}),
+    ('/scenarios', {'distance_mode': 'road', 'scenarios': [{'name': 'as is'}]})
+])
+def test_bad_options_are_rejected(client, make_roster, path, body):
+    response = client.post(path, json={'dataset_id': upload(client, make_roster(5)), **body})
+    assert response.status_code == 400
+    assert 'Unknown' in response.get_json()['error']
+
+
+def test_export_of_a_table_the_run_lacks(client):
+    store = JobStore(app.config['JOB_DB_PATH'])
+    store.create('compare')
+    store.start('compare')
+    store.finish('compare', {'scenarios': {'columns': ['scenario', 'total_dead_km'], 'data': [['default'], [12.5]]}})
+
+    response = client.get('/export/compare?table=results')
+    assert response.status_code == 404
+    assert response.get_json()['tables'] == ['scenarios']
+    response = client.get('/export/compare?table=scenarios')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).splitlines() == ['scenario,total_dead_km', 'default,12.5']
@@ -0,0 +1,141 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+
+from assignment import assignment_blocks, auction_assignment, cost_components, solve_blocks
+from constraints import CONSTRAINT_VAL, allowed_institutes
+from geo import haversine_matrix
+from osrm_service import OSRMService
+from solver import optimize_routes
+
+
+def optimum(cost):
+    rows, cols = linear_sum_assignment(cost)
+    return cost[rows, cols].sum()
+
+
+def block_cost(n, seed):
+    # Feasible cells only inside a few groups of rows and columns, some of
+    # them with more rows than columns, and a handful of rows with none.
+    rng = np.random.default_rng(seed)
+    cost = np.full((n, n), float(CONSTRAINT_VAL))
+    row_group = rng.integers(0, 4, n)
+    col_group = rng.integers(0, 4, n)
+    same = (row_group[:, None] == col_group[None, :]) & (rng.random((n, n)) < 0.6)
+    same[rng.random(n) < 0.1] = False
+    cost[same] = rng.uniform(0, 50, same.sum())
+    return cost
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_components_match_scipy(seed):
+    finite = block_cost(40, seed) < CONSTRAINT_VAL
+    row_labels, col_labels = cost_components(finite, chunk_rows=7)
+    graph = csr_matrix(np.block([[np.zeros((40, 40)), finite], [finite.T, np.zeros((40, 40))]]))
+    _, expected = connected_components(graph, directed=False)
+    labels = np.concatenate([row_labels, col_labels])
+    # Same partition: the labels map one to one.
+    pairs = set(zip(labels.tolist(), expected.tolist()))
+    assert len(pairs) == len(set(labels.tolist())) == len(set(expected.tolist()))
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_blocks_match_exact_assignment(workers):
+    cost = block_cost(60, 0)
+    blocks = assignment_blocks(*cost_components(cost < CONSTRAINT_VAL))
+    assert len(blocks) > 1
+    rows, cols, pooled = solve_blocks(cost, blocks, workers=workers, parallel_min_rows=5)
+    assert np.array_equal(rows, np.arange(60)) and sorted(cols) == list(range(60))
+    assert cost[rows, cols].sum() == pytest.approx(optimum(cost))
+    assert (pooled > 0) == (workers > 1)
+
+
+@pytest.mark.parametrize('n, seed', [(1, 0), (5, 1), (20, 2), (60, 3)])
+def test_auction_matches_exact_assignment(n, seed):
+    rng = np.random.default_rng(seed)
+    cost = rng.uniform(0, 50, (n, n))
+    penalty = rng.random((n, n)) < 0.3
+    np.fill_diagonal(penalty, False)
+    cost[penalty] = CONSTRAINT_VAL
+    _, col_of_row, report = auction_assignment(cost, min_epsilon=1e-3, penalty=CONSTRAINT_VAL)
+    assert sorted(col_of_row) == list(range(n))
+    assert cost[np.arange(n), col_of_row].sum() == pytest.approx(optimum(cost), abs=n * 1e-3)
+    assert report['lower_bound'] <= optimum(cost) + 1e-6
+
+
+
+def test_optimize_routes_auction_matches_dense(make_roster):
+    driver_df, pickup_df = frames(make_roster(30, 4))
+    distance = pd.DataFrame(haversine_matrix(driver_df[['dlat', 'dlon']].to_numpy(), pickup_df[['plat', 'plon']].to_numpy()),
+                            index=driver_df.index, columns=pickup_df.index)
+    dense, _, _ = optimize_routes(driver_df, pickup_df, distance)
+    auction, _, _ = optimize_routes(driver_df, pickup_df, distance, solver='auction', time_budget=5)
+    assert sorted(auction['To Bus']) == sorted(dense['To Bus'])
+    assert auction['Dead KM'].sum() == pytest.approx(dense['Dead KM'].sum(), abs=30 * 1e-3)
+
+def frames(df):
+    # Driver and pickup frames as optimize_routes_vrp builds them.
+    driver_df = df[['Vehicle Number', 'Route Number', 'Driver pt Latitude', 'Driver pt Longitude', 'Driver pt Name',
+                    'Institute', 'Licensed Experience (years)', 'Category']].set_axis(
+        ['bus', 'route', 'dlat', 'dlon', 'dname', 'cname', 'dexp', 'category'], axis=1).set_index('bus')
+    pickup_df = df[['Vehicle Number', 'Route Number', '1st Pickup pt Latitude', '1st Pickup pt Longitude',
+                    '1st Pickup pt Name', 'Institute', 'Category']].set_axis(
+        ['bus', 'route', 'plat', 'plon', 'pname', 'cname', 'category'], axis=1).set_index('bus')
+    driver_df['is_depot'], driver_df['allowed_institutes'] = allowed_institutes(driver_df)
+    return driver_df, pickup_df
+
+
+@pytest.fixture
+def service(service_config, tmp_path, monkeypatch):
+    # Great-circle distance with a detour factor stands in for OSRM.
+    monkeypatch.setattr(OSRMService, 'osrm_table', lambda self, sources, destinations:
+                        haversine_matrix(np.asarray(sources), np.asarray(destinations)) * 1.3)
+    service_config['RUN_STATE_DIR'] = str(tmp_path / 'runs')
+    return OSRMService(service_config)
+
+
+def assigned_cost(service, driver_df, pickup_df, rows, cols):
+    cost, _ = service.dense_cost(driver_df, pickup_df, service.solved_state['matrix'])
+    return cost[rows, cols].sum(), optimum(cost)
+
+
+@pytest.mark.parametrize('solver', ['dense', 'auction'])
+@pytest.mark.parametrize('n, seed', [(8, 0), (40, 1)])
+def test_dense_solvers_match_exact_assignment(service, make_roster, solver, n, seed):
+    driver_df, pickup_df = frames(make_roster(n, seed))
+    rows, cols, *_ = service.solve_dense(driver_df, pickup_df, solver=solver)
+    total, best = assigned_cost(service, driver_df, pickup_df, rows, cols)
+    assert total == pytest.approx(best, abs=n * service.auction_epsilon)
+
+
+
+def test_dense_cost_masks_the_distance_matrix_in_place(make_roster):
+    driver_df, pickup_df = frames(make_roster(30, 5))
+    distance = haversine_matrix(driver_df[['dlat', 'dlon']].to_numpy(), pickup_df[['plat', 'plon']].to_numpy())
+    distance = distance.astype(np.float32)
+    kept = distance.copy()
+    copy, _ = OSRMService.dense_cost(driver_df, pickup_df, distance, out=np.empty_like(distance))
+    assert np.array_equal(distance, kept)
+
+    cost, _ = OSRMService.dense_cost(driver_df, pickup_df, distance)
+    assert cost is distance and cost.dtype == np.float32
+    assert np.array_equal(cost, copy) and (cost == CONSTRAINT_VAL).any()
+
+def test_incremental_repair_matches_exact_assignment(service, make_roster):
+    df = make_roster(40, 2)
+    first = service.optimize_routes_vrp(df, task_id='first')
+    assert first['solver']['mode'] == 'dense'
+
+    changed = df.copy()
+    changed.loc[3, 'Driver pt Latitude'] += 0.01
+    changed.loc[7, '1st Pickup pt Longitude'] -= 0.02
+    changed.loc[9, 'Licensed Experience (years)'] = 15
+    changed = changed.drop(index=11).reset_index(drop=True)
+    driver_df, pickup_df = frames(changed)
+    rows, cols, _, _, report = service.solve_incremental(driver_df, pickup_df, 'first')
+    assert report['mode'] == 'incremental' and report['changed_routes'] == 3
+    total, best = assigned_cost(service, driver_df, pickup_df, rows, cols)
+    assert total == pytest.approx(best)
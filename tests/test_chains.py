@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from solver import chain_positions, chain_stats, find_changed_chains
+
+
+def list_scan_chains(from_buses, to_buses):
+    # The chain finder the optimizer used before chain_positions.
+    visited = set()
+    chains = []
+    for i, start in enumerate(from_buses):
+        if start in visited:
+            continue
+        chain = [start]
+        current = to_buses[i]
+        while current not in visited and current in from_buses:
+            chain.append(current)
+            visited.add(current)
+            current = to_buses[from_buses.index(current)]
+        if len(chain) > 2:
+            chains.append(chain)
+    return chains
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_chains_match_list_scan(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 60))
+    buses = [f'B{i}' for i in rng.permutation(200)[:n]]
+    order = np.arange(n)
+    moved = rng.choice(n, int(rng.integers(0, n + 1)), replace=False)
+    order[moved] = order[rng.permutation(moved)]
+    to_buses = [buses[j] for j in order]
+    if seed % 3 == 0:
+        # Some vehicles hand over to one outside the roster.
+        for j in rng.choice(n, min(n, 2), replace=False):
+            to_buses[j] = f'X{j}'
+
+    expected = list_scan_chains(buses, to_buses)
+    assert find_changed_chains(buses, to_buses) == expected
+    position = {bus: i for i, bus in enumerate(buses)}
+    next_pos = [position.get(bus, -1) for bus in to_buses]
+    assert [[buses[i] for i in chain] for chain in chain_positions(next_pos)] == expected
+
+
+def test_chain_stats_count_cycles_once():
+    chains = [['A', 'B', 'C', 'A'], ['D', 'E', 'F', 'G'], ['H', 'I', 'J', 'K', 'L', 'H']]
+    assert chain_stats(chains, max_chain_length=4) == {
+        'chain_count': 3,
+        'longest_chain': 5,
+        'chain_length_histogram': {'3': 1, '4': 1, '5': 1},
+        'max_chain_length': 4,
+        'chains_over_limit': 1
+    }
@@ -0,0 +1,77 @@
+import numpy as np
+import pandas as pd
+
+import constraints
+from constraints import MIN_DRIVER_EXP, allowed_institutes, feasibility_blocks, feasibility_mask, feasible_pairs
+
+INSTITUTES = ['MAHE', 'Amara Jyothi Public School', 'Edify', 'Vidya']
+
+
+def roster(n, seed):
+    rng = np.random.default_rng(seed)
+    dexp = rng.uniform(0, 20, n)
+    dexp[rng.random(n) < 0.2] = np.nan
+    index = [f'KA{i:04d}' for i in range(n)]
+    driver_df = pd.DataFrame({
+        'dname': rng.choice(INSTITUTES, n),
+        'cname': rng.choice(INSTITUTES, n),
+        'dexp': dexp
+    }, index=index)
+    pickup_df = pd.DataFrame({
+        'cname': rng.choice(INSTITUTES, n),
+        'category': rng.choice(sorted(MIN_DRIVER_EXP), n)
+    }, index=index)
+    return driver_df, pickup_df
+
+
+def per_pair_mask(driver_df, pickup_df, min_driver_exp=MIN_DRIVER_EXP):
+    # The rules pair by pair, as the optimizer applied them before masks.
+    is_depot, allowed = allowed_institutes(driver_df)
+    mask = np.ones((len(driver_df), len(pickup_df)), dtype=bool)
+    for i, (dbus, drow) in enumerate(driver_df.iterrows()):
+        for j, (pbus, prow) in enumerate(pickup_df.iterrows()):
+            if is_depot[dbus] and prow['cname'] not in allowed[dbus]:
+                mask[i, j] = False
+            if float(drow['dexp']) < float(min_driver_exp.get(prow['category'], 0)):
+                mask[i, j] = False
+    return mask
+
+
+def test_mask_matches_per_pair_rules():
+    driver_df, pickup_df = roster(60, 0)
+    expected = per_pair_mask(driver_df, pickup_df)
+    assert np.array_equal(feasibility_mask(driver_df, pickup_df), expected)
+    assert np.array_equal(np.vstack([mask for _, mask in feasibility_blocks(driver_df, pickup_df, block_rows=7)]), expected)
+    rows, cols = np.nonzero(np.ones_like(expected))
+    assert np.array_equal(feasible_pairs(driver_df, pickup_df, rows, cols), expected[rows, cols])
+
+
+def test_rule_overrides_and_cache():
+    driver_df, pickup_df = roster(30, 1)
+    strict = {'A+': 15, 'A': 5, 'B': 5, 'C': 0}
+    mask = feasibility_mask(driver_df, pickup_df, min_driver_exp=strict)
+    assert np.array_equal(mask, per_pair_mask(driver_df, pickup_df, strict))
+    assert feasibility_mask(driver_df, pickup_df, min_driver_exp=strict) is mask
+    assert not np.array_equal(mask, feasibility_mask(driver_df, pickup_df))
+
+
+def test_rules_compile_once_per_roster(monkeypatch):
+    driver_df, pickup_df = roster(25, 2)
+    calls = []
+    rule_codes = constraints._rule_codes
+    monkeypatch.setattr(constraints, '_rule_codes', lambda *args: calls.append(1) or rule_codes(*args))
+    lenient = {'A+': 1, 'A': 0, 'B': 0, 'C': 0}
+    list(feasibility_blocks(driver_df, pickup_df, min_driver_exp=lenient))
+    feasibility_mask(driver_df, pickup_df, min_driver_exp=lenient)
+    feasible_pairs(driver_df, pickup_df, np.arange(5), np.arange(5), min_driver_exp=lenient)
+    assert len(calls) == 1
+
+def test_blank_experience_passes_every_threshold():
+    driver_df = pd.DataFrame({'dname': ['Vidya'] * 3, 'cname': ['Vidya'] * 3, 'dexp': [np.nan, 3.0, 12.0]},
+                             index=['a', 'b', 'c'])
+    pickup_df = pd.DataFrame({'cname': ['Vidya'] * 3, 'category': ['A+', 'A+', 'B']}, index=['a', 'b', 'c'])
+    assert feasibility_mask(driver_df, pickup_df).tolist() == [
+        [True, True, True],
+        [False, False, True],
+        [True, True, True]
+    ]
@@ -0,0 +1,34 @@
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from datasets import DatasetStore
+
+
+def test_round_trip_keeps_types_and_nulls(tmp_path):
+    store = DatasetStore(str(tmp_path))
+    df = pd.DataFrame({
+        'Vehicle Number': ['KA01', 'KA02', None],
+        'Route Number': [1, 2, 3],
+        'Driver pt Latitude': [13.1, np.nan, 13.3]
+    })
+    store.put('abc', df)
+    loaded = store.get('abc')
+    assert loaded['Vehicle Number'][:2].tolist() == ['KA01', 'KA02']
+    assert loaded['Vehicle Number'].isna().tolist() == [False, False, True]
+    assert loaded['Route Number'].dtype == df['Route Number'].dtype
+    assert np.array_equal(loaded['Driver pt Latitude'], df['Driver pt Latitude'], equal_nan=True)
+
+
+def test_expiry_and_ids(tmp_path):
+    store = DatasetStore(str(tmp_path), ttl=60)
+    store.put('old', pd.DataFrame({'a': [1]}))
+    past = time.time() - 120
+    os.utime(tmp_path / 'old.npz', (past, past))
+    assert not store.exists('old') and store.get('old') is None
+    assert not store.exists('../old')
+    with pytest.raises(ValueError):
+        store.get('../old')
@@ -0,0 +1,126 @@
+import time
+
+import numpy as np
+
+from distance_cache import DistanceCache, NO_ROUTE
+from osrm_service import OSRMService
+
+
+def points(n, seed):
+    return np.random.default_rng(seed).uniform(10, 11, (n, 2))
+
+
+def test_round_trip_keeps_no_route(tmp_path):
+    cache = DistanceCache(str(tmp_path / 'distances.sqlite3'))
+    origins, destinations = points(4, 0), points(5, 1)
+    matrix = np.arange(20, dtype=float).reshape(4, 5)
+    matrix[1, 2] = np.inf
+    matrix[3, 4] = np.nan
+    cache.put_many(origins, destinations, matrix)
+
+    found = cache.get_many(origins, destinations)
+    assert np.isinf(found[1, 2])
+    assert np.isnan(found[3, 4])
+    assert np.array_equal(found[~np.isnan(matrix)], matrix[~np.isnan(matrix)])
+    assert (cache.hits, cache.misses) == (19, 1)
+    # Calibration samples real distances only.
+    assert NO_ROUTE not in cache.sample()[2]
+
+
+def test_expired_entries_are_misses(tmp_path):
+    cache = DistanceCache(str(tmp_path / 'distances.sqlite3'), ttl=60)
+    origins, destinations = points(2, 0), points(2, 1)
+    cache.put_many(origins, destinations, np.ones((2, 2)))
+    cache._connect().execute("UPDATE distances SET created = created - 120")
+    assert np.isnan(cache.get_many(origins, destinations)).all()
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = DistanceCache(str(tmp_path / 'distances.sqlite3'), max_entries=8)
+    first, second, third = points(2, 0), points(2, 1), points(2, 2)
+    destinations = points(2, 3)
+    cache.put_many(first, destinations, np.ones((2, 2)))
+    cache.put_many(second, destinations, np.full((2, 2), 2.0))
+    conn = cache._connect()
+    conn.execute("UPDATE distances SET accessed = 100")
+    conn.execute("UPDATE distances SET accessed = 200 WHERE km = 1")
+
+    cache.put_many(third, destinations, np.full((2, 2), 3.0))
+    assert cache.stats()['entries'] == 8
+    assert not np.isnan(cache.get_many(first, destinations)).any()
+    assert np.isnan(cache.get_many(second, destinations)).all()
+
+
+def test_hits_refresh_last_access(tmp_path):
+    cache = DistanceCache(str(tmp_path / 'distances.sqlite3'))
+    origins, destinations = points(2, 0), points(2, 1)
+    cache.put_many(origins, destinations, np.ones((2, 2)))
+    conn = cache._connect()
+    conn.execute("UPDATE distances SET accessed = 0")
+    cache.get_many(origins[:1], destinations)
+    assert sorted(row[0] > 0 for row in conn.execute("SELECT accessed FROM distances")) == [False, False, True, True]
+
+
+def test_hits_are_touched_once_per_interval(tmp_path):
+    cache = DistanceCache(str(tmp_path / 'distances.sqlite3'), touch_after=60)
+    origins, destinations = points(3, 0), points(3, 1)
+    cache.put_many(origins, destinations, np.ones((3, 3)))
+    conn = cache._connect()
+    conn.execute("UPDATE distances SET accessed = ?", (time.time() - 120,))
+    conn.execute("UPDATE distances SET accessed = ? WHERE olat = ?", (time.time() - 30, int(round(origins[0, 0] * 1e5))))
+    before = dict(conn.execute("SELECT olat, accessed FROM distances").fetchall())
+
+    cache.get_many(origins, destinations)
+    after = dict(conn.execute("SELECT olat, accessed FROM distances").fetchall())
+    touched = {key for key in before if after[key] != before[key]}
+    assert touched == set(before) - {int(round(origins[0, 0] * 1e5))}
+
+
+class TableSession:
+    def __init__(self, body):
+        self.body = body
+
+    def get(self, url, params=None, timeout=None):
+        body = self.body
+
+        class Response:
+            status_code = 200
+
+            def json(self):
+                return body
+        return Response()
+
+
+def test_refused_table_is_not_cached(service_config, tmp_path):
+    service_config.update({'DISTANCE_CACHE_PATH': str(tmp_path / 'distances.sqlite3'), 'OSRM_RETRIES': 0})
+    service = OSRMService(service_config)
+    sources, destinations = points(2, 0), points(2, 1)
+
+    service.session = TableSession({'code': 'TooBig'})
+    [matrix] = service.fetch_blocks([(sources, destinations)])
+    assert np.isinf(matrix).all()
+    assert service.cache.stats()['entries'] == 0
+
+    service.session = TableSession({'code': 'Ok', 'distances': [[1000, None], [None, 2000]]})
+    [matrix] = service.fetch_blocks([(sources, destinations)])
+    assert service.cache.stats()['entries'] == 4
+    assert np.array_equal(service.cache.get_many(sources, destinations), matrix)
+
+
+def test_refetch_keeps_created_time_of_hits(service_config, tmp_path):
+    service_config.update({'DISTANCE_CACHE_PATH': str(tmp_path / 'distances.sqlite3'), 'DISTANCE_CACHE_TTL': 60})
+    service = OSRMService(service_config)
+    sources, destinations = points(2, 0), points(2, 1)
+    service.session = TableSession({'code': 'Ok', 'distances': [[1000, 2000], [3000, 4000]]})
+    service.fetch_blocks([(sources, destinations)])
+
+    # Lose the diagonal, so the refetched tile also spans the two hits.
+    conn = service.cache._connect()
+    conn.execute("DELETE FROM distances WHERE km IN (1.0, 4.0)")
+    conn.execute("UPDATE distances SET created = created - 40")
+    service.fetch_blocks([(sources, destinations)])
+    conn.execute("UPDATE distances SET created = created - 40")
+
+    found = service.cache.get_many(sources, destinations)
+    assert np.isnan(found[0, 1]) and np.isnan(found[1, 0])
+    assert found[0, 0] == 1 and found[1, 1] == 4
@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pytest
+
+import jobs
+from jobs import JobCancelled, JobStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return JobStore(str(tmp_path / 'jobs.sqlite3'))
+
+
+def test_job_lifecycle(store):
+    store.create('a')
+    assert store.get('a')['status'] == jobs.QUEUED
+    store.start('a')
+    store.progress('a', 40.7, 'Working...')
+    job = store.get('a')
+    assert (job['status'], job['percent'], job['message']) == (jobs.RUNNING, 40, 'Working...')
+
+    store.finish('a', {'total': np.float64(1.5), 'rows': np.arange(3)})
+    assert store.get('a')['status'] == jobs.DONE
+    assert json.loads(store.result('a')) == {'total': 1.5, 'rows': [0, 1, 2]}
+
+    store.create('b')
+    store.start('b')
+    store.fail('b', 'boom')
+    assert (store.get('b')['status'], store.get('b')['error']) == (jobs.FAILED, 'boom')
+    assert store.get('missing') is None
+
+
+def test_cancel(store):
+    store.create('queued')
+    assert store.cancel('queued')['status'] == jobs.CANCELLED
+
+    store.create('running')
+    store.start('running')
+    assert store.cancel('running')['status'] == jobs.RUNNING
+    with pytest.raises(JobCancelled):
+        store.progress('running', 50, 'Working...')
+    store.mark_cancelled('running')
+    assert store.get('running')['status'] == jobs.CANCELLED
+    # Finished jobs stay as they are.
+    assert store.cancel('running')['status'] == jobs.CANCELLED
+
+
+def test_old_jobs_are_purged(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'), ttl=60)
+    store.create('old')
+    store._connect().execute("UPDATE jobs SET updated = updated - 120")
+    store.create('new')
+    assert store.get('old') is None and store.get('new') is not None
+
+
+def test_finished_jobs_drop_their_progress_state(tmp_path):
+    store = JobStore(str(tmp_path / 'jobs.sqlite3'), min_interval=0)
+    for job_id in ('done', 'failed', 'cancelled'):
+        store.create(job_id)
+        store.start(job_id)
+        store.progress(job_id, 10, 'Working...', stage='matrix')
+    assert set(store._last_progress) == {'done', 'failed', 'cancelled'}
+
+    store.finish('done', {})
+    store.fail('failed', 'boom')
+    store.cancel('cancelled')
+    store.mark_cancelled('cancelled')
+    assert store._last_progress == {}
+    assert [store.get(job_id)['status'] for job_id in ('done', 'failed', 'cancelled')] == ['done', 'failed', 'cancelled']
+
+
+def test_stale_jobs_fail_on_start_up(tmp_path):
+    path = str(tmp_path / 'jobs.sqlite3')
+    store = JobStore(path)
+    for job_id in ('crashed', 'lost', 'busy', 'done'):
+        store.create(job_id)
+    store.start('crashed')
+    store.start('busy')
+    store.finish('done', {})
+    store._connect().execute("UPDATE jobs SET updated = updated - 120 WHERE id != 'busy'")
+
+    JobStore(path, stale_after=60)
+    statuses = {job_id: store.get(job_id)['status'] for job_id in ('crashed', 'lost', 'busy', 'done')}
+    assert statuses == {'crashed': jobs.FAILED, 'lost': jobs.FAILED, 'busy': jobs.RUNNING, 'done': jobs.DONE}
+    assert 'stopped' in store.get('crashed')['error']
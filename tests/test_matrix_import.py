@@ -0,0 +1,22 @@
+import io
+
+import numpy as np
+import pytest
+
+from matrix_import import read_matrix
+
+
+def long_csv(rows):
+    return io.StringIO('from_bus,to_bus,km\n' + ''.join(f'{a},{b},{km}\n' for a, b, km in rows))
+
+
+def test_long_format_fills_pairs_in_any_order():
+    matrix = read_matrix(long_csv([('B', 'A', 2.5), ('A', 'B', 1), ('A', 'A', '')]), 'csv', ['A', 'B'], chunk_rows=1)
+    assert matrix[0, 1] == 1 and matrix[1, 0] == 2.5
+    assert np.isnan(matrix[0, 0]) and np.isnan(matrix[1, 1])
+
+
+@pytest.mark.parametrize('chunk_rows', [1, 10])
+def test_repeated_pair_is_rejected_within_and_across_chunks(chunk_rows):
+    with pytest.raises(ValueError, match='more than once'):
+        read_matrix(long_csv([('A', 'B', 1), ('B', 'A', 2), ('A', 'B', 3)]), 'csv', ['A', 'B'], chunk_rows=chunk_rows)
@@ -0,0 +1,144 @@
+import time
+
+import pytest
+import requests
+
+import resilience
+from osrm_service import OSRMService
+from resilience import CircuitBreaker, CircuitOpen, Deadline, DeadlineExceeded, OSRMUnavailable, backoff_delay
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_breaker_state_machine(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, 'monotonic', clock)
+    breaker = CircuitBreaker(threshold=3, reset_after=30)
+
+    assert [breaker.failure() for _ in range(2)] == [False, False]
+    breaker.success()
+    assert breaker.state == 'closed'
+    assert [breaker.failure() for _ in range(3)] == [False, False, True]
+    assert breaker.state == 'open' and breaker.trips == 1
+    with pytest.raises(CircuitOpen):
+        breaker.before()
+
+    # One trial after reset_after; everyone else still fails fast.
+    clock.now += 30
+    breaker.before()
+    assert breaker.state == 'half-open'
+    with pytest.raises(CircuitOpen):
+        breaker.before()
+    # A failed trial opens it again for another reset_after, without a new trip.
+    assert breaker.failure() is False
+    assert breaker.state == 'open' and breaker.trips == 1
+    clock.now += 29
+    with pytest.raises(CircuitOpen):
+        breaker.before()
+    clock.now += 1
+    breaker.before()
+    breaker.success()
+    assert breaker.state == 'closed'
+    breaker.before()
+
+
+def test_deadline_and_backoff(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(resilience.time, 'monotonic', clock)
+    deadline = Deadline(10)
+    assert deadline.timeout(5, 30) == (5, 10)
+    clock.now += 10
+    with pytest.raises(DeadlineExceeded):
+        deadline.check()
+    assert Deadline(None).timeout(5, 30) == (5, 30)
+    assert all(0 <= backoff_delay(attempt, 0.5, 8) <= min(8, 0.5 * 2 ** attempt) for attempt in range(10))
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200):
+        self.body = body
+        self.status_code = status_code
+
+    def json(self):
+        return self.body
+
+
+class FakeSession:
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def get(self, url, params=None, timeout=None):
+        self.calls += 1
+        answer = self.answers.pop(0) if len(self.answers) > 1 else self.answers[0]
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+
+def make_service(config, *answers, retries=2, threshold=5):
+    # Every test gets a breaker of its own: breakers are shared per server.
+    config.update({'OSRM_SERVER': f'http://breaker-test-{time.monotonic_ns()}', 'OSRM_RETRIES': retries,
+                   'OSRM_BREAKER_THRESHOLD': threshold, 'OSRM_BREAKER_RESET': 30})
+    service = OSRMService(config)
+    service.session = FakeSession(*answers)
+    return service
+
+
+def test_transient_errors_are_retried(service_config):
+    service = make_service(service_config, FakeResponse({}, 503), requests.ConnectionError('reset'),
+                           FakeResponse({'code': 'Ok'}))
+    assert service.osrm_get('table', 'http://unused') == {'code': 'Ok'}
+    assert service.session.calls == 3 and service.breaker.state == 'closed'
+
+
+def test_retries_give_out_and_breaker_fails_fast(service_config):
+    service = make_service(service_config, requests.Timeout('slow'), retries=1, threshold=2)
+    with pytest.raises(OSRMUnavailable):
+        service.osrm_get('table', 'http://unused')
+    assert service.session.calls == 2 and service.breaker.state == 'open'
+    with pytest.raises(CircuitOpen):
+        service.osrm_get('table', 'http://unused')
+    assert service.session.calls == 2
+
+
+def open_service(config, *answers):
+    # A service whose breaker is open and due for its half-open trial.
+    config.update({'OSRM_SERVER': f'http://breaker-test-{time.monotonic_ns()}', 'OSRM_RETRIES': 0,
+                   'OSRM_BREAKER_THRESHOLD': 1, 'OSRM_BREAKER_RESET': 0})
+    service = OSRMService(config)
+    service.breaker.failure()
+    service.session = FakeSession(*answers)
+    return service
+
+
+@pytest.mark.parametrize('answer', [
+    requests.TooManyRedirects('redirect loop'),
+    FakeResponse(['not', 'an', 'object']),
+])
+def test_failed_trial_reopens_breaker(service_config, answer):
+    service = open_service(service_config, answer, FakeResponse({'code': 'Ok'}))
+    with pytest.raises(OSRMUnavailable):
+        service.osrm_get('table', 'http://unused')
+    assert service.breaker.state == 'open'
+    # The next trial is let through and closes the breaker.
+    assert service.osrm_get('table', 'http://unused') == {'code': 'Ok'}
+    assert service.breaker.state == 'closed'
+
+
+def test_expired_deadline_leaves_trial_free(service_config):
+    service = open_service(service_config, FakeResponse({'code': 'Ok'}))
+    service.deadline.expires = time.monotonic() - 1
+    with pytest.raises(OSRMUnavailable):
+        service.osrm_get('table', 'http://unused')
+    assert service.session.calls == 0
+    assert service.breaker.state == 'open'
+    service.start_run()
+    assert service.osrm_get('table', 'http://unused') == {'code': 'Ok'}
+    assert service.breaker.state == 'closed'